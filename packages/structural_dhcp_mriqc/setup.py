@@ -41,12 +41,14 @@ def main():
                      'structural_dhcp_mriqc-%s.tar.gz' % __version__,
         entry_points={'console_scripts': ['structural_dhcp_mriqc=structural_dhcp_mriqc.utils.mriqc_run:main',
                                           'structural_dhcp_mriqc_plot=structural_dhcp_mriqc.utils.mriqc_plot:main',
+                                          'structural_dhcp_measures=structural_dhcp_mriqc.utils.dhcp_measures:main',
                                           'abide2bids=structural_dhcp_mriqc.utils.abide2bids:main',
                                           'fs2gif=structural_dhcp_mriqc.utils.fs2gif:main',
                                           'dfcheck=structural_dhcp_mriqc.utils.dfcheck:main']},
         packages=['structural_dhcp_mriqc',
                   'structural_dhcp_mriqc.data',
                   'structural_dhcp_mriqc.interfaces',
+                  'structural_dhcp_mriqc.measures',
                   'structural_dhcp_mriqc.qc',
                   'structural_dhcp_mriqc.reports',
                   'structural_dhcp_mriqc.utils',
@@ -14,6 +14,8 @@ import numpy as np
 import nibabel as nb
 import scipy.ndimage as nd
 
+from ..qc.masks import mask_bbox
+from ..utils.images import load_image
 from nipype.interfaces.base import TraitedSpec, BaseInterface, BaseInterfaceInputSpec, File
 
 
@@ -39,14 +41,10 @@ class ArtifactMask(BaseInterface):
         super(ArtifactMask, self).__init__(**inputs)
 
     def _run_interface(self, runtime):
-        imnii = nb.load(self.inputs.in_file)
-        imdata = np.nan_to_num(imnii.get_data())
-        # Cast to float32
-        imdata = imdata.astype(np.float32)
-        # Remove negative values
-        imdata[imdata < 0] = 0
-
-        airdata = nb.load(self.inputs.air_msk).get_data()
+        imnii, imdata = load_image(self.inputs.in_file, nonnegative=True, cache=False)
+
+        # The air mask is modified below, it is read into memory
+        airdata = np.array(nb.load(self.inputs.air_msk).dataobj)
         # Run the artifact detection
         qi1_img = artifact_mask(imdata, airdata)
 
@@ -58,7 +56,7 @@ class ArtifactMask(BaseInterface):
         self._results['out_art_msk'] = op.abspath('%s_artifacts%s' % (fname, ext))
         self._results['out_air_msk'] = op.abspath('%s_noart-air%s' % (fname, ext))
 
-        hdr = imnii.get_header().copy()
+        hdr = imnii.header.copy()
         hdr.set_data_dtype(np.uint8)
         nb.Nifti1Image(qi1_img, imnii.get_affine(), hdr).to_filename(
             self._results['out_art_msk'])
@@ -87,16 +85,34 @@ def artifact_mask(imdata, airdata):
 
     # Apply this threshold to the background voxels to identify voxels
     # contributing artifacts.
-    qi1_img = np.zeros_like(bg_img)
-    qi1_img[bg_img > bg_threshold] = bg_img[bg_img > bg_threshold]
+    qi1_mask = bg_img > bg_threshold
 
     # Create a structural element to be used in an opening operation.
     struc = nd.generate_binary_structure(3, 2)
 
-    # Perform an a grayscale erosion operation.
-    qi1_img = nd.grey_erosion(qi1_img, structure=struc).astype(np.float32)
-    # Binarize and binary dilation
-    qi1_img[qi1_img > 0.] = 1
-    qi1_img[qi1_img < 1.] = 0
-    qi1_img = nd.binary_dilation(qi1_img, structure=struc).astype(np.uint8)
-    return qi1_img
+    # The morphological operations are computed within the bounding box of
+    # the voxels above the threshold, padded by the size of the structure:
+    # the eroded voxels are inside that box, and the dilation extends them by
+    # one voxel at most
+    out_img = np.zeros(qi1_mask.shape, dtype=np.uint8)
+    bbox = mask_bbox(qi1_mask, pad=1)
+    if bbox is None:
+        return out_img
+    qi1_mask = qi1_mask[bbox]
+
+    # Perform an erosion operation. The grayscale erosion with the (non-flat)
+    # structure is positive where the values are above the structure (1 in the
+    # 18-neighbourhood, 0 in the corners of the 3x3x3 footprint): binarized, it
+    # is the intersection of two binary erosions (the reflected border of the
+    # grayscale erosion is a border value of 1)
+    qi1_mask = nd.binary_erosion(qi1_mask & (bg_img[bbox] > 1.), structure=struc,
+                                 border_value=1) & \
+        nd.binary_erosion(qi1_mask, structure=np.ones((3, 3, 3), dtype=np.bool_),
+                          border_value=1)
+
+    # Binary dilation, within the bounding box of the eroded voxels (the
+    # artifacts are a small part of the background)
+    eroded_bbox = mask_bbox(qi1_mask, pad=1)
+    if eroded_bbox is not None:
+        out_img[bbox][eroded_bbox] = nd.binary_dilation(qi1_mask[eroded_bbox], structure=struc)
+    return out_img
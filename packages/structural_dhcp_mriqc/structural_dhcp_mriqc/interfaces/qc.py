@@ -11,12 +11,12 @@
 """ Nipype interfaces to quality control measures """
 
 import numpy as np
-import nibabel as nb
-from ..qc.anatomical import (snr, cnr, fber, efc, art_qi1, art_qi2,
-                             volume_fraction, rpve, summary_stats, cjv)
+from ..qc.anatomical import snr, fber, efc, summary_stats
+from ..qc.structural import structural_qc, flatten_dict as _flatten_dict
 from ..qc.functional import (gsr, dvars, fd_jenkinson, gcor)
+from ..utils.images import load_image, load_data
 from nipype.interfaces.base import (BaseInterface, traits, TraitedSpec, File,
-                                    InputMultiPath, BaseInterfaceInputSpec)
+                                    InputMultiPath, BaseInterfaceInputSpec, isdefined)
 
 from nipype import logging
 IFLOGGER = logging.getLogger('interface')
@@ -27,13 +27,14 @@ class StructuralQCInputSpec(BaseInterfaceInputSpec):
     in_noinu = File(exists=True, mandatory=True, desc='image after INU correction')
     in_segm = File(exists=True, mandatory=True, desc='segmentation file from FSL FAST')
     in_bias = File(exists=True, mandatory=True, desc='bias file')
-    # AM
-    # air_msk = File(exists=True, mandatory=True, desc='air mask')
-    # artifact_msk = File(exists=True, mandatory=True, desc='air mask')
+    air_msk = File(exists=True, desc='air mask, without artifacts (FBER, qi1 and qi2)')
+    artifact_msk = File(exists=True, desc='artifacts mask (qi1 and qi2)')
     
     in_pvms = InputMultiPath(File(exists=True), mandatory=True,
                              desc='partial volume maps from FSL FAST')
     in_tpms = InputMultiPath(File(), desc='tissue probability maps from FSL FAST')
+    efc_slab = traits.Int(0, usedefault=True,
+                          desc='compute the EFC over slabs of this number of slices (0: whole volume)')
 
 
 class StructuralQCOutputSpec(TraitedSpec):
@@ -69,97 +70,14 @@ class StructuralQC(BaseInterface):
     def _list_outputs(self):
         return self._results
 
-    def _run_interface(self, runtime):  # pylint: disable=R0914
-        imnii = nb.load(self.inputs.in_file)
-        imdata = np.nan_to_num(imnii.get_data())
-        erode = np.all(np.array(imnii.get_header().get_zooms()[:3],
-                                dtype=np.float32) < 1.2)
-
-        # Cast to float32
-        imdata = imdata.astype(np.float32)
-
-        # Remove negative values
-        imdata[imdata < 0] = 0
-
-        # Load image corrected for INU
-        inudata = np.nan_to_num(nb.load(self.inputs.in_noinu).get_data())
-        inudata[inudata < 0] = 0
-
-        segnii = nb.load(self.inputs.in_segm)
-        segdata = segnii.get_data().astype(np.uint8)
-
-        # AM
-        # airdata = nb.load(self.inputs.air_msk).get_data().astype(np.uint8)
-        # artdata = nb.load(self.inputs.artifact_msk).get_data().astype(np.uint8)
-
-        # SNR
-        snrvals = []
-        self._results['snr'] = {}
-        for tlabel in ['csf', 'wm', 'gm']:
-            # AM
-            # snrvals.append(snr(inudata, segdata, airdata, fglabel=tlabel,
-            #                    erode=erode))
-            snrvals.append(snr(inudata, segdata, fglabel=tlabel, erode=erode))
-            self._results['snr'][tlabel] = snrvals[-1]
-        self._results['snr']['total'] = float(np.mean(snrvals))
-
-        # CNR
-        self._results['cnr'] = cnr(inudata, segdata)
-
-        # AM
-        # FBER
-        # self._results['fber'] = fber(inudata, segdata, airdata)
-
-        # EFC
-        self._results['efc'] = efc(inudata)
-
-        # Artifacts
-        # AM
-        # self._results['qi1'] = art_qi1(airdata, artdata)
-        # self._results['qi2'] = art_qi2(imdata, airdata, artdata)
-
-        # CJV
-        self._results['cjv'] = cjv(inudata, seg=segdata)
-
-        pvmdata = []
-        for fname in self.inputs.in_pvms:
-            pvmdata.append(nb.load(fname).get_data().astype(np.float32))
-
-        # ICVs
-        self._results['icvs'] = volume_fraction(pvmdata)
-
-        # RPVE
-        self._results['rpve'] = rpve(pvmdata, segdata)
-
-        # Summary stats
-        mean, stdv, p95, p05 = summary_stats(imdata, pvmdata)
-        self._results['summary'] = {'mean': mean, 'stdv': stdv,
-                                    'p95': p95, 'p05': p05}
-
-        # Image specs
-        self._results['size'] = {'x': int(imdata.shape[0]),
-                                 'y': int(imdata.shape[1]),
-                                 'z': int(imdata.shape[2])}
-        self._results['spacing'] = {
-            i: float(v) for i, v in zip(
-                ['x', 'y', 'z'], imnii.get_header().get_zooms()[:3])}
-
-        try:
-            self._results['size']['t'] = int(imdata.shape[3])
-        except IndexError:
-            pass
-
-        try:
-            self._results['spacing']['tr'] = float(imnii.get_header().get_zooms()[3])
-        except IndexError:
-            pass
-
-        # Bias
-        bias = nb.load(self.inputs.in_bias).get_data()[segdata > 0]
-        self._results['inu'] = {
-            'range': float(np.abs(np.percentile(bias, 95.) - np.percentile(bias, 5.))),
-            'med': float(np.median(bias))}  #pylint: disable=E1101
-
+    def _run_interface(self, runtime):
+        self._results = structural_qc(
+            self.inputs.in_file, self.inputs.in_segm, self.inputs.in_bias,
+            self.inputs.in_pvms, in_noinu=self.inputs.in_noinu,
+            efc_slab=self.inputs.efc_slab,
+            air_msk=self.inputs.air_msk if isdefined(self.inputs.air_msk) else None,
+            artifact_msk=(self.inputs.artifact_msk if isdefined(self.inputs.artifact_msk)
+                          else None))
 
         # Flatten the dictionary
         self._results['out_qc'] = _flatten_dict(self._results)
@@ -208,23 +126,14 @@ class FunctionalQC(BaseInterface):
 
     def _run_interface(self, runtime):
         # Get the mean EPI data and get it ready
-        epinii = nb.load(self.inputs.in_epi)
-        epidata = np.nan_to_num(epinii.get_data())
-        epidata = epidata.astype(np.float32)
-        epidata[epidata < 0] = 0
+        epidata = load_data(self.inputs.in_epi, nonnegative=True, cache=False)
 
-        # Get EPI data (with mc done) and get it ready
-        hmcnii = nb.load(self.inputs.in_hmc)
-        hmcdata = np.nan_to_num(hmcnii.get_data())
-        hmcdata = hmcdata.astype(np.float32)
-        hmcdata[hmcdata < 0] = 0
+        # Get EPI data (with mc done) and get it ready, memory-mapped from the image cache
+        # and read by chunks of slices (DVARS, GCOR)
+        hmcnii, hmcdata = load_image(self.inputs.in_hmc, nonnegative=True)
 
         # Get EPI data (with mc done) and get it ready
-        msknii = nb.load(self.inputs.in_mask)
-        mskdata = np.nan_to_num(msknii.get_data())
-        mskdata = mskdata.astype(np.uint8)
-        mskdata[mskdata < 0] = 0
-        mskdata[mskdata > 0] = 1
+        mskdata = (load_data(self.inputs.in_mask, dtype=np.uint8, cache=False) > 0).astype(np.uint8)
 
         # SNR
         self._results['snr'] = float(snr(epidata, mskdata, fglabel=1))
@@ -253,7 +162,7 @@ class FunctionalQC(BaseInterface):
         self._results['dvars'] = float(np.mean(dvars(hmcdata, mskdata), axis=0)[0])
 
         # tSNR
-        tsnr_data = nb.load(self.inputs.in_tsnr).get_data()
+        tsnr_data = load_data(self.inputs.in_tsnr, cache=False)
         self._results['m_tsnr'] = float(np.median(tsnr_data[mskdata > 0]))
 
         # GCOR
@@ -280,21 +189,6 @@ class FunctionalQC(BaseInterface):
         self._results['out_qc'] = _flatten_dict(self._results)
         return runtime
 
-def _flatten_dict(indict):
-    out_qc = {}
-    for k, value in list(indict.items()):
-        if not isinstance(value, dict):
-            out_qc[k] = value
-        else:
-            for subk, subval in list(value.items()):
-                if not isinstance(subval, dict):
-                    out_qc['%s_%s' % (k, subk)] = subval
-                else:
-                    for ssubk, ssubval in list(subval.items()):
-                        out_qc['%s_%s_%s' % (k, subk, ssubk)] = ssubval
-    return out_qc
-
-
 class FramewiseDisplacementInputSpec(BaseInterfaceInputSpec):
     in_file = File(exists=True, mandatory=True,
                    desc='input file generated with FSL 3dvolreg')
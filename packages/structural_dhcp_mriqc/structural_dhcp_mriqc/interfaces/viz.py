@@ -17,6 +17,7 @@ from nipype.interfaces.base import (BaseInterface, traits, TraitedSpec, File,
 
 from .viz_utils import (plot_mosaic, plot_fd)
 from ..reports import workflow_report
+from ..reports.rendering import save_figure
 
 
 class PlotMosaicInputSpec(BaseInterfaceInputSpec):
@@ -30,7 +31,8 @@ class PlotMosaicInputSpec(BaseInterfaceInputSpec):
     figsize = traits.Tuple(
         (11.69, 8.27), traits.Float, traits.Float, usedefault=True,
         desc='Figure size')
-    dpi = traits.Int(300, usedefault=True, desc='Desired DPI of figure')
+    dpi = traits.Int(desc='DPI of the rasterised parts of the figure (default: the report '
+                          'DPI, see reports.rendering)')
     out_file = File('mosaic.pdf', usedefault=True, desc='output file name')
 
 
@@ -70,7 +72,8 @@ class PlotMosaic(BaseInterface):
                 title=title,
                 overlay_mask=mask)
 
-        fig.savefig(self.inputs.out_file, dpi=self.inputs.dpi)
+        save_figure(fig, self.inputs.out_file,
+                    dpi=self.inputs.dpi if isdefined(self.inputs.dpi) else None)
 
         return runtime
 
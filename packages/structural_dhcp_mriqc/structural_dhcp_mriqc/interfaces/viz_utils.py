@@ -11,9 +11,11 @@
 """ Visualization utilities """
 
 import math
+import time
+import hashlib
+import pickle
 import os.path as op
 import numpy as np
-import nibabel as nb
 import pandas as pd
 
 import matplotlib
@@ -23,9 +25,41 @@ from matplotlib.gridspec import GridSpec
 from matplotlib.backends.backend_pdf import FigureCanvasPdf as FigureCanvas
 import seaborn as sns
 
+from ..utils.images import load_data
 
-def plot_measures(df, measures, ncols=4, title='Group level report',
-                  subject=None, figsize=(8.27, 11.69)):
+
+# Pickled figures with the group distributions, shared by the individual reports
+_GROUP_FIGURES = {}
+
+
+def _group_key(df, columns, *args):
+    """ A key identifying the group data (and plot options) of a figure """
+    sha = hashlib.sha1()
+    sha.update(pd.util.hash_pandas_object(df[list(columns)], index=False).values.tobytes())
+    sha.update(repr(args).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _cached_figure(key, plot_fn, *args, **kwargs):
+    """
+    Returns a copy of the figure drawn by ``plot_fn``. The figure is drawn
+    (e.g. the KDEs of the violin plots are computed) only the first time, and
+    kept pickled in the cache, so that the individual reports only overlay
+    their markers on a copy of the group distributions.
+    """
+    if key not in _GROUP_FIGURES:
+        fig = plot_fn(*args, **kwargs)
+        _GROUP_FIGURES[key] = pickle.dumps(fig, pickle.HIGHEST_PROTOCOL)
+        plt.close(fig)
+    return pickle.loads(_GROUP_FIGURES[key])
+
+
+def clear_group_cache():
+    """ Clears the cached group figures """
+    _GROUP_FIGURES.clear()
+
+
+def _plot_measures_group(df, measures, ncols=4, figsize=(8.27, 11.69)):
     import matplotlib.gridspec as gridspec
     nmeasures = len(measures)
     nrows = nmeasures // ncols
@@ -35,19 +69,29 @@ def plot_measures(df, measures, ncols=4, title='Group level report',
     fig = plt.figure(figsize=figsize)
     gsp = gridspec.GridSpec(nrows, ncols)
 
-    axes = []
-
     for i, mname in enumerate(measures):
-        axes.append(plt.subplot(gsp[i]))
-        axes[-1].set_xlabel(mname)
+        ax = plt.subplot(gsp[i])
+        ax.set_xlabel(mname)
         sns.distplot(
-            df[[mname]], ax=axes[-1], color="b", rug=True,  norm_hist=True)
+            df[[mname]], ax=ax, color="b", rug=True,  norm_hist=True)
 
         # labels = np.array(axes[-1].get_xticklabels())
         # labels[2:-2] = ''
-        axes[-1].set_xticklabels([])
+        ax.set_xticklabels([])
         plt.ticklabel_format(style='sci', axis='y', scilimits=(-1, 1))
+    return fig
+
+
+def plot_measures(df, measures, ncols=4, title='Group level report',
+                  subject=None, figsize=(8.27, 11.69), cache=True):
+    if cache:
+        fig = _cached_figure(_group_key(df, measures, ncols, figsize),
+                             _plot_measures_group, df, measures, ncols=ncols, figsize=figsize)
+    else:
+        fig = _plot_measures_group(df, measures, ncols=ncols, figsize=figsize)
+    axes = fig.axes
 
+    for i, mname in enumerate(measures):
         if subject is not None:
             subid = subject
             try:
@@ -65,16 +109,15 @@ def plot_measures(df, measures, ncols=4, title='Group level report',
                 for sc in scans:
                     scndf = subdf.loc[sesdf['run_id'] == sc]
                     plot_vline(
-                        scndf.iloc[0][mname], '%s_%s' % (ss, sc), axes[-1])
+                        scndf.iloc[0][mname], '%s_%s' % (ss, sc), axes[i])
 
     fig.suptitle(title)
-    plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
-    plt.subplots_adjust(top=0.85)
+    fig.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
+    fig.subplots_adjust(top=0.85)
     return fig
 
 
-def plot_all(df, groups, subject=None, session=None, figsize=(11.69, 5),
-             strip_nsubj=10, title='Summary report'):
+def _plot_all_group(df, groups, subid=None, figsize=(11.69, 5), strip_nsubj=10):
     import matplotlib.gridspec as gridspec
     # colnames = [v for gnames in groups for v in gnames]
     lengs = [len(el) for el in groups]
@@ -83,37 +126,58 @@ def plot_all(df, groups, subject=None, session=None, figsize=(11.69, 5),
     fig = plt.figure(figsize=figsize)
     gsp = gridspec.GridSpec(1, len(groups), width_ratios=lengs)
 
-    subjects = sorted(pd.unique(df.subject_id.ravel()))
-    nsubj = len(subjects)
-    subid = subject
-    if subid is not None:
-        try:
-            subid = int(subid)
-        except ValueError:
-            pass
-
-    axes = []
+    nsubj = len(pd.unique(df.subject_id.ravel()))
     for i, snames in enumerate(groups):
         if len(snames) == 0:
             continue
 
-        axes.append(plt.subplot(gsp[i]))
+        ax = plt.subplot(gsp[i])
 
         if nsubj > strip_nsubj:
             pal = sns.color_palette("hls", len(snames))
-            sns.violinplot(data=df[snames], ax=axes[-1], linewidth=.8, palette=pal)
+            sns.violinplot(data=df[snames], ax=ax, linewidth=.8, palette=pal)
         else:
             stdf = df.copy()
             if subid is not None:
                 stdf = stdf.loc[stdf['subject_id'] != subid]
             if len(stdf) > 0:
-                sns.stripplot(data=stdf[snames], ax=axes[-1], jitter=0.25)
+                sns.stripplot(data=stdf[snames], ax=ax, jitter=0.25)
 
-        axes[-1].set_xticklabels(
-            [el.get_text() for el in axes[-1].get_xticklabels()],
+        ax.set_xticklabels(
+            [el.get_text() for el in ax.get_xticklabels()],
             rotation='vertical')
         plt.ticklabel_format(style='sci', axis='y', scilimits=(-1, 1))
         # df[snames].plot(kind='box', ax=axes[-1])
+    return fig
+
+
+def plot_all(df, groups, subject=None, session=None, figsize=(11.69, 5),
+             strip_nsubj=10, title='Summary report', cache=True):
+    subjects = sorted(pd.unique(df.subject_id.ravel()))
+    nsubj = len(subjects)
+    subid = subject
+    if subid is not None:
+        try:
+            subid = int(subid)
+        except ValueError:
+            pass
+
+    # The violin plots of the group do not depend on the subject: they are
+    # drawn once and reused. The strip plots (small groups) exclude the subject.
+    if cache and nsubj > strip_nsubj:
+        columns = [v for gnames in groups for v in gnames] + ['subject_id']
+        fig = _cached_figure(_group_key(df, columns, groups, figsize),
+                             _plot_all_group, df, groups, figsize=figsize,
+                             strip_nsubj=strip_nsubj)
+    else:
+        fig = _plot_all_group(df, groups, subid=subid, figsize=figsize,
+                              strip_nsubj=strip_nsubj)
+
+    axes = iter(fig.axes)
+    for snames in groups:
+        if len(snames) == 0:
+            continue
+        ax = next(axes)
 
         # If we know the subject, place a star for each scan
         if subject is not None:
@@ -139,78 +203,102 @@ def plot_all(df, groups, subject=None, session=None, figsize=(11.69, 5),
                 if nstars > 1:
                     pos = np.linspace(j-0.3, j+0.3, num=nstars)
 
-                axes[-1].plot(
+                ax.plot(
                     pos, vals, ms=9, mew=.8, linestyle='None',
                     color='w', marker='*', markeredgecolor='k',
                     zorder=10)
 
     fig.suptitle(title)
-    plt.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
-    plt.subplots_adjust(top=0.85)
+    fig.tight_layout(pad=0.4, w_pad=0.5, h_pad=1.0)
+    fig.subplots_adjust(top=0.85)
     return fig
 
 
+def mosaic_canvas(data, rows, columns, fill=np.nan, gap=0):
+    """
+    Tiles the axial slices of a volume into one 2D image: row-major from the
+    top left, each slice shown from above (left-right flipped), with ``gap``
+    pixels of ``fill`` between the tiles. The canvas can be drawn with a
+    single ``imshow`` (``origin='upper'``) or written straight to an image
+    file (e.g. with :func:`matplotlib.pyplot.imsave`).
+
+    :return: the canvas and the (row, column) offsets of the tiles
+
+    """
+    height, width = data.shape[1], data.shape[0]
+    canvas = np.full((rows * (height + gap) - gap, columns * (width + gap) - gap),
+                     fill, dtype=np.result_type(data.dtype, np.float32))
+    offsets = []
+    for image in range(data.shape[2]):
+        top = (image // columns) * (height + gap)
+        left = (image % columns) * (width + gap)
+        # np.fliplr(slice.T) drawn with origin='lower'
+        canvas[top:top + height, left:left + width] = data[::-1, ::-1, image].T
+        offsets.append((top, left))
+    return canvas, offsets
+
+
 def plot_mosaic(nifti_file, title=None, overlay_mask=None,
                 figsize=(11.7, 8.3)):
     from six import string_types
     from pylab import cm
+    from matplotlib.colors import ListedColormap
 
     if isinstance(nifti_file, string_types):
-        nii = nb.load(nifti_file)
-        mean_data = nii.get_data()
+        mean_data = load_data(nifti_file, fill_nan=False, cache=False)
     else:
         mean_data = nifti_file
 
+    overlay_data = None
+    if overlay_mask:
+        overlay_data = load_data(overlay_mask, cache=False)
+
     z_vals = np.array(range(0, mean_data.shape[2]))
     # Reduce the number of slices shown
     if mean_data.shape[2] > 70:
         rem = 15
-        # Crop inferior and posterior
-        mean_data = mean_data[..., rem:-rem]
-        z_vals = z_vals[rem:-rem]
-        # Discard one every two slices
-        mean_data = mean_data[..., ::2]
-        z_vals = z_vals[::2]
+        # Crop inferior and posterior, discard one every two slices
+        z_vals = z_vals[rem:-rem:2]
+        mean_data = mean_data[..., z_vals]
+        if overlay_data is not None:
+            overlay_data = overlay_data[..., z_vals]
 
     n_images = mean_data.shape[2]
     row, col = _calc_rows_columns(figsize[0] / figsize[1], n_images)
 
-    if overlay_mask:
-        overlay_data = nb.load(overlay_mask).get_data()
+    # The intensity window, computed once for all the slices
+    finite = mean_data[np.logical_not(np.isnan(mean_data))]
+    vmin, vmax = np.percentile(finite, [0.5, 99.5])
+    del finite
+
+    # All the slices are drawn as one image, gaps (NaNs) are transparent
+    gap = max(1, int(round(0.02 * max(mean_data.shape[:2]))))
+    canvas, offsets = mosaic_canvas(mean_data, row, col, gap=gap)
+    height, width = mean_data.shape[1], mean_data.shape[0]
 
     # create figures
     fig = plt.Figure(figsize=figsize)
     FigureCanvas(fig)
 
-    fig.subplots_adjust(top=0.85)
-    for image, z_val in enumerate(z_vals):
-        ax = fig.add_subplot(row, col, image + 1)
-        data_mask = np.logical_not(np.isnan(mean_data))
-        if overlay_mask:
-            ax.set_rasterized(True)
-
-        ax.imshow(np.fliplr(mean_data[:, :, image].T), vmin=np.percentile(
-            mean_data[data_mask], 0.5),
-            vmax=np.percentile(mean_data[data_mask], 99.5),
-            cmap=cm.Greys_r, interpolation='nearest', origin='lower')
-
-        if overlay_mask:
-            cmap = cm.Reds  # @UndefinedVariable
-            cmap._init()
-            alphas = np.linspace(0, 0.75, cmap.N + 3)
-            cmap._lut[:, -1] = alphas
-            ax.imshow(np.fliplr(overlay_data[:, :, image].T), vmin=0, vmax=1,
-                      cmap=cmap, interpolation='nearest', origin='lower')
-
-        ax.annotate(
-            str(z_val), xy=(.95, .015), xycoords='axes fraction',
-            fontsize=10, color='white', horizontalalignment='right',
-            verticalalignment='bottom')
-
-        ax.axis('off')
-
-    fig.subplots_adjust(
-        left=0.05, right=0.95, bottom=0.05, top=0.95, wspace=0.01, hspace=0.1)
+    ax = fig.add_axes([0.05, 0.05, 0.9, 0.9])
+    if overlay_data is not None:
+        ax.set_rasterized(True)
+
+    ax.imshow(canvas, vmin=vmin, vmax=vmax, cmap=cm.Greys_r,
+              interpolation='nearest', origin='upper')
+
+    if overlay_data is not None:
+        reds = cm.Reds(np.arange(cm.Reds.N))
+        reds[:, -1] = np.linspace(0, 0.75, cm.Reds.N + 3)[:cm.Reds.N]
+        ax.imshow(mosaic_canvas(overlay_data, row, col, gap=gap)[0], vmin=0, vmax=1,
+                  cmap=ListedColormap(reds), interpolation='nearest', origin='upper')
+
+    for (top, left), z_val in zip(offsets, z_vals):
+        ax.text(left + .95 * width, top + .985 * height, str(z_val),
+                fontsize=10, color='white', horizontalalignment='right',
+                verticalalignment='bottom')
+
+    ax.axis('off')
 
     if not title:
         _, title = op.split(nifti_file)
@@ -334,10 +422,9 @@ def _get_mean_fd_distribution(fd_files):
 
 
 def _get_values_inside_a_mask(main_file, mask_file):
-    main_nii = nb.load(main_file)
-    main_data = main_nii.get_data()
+    main_data = load_data(main_file, fill_nan=False, cache=False)
     nan_mask = np.logical_not(np.isnan(main_data))
-    mask = nb.load(mask_file).get_data() > 0
+    mask = load_data(mask_file, cache=False) > 0
 
     data = main_data[np.logical_and(nan_mask, mask)]
     return data
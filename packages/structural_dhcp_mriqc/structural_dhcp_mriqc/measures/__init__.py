@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+The measures module computes the volume and surface measurements and the
+image quality measures of the dHCP structural pipeline derivatives, which were
+originally computed by the shell scripts in the ``scripts`` folder.
+
+"""
+from .volume import volume_measures, write_volume_measures
+from .surface import surface_measures, gi_measures, write_surface_measures
+from .image_qc import image_qc_measures, write_image_qc_json
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Cache manifest of the measurements of a session.
+
+The manifest (``<subject_dir>/<subj>-measures-manifest.json``) records, for
+each stage of ``compute-measurements.sh``, the input files (size, mtime and
+SHA-1 of their content), the version of the code computing the stage and
+whether the stage completed. A stage is recomputed only when its inputs or
+the code changed, or when its outputs are missing.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import os.path as op
+import json
+import hashlib
+from collections import OrderedDict
+
+from .. import __version__
+
+# Status of a stage
+CURRENT = 0     # up to date
+# same inputs, but the stage did not complete (or outputs are missing); not 1,
+# the status of a Python error, which must not be taken for unchanged inputs
+INCOMPLETE = 10
+CHANGED = 3     # inputs or code changed (or the stage was never run)
+
+STAGES = ['volume', 'surface']
+
+STAGE_OUTPUTS = {
+    'volume': ['volume', 'volume-tissue-regions', 'rel-volume-tissue-regions',
+               'volume-all-regions', 'rel-volume-all-regions'],
+    'surface': ['thickness', 'thickness-regions', 'sulc', 'sulc-regions',
+                'curvature', 'curvature-regions', 'GI', 'GI-regions', 'surface-area',
+                'surface-area-regions', 'rel-surface-area-regions'],
+}
+
+# Modules computing each stage, their content is part of the code version
+STAGE_MODULES = {
+    'volume': ['volume.py', 'utils.py'],
+    'surface': ['surface.py', 'utils.py'],
+}
+
+HASH_BLOCKSIZE = 1 << 20
+
+
+def manifest_file(subject_dir, subj):
+    """ The manifest of a session """
+    return op.join(subject_dir, '%s-measures-manifest.json' % subj)
+
+
+def stage_inputs(stage, anat_dir, subj, super_structures=None, cortical=None):
+    """ The input files of a stage of a session """
+    if stage == 'volume':
+        inputs = [op.join(anat_dir, '%s_drawem_%s_labels.nii.gz' % (subj, l))
+                  for l in ['all', 'tissue']]
+    elif stage == 'surface':
+        surfdir = op.join(anat_dir, 'Native')
+        inputs = [op.join(anat_dir, '%s_drawem_tissue_labels.nii.gz' % subj)]
+        for hemi in ['left', 'right']:
+            inputs += [op.join(surfdir, '%s_%s_%s.surf.gii' % (subj, hemi, s))
+                       for s in ['white', 'pial']]
+            inputs += [op.join(surfdir, '%s_%s_%s.shape.gii' % (subj, hemi, m))
+                       for m in ['curvature', 'thickness', 'sulc']]
+            inputs.append(op.join(surfdir, '%s_%s_drawem.label.gii' % (subj, hemi)))
+        if cortical is not None:
+            inputs.append(cortical)
+    else:
+        raise RuntimeError('Unknown stage "%s", should be one of %s' % (stage, ', '.join(STAGES)))
+    if super_structures is not None:
+        inputs.append(super_structures)
+    return inputs
+
+
+def stage_outputs(stage, subject_dir, subj):
+    """ The output files of a stage of a session """
+    return [op.join(subject_dir, '%s-%s' % (subj, o)) for o in STAGE_OUTPUTS[stage]]
+
+
+def code_version(stage):
+    """ The package version and the SHA-1 of the modules computing a stage """
+    sha = hashlib.sha1()
+    for module in STAGE_MODULES[stage]:
+        with open(op.join(op.dirname(__file__), module), 'rb') as mfile:
+            sha.update(mfile.read())
+    return '%s-%s' % (__version__, sha.hexdigest()[:12])
+
+
+def file_hash(in_file):
+    """ The SHA-1 of the content of a file """
+    sha = hashlib.sha1()
+    with open(in_file, 'rb') as ifile:
+        for block in iter(lambda: ifile.read(HASH_BLOCKSIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_signature(in_file, previous=None):
+    """
+    The signature (size, mtime, sha1) of a file. The hash of ``previous`` is
+    reused when the size and mtime did not change, so that unchanged files
+    are not read again.
+    """
+    if not op.exists(in_file):
+        return None
+    stat = os.stat(in_file)
+    sig = OrderedDict([('size', stat.st_size), ('mtime', stat.st_mtime)])
+    if previous and previous.get('size') == sig['size'] and \
+            previous.get('mtime') == sig['mtime']:
+        sig['sha1'] = previous['sha1']
+    else:
+        sig['sha1'] = file_hash(in_file)
+    return sig
+
+
+def _same_content(sig, previous):
+    if sig is None or previous is None:
+        return sig is previous
+    return sig['size'] == previous['size'] and sig['sha1'] == previous['sha1']
+
+
+def read_manifest(in_file):
+    """ Reads a manifest, an empty one if it does not exist or is unreadable """
+    try:
+        with open(in_file, 'r') as mfile:
+            manifest = json.load(mfile, object_pairs_hook=OrderedDict)
+    except (IOError, ValueError):
+        manifest = None
+    if not isinstance(manifest, dict) or 'stages' not in manifest:
+        manifest = OrderedDict([('stages', OrderedDict())])
+    return manifest
+
+
+def write_manifest(manifest, out_file):
+    """ Writes a manifest (atomically) """
+    tmp_file = out_file + '.tmp'
+    with open(tmp_file, 'w') as mfile:
+        json.dump(manifest, mfile, indent=2)
+    os.rename(tmp_file, out_file)
+    return out_file
+
+
+def check_stage(in_file, stage, inputs, outputs):
+    """
+    Checks whether a stage is up to date.
+
+    :param str in_file: the manifest
+    :param str stage: the stage
+    :param list inputs: the input files of the stage
+    :param list outputs: the output files of the stage
+    :return: ``CURRENT``, ``INCOMPLETE`` or ``CHANGED``
+
+    """
+    entry = read_manifest(in_file)['stages'].get(stage)
+    if entry is None or entry.get('version') != code_version(stage):
+        return CHANGED
+    recorded = entry.get('inputs', {})
+    if sorted(recorded.keys()) != sorted(inputs):
+        return CHANGED
+    for fname in inputs:
+        if not _same_content(file_signature(fname, recorded[fname]), recorded[fname]):
+            return CHANGED
+    if not entry.get('complete') or not all(op.exists(o) for o in outputs):
+        return INCOMPLETE
+    return CURRENT
+
+
+def update_stage(in_file, stage, inputs, complete=True):
+    """
+    Records the inputs of a stage in the manifest when the stage starts
+    (``complete=False``), and marks it as completed when it completes.
+
+    The inputs are those recorded when the stage started, so that an input
+    modified while the stage ran is seen as changed by the next check.
+    """
+    manifest = read_manifest(in_file)
+    entry = manifest['stages'].get(stage, {})
+    previous = entry.get('inputs', {})
+    if complete and entry.get('version') == code_version(stage) and \
+            sorted(previous.keys()) == sorted(inputs):
+        entry['complete'] = True
+        return write_manifest(manifest, in_file)
+    manifest['stages'][stage] = OrderedDict([
+        ('version', code_version(stage)),
+        ('complete', complete),
+        ('inputs', OrderedDict((f, file_signature(f, previous.get(f))) for f in inputs))])
+    return write_manifest(manifest, in_file)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Gathers the volume/surface measurements of all the sessions of a dataset
+into a single CSV file (``pipeline_all_measures.csv``), with a columnar
+copy (Parquet or Feather) of the same table.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import os.path as op
+import numpy as np
+
+from .utils import read_dataset
+
+# Measurement files of a session, in the order of the columns
+MEASURE_STATS = [
+    'volume', 'volume-tissue-regions', 'rel-volume-tissue-regions',
+    'volume-all-regions', 'rel-volume-all-regions', 'thickness', 'thickness-regions',
+    'sulc', 'sulc-regions', 'curvature', 'curvature-regions', 'GI', 'GI-regions',
+    'surface-area', 'surface-area-regions', 'rel-surface-area-regions']
+
+ID_COLUMNS = ['subject ID', 'session ID', 'age at scan']
+
+COLUMNAR_FORMATS = ['parquet', 'feather']
+
+
+def read_label_names(in_file):
+    """
+    Reads the names of the labels of a ``label_names/*.csv`` file (tab-separated
+    ``<label> <name>`` lines), with the commas removed from the names
+    """
+    names = []
+    with open(in_file, 'r') as lfile:
+        for line in lfile:
+            line = line.strip()
+            if not line:
+                continue
+            fields = line.split('\t')
+            names.append((fields[1] if len(fields) > 1 else fields[0]).replace(',', '').strip())
+    return names
+
+
+def stat_columns(stat, label_dir):
+    """ The column names of a measurement file """
+    if 'tissue-regions' in stat:
+        labels, name = 'tissue_labels.csv', stat.replace('-tissue-regions', '')
+    elif 'all-regions' in stat:
+        labels, name = 'all_labels.csv', stat.replace('-all-regions', '')
+    elif 'regions' in stat:
+        labels, name = 'cortical_labels.csv', stat.replace('-regions', '')
+    else:
+        return [stat]
+    return ['%s - %s' % (name, lname)
+            for lname in read_label_names(op.join(label_dir, labels))]
+
+
+def measures_header(label_dir, stats=None):
+    """
+    The columns of the gathered measurements, read once from the label names.
+
+    :return: the list of (stat, column names) tuples
+
+    """
+    return [(stat, stat_columns(stat, label_dir)) for stat in (stats or MEASURE_STATS)]
+
+
+def read_session_row(session_dir, subj, header):
+    """
+    Reads the measurement files of a session. The values of a missing file,
+    or of a file with a wrong number of values, are left empty.
+
+    :return: a tuple with the list of values (strings) and the list of errors
+
+    """
+    values = []
+    errors = []
+    for stat, columns in header:
+        in_file = op.join(session_dir, '%s-%s' % (subj, stat))
+        try:
+            with open(in_file, 'r') as sfile:
+                fields = sfile.read().split()
+        except IOError:
+            fields = None
+            errors.append('missing %s' % in_file)
+        if fields is not None and len(fields) != len(columns):
+            errors.append('%s has %d values, %d expected' % (in_file, len(fields), len(columns)))
+            fields = None
+        values += fields if fields is not None else [''] * len(columns)
+    return values, errors
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def write_columnar(rows, columns, out_file, fmt='parquet'):
+    """
+    Writes the gathered measurements to a columnar file, with string identifiers
+    and float measurements (missing values as NaN).
+    """
+    import pandas as pd
+    ids = list(zip(*[r[:len(ID_COLUMNS)] for r in rows])) or [[]] * len(ID_COLUMNS)
+    data = np.array([[_to_float(v) for v in r[len(ID_COLUMNS):]] for r in rows],
+                    dtype=np.float64).reshape(len(rows), len(columns) - len(ID_COLUMNS))
+    frame = pd.DataFrame(data, columns=columns[len(ID_COLUMNS):])
+    frame.insert(0, ID_COLUMNS[2], [_to_float(v) for v in ids[2]])
+    frame.insert(0, ID_COLUMNS[1], list(ids[1]))
+    frame.insert(0, ID_COLUMNS[0], list(ids[0]))
+    if fmt == 'parquet':
+        frame.to_parquet(out_file, index=False)
+    elif fmt == 'feather':
+        frame.to_feather(out_file)
+    else:
+        raise RuntimeError('Unknown columnar format "%s", should be one of %s' % (
+            fmt, ', '.join(COLUMNAR_FORMATS)))
+    return out_file
+
+
+def gather_measures(dataset_csv, work_dir, label_dir, out_file, columnar='parquet'):
+    """
+    Gathers the measurements of the sessions of ``dataset_csv`` (computed in
+    ``<work_dir>/sub-<subject>_ses-<session>``) into ``out_file``. The rows are
+    streamed to the CSV file; a columnar copy is written next to it (same name,
+    ``.parquet`` or ``.feather`` extension) unless ``columnar`` is ``None``.
+
+    Every row is validated against the header: a missing or malformed
+    measurement file leaves its columns empty, and is reported.
+
+    :return: the list of (subject, session, errors) of the invalid sessions
+
+    """
+    header = measures_header(label_dir)
+    columns = ID_COLUMNS + [c for _, cols in header for c in cols]
+    rows = [] if columnar else None
+    invalid = []
+    with open(out_file, 'w') as ofile:
+        ofile.write(', '.join(ID_COLUMNS) + ',' +
+                    ','.join(columns[len(ID_COLUMNS):]) + '\n')
+        for subject, session, age in read_dataset(dataset_csv):
+            subj = 'sub-%s_ses-%s' % (subject, session)
+            values, errors = read_session_row(op.join(work_dir, subj), subj, header)
+            row = [subject, session, age] + values
+            if len(row) != len(columns):
+                raise RuntimeError('Row of %s has %d columns, %d expected' % (
+                    subj, len(row), len(columns)))
+            if errors:
+                invalid.append((subject, session, errors))
+            ofile.write(','.join(row) + '\n')
+            if rows is not None:
+                rows.append(row)
+
+    if columnar:
+        try:
+            write_columnar(rows, columns, op.splitext(out_file)[0] + '.' + columnar,
+                           fmt=columnar)
+        except ImportError as exc:
+            print('Could not write the %s copy of %s: %s' % (columnar, out_file, exc),
+                  file=sys.stderr)
+    return invalid
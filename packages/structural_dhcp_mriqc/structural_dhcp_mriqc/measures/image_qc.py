@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Image quality measures of the T1w/T2w images of the dHCP structural pipeline.
+
+The images are loaded once and all the measures of the former
+``image-QC-measurements.sh`` script (summary statistics per tissue, SNR, CNR,
+EFC, CJV and INU) are computed from
+the in-memory arrays, with the tissue statistics of
+:func:`~structural_dhcp_mriqc.qc.anatomical.tissue_stats`. The statistics follow the ``fslstats`` options used by
+the script: ``-M``, ``-S`` and ``-P`` are computed over the non-zero voxels of
+the mask, ``-m``, ``-s`` and ``-p`` over all the voxels of the mask.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+from collections import OrderedDict
+import numpy as np
+import nibabel as nb
+
+from ..qc.anatomical import efc, tissue_stats
+from ..qc.masks import TissueMasks
+
+# Tissues of the drawem tissue labels used in the QC measures
+QC_TISSUES = OrderedDict([('bg', 4), ('csf', 1), ('gm', 2), ('wm', 3)])
+
+# Order of the measures in the output json
+QC_MEASURES = [
+    'cjv', 'cnr', 'efc', 'inu_med', 'inu_range', 'qc_type',
+    'size_x', 'size_y', 'size_z', 'snr_csf', 'snr_gm', 'snr', 'snr_wm',
+    'spacing_x', 'spacing_y', 'spacing_z',
+    'summary_mean_bg', 'summary_mean_csf', 'summary_mean_gm', 'summary_mean_wm',
+    'summary_p05_bg', 'summary_p05_csf', 'summary_p05_gm', 'summary_p05_wm',
+    'summary_p95_bg', 'summary_p95_csf', 'summary_p95_gm', 'summary_p95_wm',
+    'summary_stdv_bg', 'summary_stdv_csf', 'summary_stdv_gm', 'summary_stdv_wm']
+
+
+def _load(in_file, dtype=np.float32):
+    nii = nb.load(in_file)
+    return nii, np.nan_to_num(np.asanyarray(nii.dataobj).astype(dtype))
+
+
+def _nonzero(values):
+    return values[values != 0]
+
+
+def image_qc_measures(in_file, brain_mask, bias, tissue_labels, efc_slab=None):
+    """
+    Computes the image quality measures of an image of the pipeline.
+
+    :param str in_file: the bias-corrected image (``*_restore.nii.gz``)
+    :param str brain_mask: the brain mask
+    :param str bias: the bias field
+    :param str tissue_labels: the drawem tissue labels
+    :param int efc_slab: compute the EFC over slabs of this number of slices
+      (default: whole volume), see :func:`~structural_dhcp_mriqc.qc.anatomical.efc`
+    :return: an ordered dictionary with the measures
+
+    """
+    nii, img = _load(in_file)
+    # Intensities rescaled to [0, 1000]
+    imin, imax = img.min(), img.max()
+    if imax > imin:
+        img -= imin
+        img *= 1000.0 / (imax - imin)
+    brain = img * (np.asanyarray(nb.load(brain_mask).dataobj) > 0)
+
+    labels = np.rint(np.asanyarray(nb.load(tissue_labels).dataobj)).astype(np.int16)
+    labels[labels < 0] = 0
+
+    measures = {}
+    # Summary statistics (non-zero voxels of the tissues)
+    stats = tissue_stats(img, labels, labels=list(QC_TISSUES.values()), percentiles=[5, 95],
+                         mask=img != 0)
+    for name, lid in QC_TISSUES.items():
+        if stats[lid]['n'] == 0:
+            continue
+        measures['summary_mean_%s' % name] = stats[lid]['mean']
+        measures['summary_stdv_%s' % name] = stats[lid]['std']
+        measures['summary_p05_%s' % name] = stats[lid]['percentiles'][5]
+        measures['summary_p95_%s' % name] = stats[lid]['percentiles'][95]
+
+    # SNR (opened masks of the tissues, and all the tissues)
+    snrlabels = [QC_TISSUES[t] for t in ['csf', 'gm', 'wm']]
+    opened = TissueMasks(labels, labels=snrlabels).segmentation(opened=True)
+    stats = tissue_stats(brain, opened, labels=snrlabels, percentiles=[50])
+    del opened
+    tissues = ((labels > 0) & (labels != QC_TISSUES['bg'])).astype(np.uint8)
+    stats[0] = tissue_stats(brain, tissues, labels=[1], percentiles=[50])[1]
+    del tissues
+    for name in ['csf', 'gm', 'wm', '']:
+        lstats = stats[QC_TISSUES[name] if name else 0]
+        if lstats['n'] == 0:
+            continue
+        key = 'snr_%s' % name if name else 'snr'
+        measures[key] = lstats['percentiles'][50] / lstats['std']
+
+    # CNR and CJV
+    stats = tissue_stats(brain, labels, labels=[QC_TISSUES[t] for t in ['bg', 'gm', 'wm']])
+    del labels
+    gm, wm = stats[QC_TISSUES['gm']], stats[QC_TISSUES['wm']]
+    if gm['n'] > 0 and wm['n'] > 0:
+        measures['cnr'] = abs(gm['mean'] - wm['mean']) / stats[QC_TISSUES['bg']]['std']
+        measures['cjv'] = (gm['std'] + wm['std']) / (wm['mean'] - gm['mean'])
+
+    # Dimensions
+    for axis, size, spacing in zip('xyz', brain.shape, nii.header.get_zooms()[:3]):
+        measures['size_%s' % axis] = int(size)
+        measures['spacing_%s' % axis] = float(spacing)
+
+    # EFC
+    measures['efc'] = efc(brain, slab_size=efc_slab)
+
+    # INU
+    _, biasdata = _load(bias)
+    biasdata = _nonzero(biasdata.ravel())
+    if biasdata.size > 0:
+        cent5, inu_med, cent95 = np.percentile(biasdata, [5, 50, 95])
+        measures['inu_med'] = float(inu_med)
+        measures['inu_range'] = float(cent95 - cent5)
+
+    return OrderedDict((k, measures[k]) for k in QC_MEASURES
+                       if k in measures and np.isfinite(measures[k]))
+
+
+def write_image_qc_json(measures, out_file, subject_id, session_id, run_id, reorient=''):
+    """
+    Writes the measures to a json file with the schema of
+    the former ``image-QC-measurements.sh`` script: all the values are written
+    as strings.
+
+    """
+    entry = OrderedDict([('subject_id', subject_id), ('session_id', session_id),
+                         ('run_id', run_id), ('exists', 'True'), ('reorient', reorient)])
+    for key, value in measures.items():
+        entry[key] = '%d' % value if isinstance(value, int) else '%.6f' % value
+    with open(out_file, 'w') as jfile:
+        jfile.write(json.dumps(entry) + '\n')
+    return out_file
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Runs the per-session measurement scripts of the pipeline
+(``compute-measurements.sh`` and ``compute-QC-measurements.sh``) over the
+sessions of a dataset, with a bounded number of concurrent sessions.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import os.path as op
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+from .utils import read_dataset
+
+STAGES = ['measures', 'qc']
+
+
+def session_command(stage, subject, session, age, derivatives_dir, scripts_dir, work_dir):
+    """ The command line computing a stage of a session """
+    anat_dir = op.join(derivatives_dir, 'sub-%s' % subject, 'ses-%s' % session, 'anat')
+    if stage == 'measures':
+        return [op.join(scripts_dir, 'compute-measurements.sh'),
+                subject, session, anat_dir, '-d', work_dir]
+    if stage == 'qc':
+        return [op.join(scripts_dir, 'compute-QC-measurements.sh'),
+                subject, session, age, anat_dir, '-d', work_dir]
+    raise RuntimeError('Unknown stage "%s", should be one of %s' % (stage, ', '.join(STAGES)))
+
+
+def _run_task(task):
+    cmd, log_prefix, append, retries = task
+    mode = 'a' if append else 'w'
+    for attempt in range(retries + 1):
+        with open(log_prefix + '.log', mode) as out, open(log_prefix + '.err', mode) as err:
+            if attempt > 0:
+                out.write('retrying (attempt %d of %d)\n' % (attempt + 1, retries + 1))
+                out.flush()
+            retcode = subprocess.call(cmd, stdout=out, stderr=err)
+        if retcode == 0:
+            break
+        mode = 'a'
+    return retcode, attempt + 1
+
+
+def run_sessions(dataset_csv, derivatives_dir, scripts_dir, work_dir, stage='measures',
+                 nthreads=1, retries=1, log_dir='logs'):
+    """
+    Runs a stage of the pipeline for all the sessions in ``dataset_csv``.
+
+    The output of each session goes to ``<log_dir>/<subject>-<session>-measures.log``
+    (and ``.err``). These files are overwritten by the ``measures`` stage
+    and appended to by the ``qc`` stage. Failed sessions are retried up to
+    ``retries`` times.
+
+    :param str dataset_csv: the dataset CSV of the pipeline
+    :param str derivatives_dir: the derivatives directory of the structural pipeline
+    :param str scripts_dir: the directory with the measurement scripts
+    :param str work_dir: the working directory of the scripts
+    :param str stage: ``measures`` or ``qc``
+    :param int nthreads: number of sessions processed concurrently
+    :param int retries: number of retries of a failed session
+    :param str log_dir: directory of the log files
+    :return: a list of (subject, session, return code, attempts) tuples, in
+      the order of the dataset
+
+    """
+    if stage not in STAGES:
+        raise RuntimeError('Unknown stage "%s", should be one of %s' % (stage, ', '.join(STAGES)))
+    if not op.exists(log_dir):
+        os.makedirs(log_dir)
+
+    sessions = read_dataset(dataset_csv)
+    tasks = []
+    for subject, session, age in sessions:
+        cmd = session_command(stage, subject, session, age, derivatives_dir,
+                              scripts_dir, work_dir)
+        log_prefix = op.join(log_dir, '%s-%s-measures' % (subject, session))
+        tasks.append((cmd, log_prefix, stage != 'measures', retries))
+
+    pool = ThreadPool(max(1, min(nthreads, len(tasks))))
+    results = []
+    try:
+        for (subject, session, _), (retcode, attempts) in zip(
+                sessions, pool.imap(_run_task, tasks)):
+            print('%s %s%s' % (subject, session, '' if retcode == 0 else ' (failed)'))
+            results.append((subject, session, retcode, attempts))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def print_summary(results, log_dir='logs'):
+    """ Prints a summary of the sessions run, returns the number of failures """
+    failed = [r for r in results if r[2] != 0]
+    retried = [r for r in results if r[2] == 0 and r[3] > 1]
+    print('%d sessions processed, %d succeeded (%d after retrying), %d failed' % (
+        len(results), len(results) - len(failed), len(retried), len(failed)))
+    for subject, session, retcode, attempts in failed:
+        print('  %s %s: exit code %d after %d attempt(s), see %s' % (
+            subject, session, retcode, attempts,
+            op.join(log_dir, '%s-%s-measures.err' % (subject, session))))
+    return len(failed)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Merges the per-session QC json files (``dhcp-measurements.json`` and
+``T1/T2-qc-measurements.json``) into the documents read by the reports:
+a single json document (``{"data": [...]}``) and a JSON-lines file, with
+one entry per line, which can be appended to incrementally.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import os.path as op
+import json
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from six import string_types
+
+from .utils import read_dataset
+
+# Merged documents, and the suffix of the per-session files they gather
+QC_JSON_FILES = OrderedDict([
+    ('dhcp-measurements.json', 'dhcp-measurements.json'),
+    ('qc-measurements.json', '-qc-measurements.json'),
+])
+
+REQUIRED_KEYS = ['subject_id', 'session_id', 'run_id']
+
+
+def jsonl_file(in_file):
+    """ The JSON-lines variant of a merged json document """
+    return op.splitext(in_file)[0] + '.jsonl'
+
+
+def find_session_jsons(work_dir, sessions=None):
+    """
+    Finds the json files of the sessions in ``work_dir`` (one directory per
+    session, ``sub-<subject>_ses-<session>``), with a single scan of each
+    directory.
+
+    :param str work_dir: the working directory of the measurements
+    :param list sessions: the (subject, session) tuples to gather (default: all)
+    :return: a dictionary with the list of files of each merged document
+
+    """
+    if sessions is None:
+        subjs = sorted(d for d in os.listdir(work_dir) if d.startswith('sub-') and
+                       op.isdir(op.join(work_dir, d)))
+    else:
+        subjs = ['sub-%s_ses-%s' % (subject, session) for subject, session in sessions]
+
+    found = OrderedDict((name, []) for name in QC_JSON_FILES)
+    for subj in subjs:
+        try:
+            fnames = sorted(os.listdir(op.join(work_dir, subj)))
+        except OSError:
+            continue
+        for name, suffix in QC_JSON_FILES.items():
+            found[name] += [op.join(work_dir, subj, f) for f in fnames if f.endswith(suffix)]
+    return found
+
+
+def validate_entry(entry):
+    """ Checks the schema of a QC entry, returns the list of errors """
+    if not isinstance(entry, dict):
+        return ['not a json object']
+    errors = ['missing "%s"' % key for key in REQUIRED_KEYS if key not in entry]
+    errors += ['"%s" is not a string' % key for key, value in entry.items()
+               if not isinstance(value, string_types)]
+    return errors
+
+
+def read_entry(in_file):
+    """
+    Reads and validates the QC entry of a json file.
+
+    :return: a tuple with the entry (``None`` if invalid) and the list of errors
+
+    """
+    try:
+        with open(in_file, 'r') as jfile:
+            entry = json.load(jfile, object_pairs_hook=OrderedDict)
+    except (IOError, ValueError) as exc:
+        return None, ['%s: %s' % (in_file, exc)]
+    errors = ['%s: %s' % (in_file, e) for e in validate_entry(entry)]
+    return (None if errors else entry), errors
+
+
+def read_entries(files, nthreads=1):
+    """
+    Reads the QC entries of the json files in a thread pool, in the order of the files.
+
+    :return: a tuple with the list of valid entries and the list of errors
+
+    """
+    if not files:
+        return [], []
+    pool = ThreadPool(max(1, min(nthreads, len(files))))
+    try:
+        results = pool.map(read_entry, files)
+    finally:
+        pool.close()
+        pool.join()
+    entries = [entry for entry, _ in results if entry is not None]
+    errors = [e for _, errs in results for e in errs]
+    return entries, errors
+
+
+def write_entries(entries, out_file):
+    """
+    Writes the QC entries to a merged json document (``{"data": [...]}``)
+    and its JSON-lines variant.
+    """
+    with open(out_file, 'w') as jfile:
+        json.dump({'data': entries}, jfile)
+        jfile.write('\n')
+    write_jsonl(entries, jsonl_file(out_file))
+    return out_file
+
+
+def write_jsonl(entries, out_file, append=False):
+    """ Writes (or appends) the QC entries to a JSON-lines file """
+    with open(out_file, 'a' if append else 'w') as jfile:
+        for entry in entries:
+            jfile.write(json.dumps(entry) + '\n')
+    return out_file
+
+
+def read_measures(in_file):
+    """
+    Reads the QC entries of a merged document, either a json document
+    (``{"data": [...]}``) or a JSON-lines file (``.jsonl``). When a json document
+    has an up-to-date JSON-lines variant next to it, the latter is read.
+
+    :return: the list of entries
+
+    """
+    jsonl = in_file if in_file.endswith('.jsonl') else jsonl_file(in_file)
+    if op.exists(jsonl) and (jsonl == in_file or
+                             os.stat(jsonl).st_mtime >= os.stat(in_file).st_mtime):
+        with open(jsonl, 'r') as jfile:
+            return [json.loads(line) for line in jfile if line.strip()]
+    with open(in_file, 'r') as jfile:
+        return json.load(jfile)['data']
+
+
+def merge_qc_jsons(work_dir, out_dir, dataset_csv=None, nthreads=1):
+    """
+    Merges the QC json files of the sessions of ``dataset_csv`` (all the sessions
+    in ``work_dir`` if not provided) into ``out_dir``.
+
+    :return: a tuple with the list of files written and the list of errors
+
+    """
+    sessions = None
+    if dataset_csv is not None:
+        sessions = [(subject, session) for subject, session, _ in read_dataset(dataset_csv)]
+    out_files = []
+    errors = []
+    for name, files in find_session_jsons(work_dir, sessions).items():
+        entries, errs = read_entries(files, nthreads=nthreads)
+        out_files.append(write_entries(entries, op.join(out_dir, name)))
+        errors += errs
+    return out_files, errors
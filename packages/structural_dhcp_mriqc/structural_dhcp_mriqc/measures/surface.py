@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Surface-based measurements of the dHCP structural pipeline.
+
+Each surface is parsed once, and the statistics of all the cortical labels
+and super-structures are computed with vectorised group-by operations,
+replacing the ``surface-scalar-statistics`` calls (several per label) of
+``surface-measurements.sh`` and ``GI-measurements.sh``.
+
+The area of a region is computed as the sum of the areas of its vertices,
+where each vertex accounts for a third of the area of its incident triangles
+(the total area, used for the relative areas, is the sum of the areas of the
+triangles, as ``mirtk info -area``). ``surface-scalar-statistics`` (not part
+of this package) may define the "Area" of a region differently, e.g. from the
+triangles with all their vertices in the region, so the areas and GI of the
+regions may differ from the former scripts along the region boundaries. The
+median of an even number of values is the mean of the two middle values.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from math import pi
+import numpy as np
+
+from .utils import read_super_structures, read_label_list, write_values
+
+VTK_TYPES = {
+    'bit': None,
+    'char': 'i1', 'unsigned_char': 'u1',
+    'short': '>i2', 'unsigned_short': '>u2',
+    'int': '>i4', 'unsigned_int': '>u4',
+    'long': '>i8', 'unsigned_long': '>u8',
+    'vtktypeint32': '>i4', 'vtktypeint64': '>i8',
+    'float': '>f4', 'double': '>f8',
+}
+
+
+class _VTKReader(object):
+    """ Minimal reader of legacy VTK (ASCII or binary) polydata files """
+
+    def __init__(self, in_file):
+        with open(in_file, 'rb') as vfile:
+            self.buf = vfile.read()
+        self.pos = 0
+        self.in_file = in_file
+
+    def line(self, skip_empty=True):
+        """ Returns the next (non-empty) line, or None at the end of file """
+        while self.pos < len(self.buf):
+            end = self.buf.find(b'\n', self.pos)
+            if end < 0:
+                end = len(self.buf)
+            line = self.buf[self.pos:end].decode('latin-1').strip()
+            self.pos = end + 1
+            if line or not skip_empty:
+                return line
+        return None
+
+    def data(self, count, vtktype):
+        """ Reads ``count`` values of the given VTK type """
+        dtype = VTK_TYPES.get(vtktype.lower())
+        if dtype is None:
+            raise RuntimeError('Unsupported VTK data type "%s" in %s' % (vtktype, self.in_file))
+
+        if self.binary:
+            dtype = np.dtype(dtype)
+            end = self.pos + count * dtype.itemsize
+            values = np.frombuffer(self.buf[self.pos:end], dtype=dtype)
+            self.pos = end
+            return values.astype(dtype.newbyteorder('='))
+
+        tokens = []
+        while len(tokens) < count:
+            line = self.line()
+            if line is None:
+                raise RuntimeError('Unexpected end of file %s' % self.in_file)
+            tokens += line.split()
+        return np.array(tokens, dtype=np.float64).astype(np.dtype(dtype).newbyteorder('='))
+
+    def skip_metadata(self):
+        """ Skips a METADATA block (terminated by an empty line) """
+        line = self.line(skip_empty=False)
+        while line:
+            line = self.line(skip_empty=False)
+
+    def cells(self, header):
+        """ Reads the cells of a POLYGONS/LINES/... section as lists of point ids """
+        ncells, size = int(header[1]), int(header[2])
+        if self.version >= 5:
+            offsets = self.data(ncells, self.line().split()[1])
+            connectivity = self.data(size, self.line().split()[1])
+            return offsets.astype(np.int64), connectivity.astype(np.int64)
+
+        raw = self.data(size, 'int').astype(np.int64)
+        if ncells and np.all(raw[::raw[0] + 1] == raw[0]) and size == ncells * (raw[0] + 1):
+            # Fast path: all the cells have the same number of points
+            offsets = np.arange(0, ncells * raw[0] + 1, raw[0])
+            return offsets, raw.reshape(ncells, -1)[:, 1:].ravel()
+
+        offsets = [0]
+        connectivity = []
+        pos = 0
+        for _ in range(ncells):
+            npts = raw[pos]
+            connectivity.append(raw[pos + 1:pos + 1 + npts])
+            offsets.append(offsets[-1] + npts)
+            pos += npts + 1
+        return np.array(offsets), np.hstack(connectivity)
+
+    def attributes(self, count, header):
+        """ Reads a point/cell data attribute, returns a list of (name, values) """
+        kind = header[0].upper()
+        if kind == 'SCALARS':
+            ncomp = int(header[3]) if len(header) > 3 else 1
+            if self.line().split()[0].upper() != 'LOOKUP_TABLE':
+                raise RuntimeError('Malformed SCALARS attribute in %s' % self.in_file)
+            return [(header[1], self.data(count * ncomp, header[2]).reshape(count, -1))]
+        if kind == 'FIELD':
+            arrays = []
+            for _ in range(int(header[2])):
+                line = self.line()
+                while line.upper().startswith('METADATA'):
+                    self.skip_metadata()
+                    line = self.line()
+                name, ncomp, ntuples, vtktype = line.split()[:4]
+                values = self.data(int(ncomp) * int(ntuples), vtktype)
+                arrays.append((name, values.reshape(int(ntuples), -1)))
+            return arrays
+        if kind in ('VECTORS', 'NORMALS'):
+            return [(header[1], self.data(count * 3, header[2]).reshape(count, 3))]
+        if kind == 'TEXTURE_COORDINATES':
+            ncomp = int(header[2])
+            return [(header[1], self.data(count * ncomp, header[3]).reshape(count, ncomp))]
+        if kind == 'COLOR_SCALARS':
+            ncomp = int(header[2])
+            vtktype = 'unsigned_char' if self.binary else 'float'
+            return [(header[1], self.data(count * ncomp, vtktype).reshape(count, ncomp))]
+        if kind == 'LOOKUP_TABLE':
+            vtktype = 'unsigned_char' if self.binary else 'float'
+            self.data(int(header[2]) * 4, vtktype)
+            return []
+        raise RuntimeError('Unsupported VTK attribute "%s" in %s' % (kind, self.in_file))
+
+    def read(self):
+        """ Parses the file, returns the points, the triangles and the point data """
+        header = self.line()
+        if header is None or not header.startswith('# vtk DataFile'):
+            raise RuntimeError('%s is not a legacy VTK file' % self.in_file)
+        try:
+            self.version = float(header.split()[-1])
+        except ValueError:
+            self.version = 3.0
+        self.line(skip_empty=False)  # title
+        self.binary = self.line().upper() == 'BINARY'
+        dataset = self.line().split()
+        if dataset[-1].upper() != 'POLYDATA':
+            raise RuntimeError('%s is not a polydata file' % self.in_file)
+
+        points = None
+        polygons = None
+        point_data = {}
+        section, count = None, 0
+        line = self.line()
+        while line is not None:
+            fields = line.split()
+            key = fields[0].upper()
+            if key == 'POINTS':
+                points = self.data(int(fields[1]) * 3, fields[2]).reshape(-1, 3)
+            elif key == 'METADATA':
+                self.skip_metadata()
+            elif key in ('POLYGONS', 'TRIANGLE_STRIPS', 'LINES', 'VERTICES'):
+                cells = self.cells(fields)
+                if key == 'POLYGONS':
+                    polygons = cells
+            elif key in ('POINT_DATA', 'CELL_DATA'):
+                section, count = key, int(fields[1])
+            elif section is not None:
+                for name, values in self.attributes(count, fields):
+                    if section == 'POINT_DATA':
+                        point_data[name] = values[:, 0] if values.shape[1] == 1 else values
+            else:
+                raise RuntimeError('Unexpected section "%s" in %s' % (key, self.in_file))
+            line = self.line()
+
+        if points is None or polygons is None:
+            raise RuntimeError('%s has no points or polygons' % self.in_file)
+        return points.astype(np.float64), _triangulate(*polygons), point_data
+
+
+def _triangulate(offsets, connectivity):
+    """ Fan-triangulates polygons given as (offsets, connectivity) arrays """
+    sizes = np.diff(offsets)
+    if np.all(sizes == 3):
+        return connectivity.reshape(-1, 3)
+    triangles = []
+    for start, size in zip(offsets[:-1], sizes):
+        cell = connectivity[start:start + size]
+        for i in range(1, size - 1):
+            triangles.append((cell[0], cell[i], cell[i + 1]))
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+
+def read_vtk(in_file):
+    """
+    Reads a legacy VTK polydata file (as written by MIRTK).
+
+    :param str in_file: path to the ``.vtk`` file
+    :return: a tuple with the points (:math:`N \\times 3`), the triangles
+      (:math:`M \\times 3`) and a dictionary of point data arrays
+
+    """
+    return _VTKReader(in_file).read()
+
+
+def triangle_areas(points, triangles):
+    """ Area of each triangle """
+    vec1 = points[triangles[:, 1]] - points[triangles[:, 0]]
+    vec2 = points[triangles[:, 2]] - points[triangles[:, 0]]
+    return 0.5 * np.sqrt((np.cross(vec1, vec2) ** 2).sum(axis=1))
+
+
+def vertex_areas(points, triangles, tri_areas=None):
+    """ Area of each vertex: a third of the area of each incident triangle """
+    if tri_areas is None:
+        tri_areas = triangle_areas(points, triangles)
+    return np.bincount(triangles.ravel(), weights=np.repeat(tri_areas / 3.0, 3),
+                       minlength=len(points))
+
+
+def enclosed_volume(points, triangles):
+    """ Volume enclosed by a closed triangulated surface (divergence theorem) """
+    vert0, vert1, vert2 = (points[triangles[:, i]] for i in range(3))
+    return float(np.abs((vert0 * np.cross(vert1, vert2)).sum()) / 6.0)
+
+
+def surface_regions(cortical, super_structures=None):
+    """
+    The regions measured on the surfaces, as lists of labels: all the
+    cortex (``None``, any label greater than 0), then each cortical label
+    and finally the left and right cortical parts of each super-structure.
+    """
+    regions = [None] + [[l] for l in read_label_list(cortical)]
+    if super_structures is not None:
+        for columns in read_super_structures(super_structures).values():
+            regions += [columns[0], columns[1]]
+    return regions
+
+
+def _region_mask(labels, region, lut_size):
+    if region is None:
+        return labels > 0
+    lut = np.zeros(lut_size, dtype=bool)
+    lut[[l for l in region if 0 <= l < lut_size]] = True
+    return lut[labels]
+
+
+def region_sums(values, labels, regions):
+    """ Sum of ``values`` over each region """
+    sums = np.bincount(labels, weights=values)
+    out = []
+    for region in regions:
+        if region is None:
+            out.append(sums[1:].sum())
+        else:
+            out.append(sum(sums[l] for l in region if 0 <= l < len(sums)))
+    return np.array(out, dtype=np.float64)
+
+
+def region_medians(values, labels, regions):
+    """
+    Median of ``values`` over each region (NaN for empty regions). Regions
+    of a single label are computed together from one sort of the data.
+    """
+    nlabels = labels.max() + 1
+    order = np.lexsort((values, labels))
+    svalues = values[order]
+    counts = np.bincount(labels, minlength=nlabels)
+    starts = np.hstack(([0], np.cumsum(counts)[:-1]))
+    lows = np.minimum(starts + (counts - 1) // 2, len(values) - 1)
+    highs = np.minimum(starts + counts // 2, len(values) - 1)
+    medians = np.where(counts > 0, 0.5 * (svalues[lows] + svalues[highs]), np.nan)
+
+    out = []
+    for region in regions:
+        if region is not None and len(region) == 1:
+            lbl = region[0]
+            out.append(medians[lbl] if 0 <= lbl < nlabels else np.nan)
+            continue
+        mask = _region_mask(labels, region, nlabels)
+        out.append(np.median(values[mask]) if mask.any() else np.nan)
+    return np.array(out, dtype=np.float64)
+
+
+def _labels(point_data, name, in_file):
+    if name not in point_data:
+        raise RuntimeError('Point data array "%s" not found in %s' % (name, in_file))
+    labels = np.rint(point_data[name]).astype(np.int64)
+    labels[labels < 0] = 0
+    return labels
+
+
+def surface_measures(white, outer, cortical, super_structures=None):
+    """
+    Computes the thickness, sulcal depth, surface area and curvature
+    measures of ``surface-measurements.sh``.
+
+    :param str white: merged white matter surface with the ``thickness``,
+      ``sulc``, ``curvature`` and ``drawem`` point data arrays
+    :param str outer: merged outer (convex hull) pial surface, used to
+      normalise the sulcal depth and the curvature
+    :param str cortical: file with the list of cortical labels
+    :param str super_structures: path to the super-structures definition
+    :return: a dictionary with the measures, keyed by output file suffix
+
+    """
+    points, triangles, point_data = read_vtk(white)
+    tri_areas = triangle_areas(points, triangles)
+    total_area = tri_areas.sum()
+    areas = vertex_areas(points, triangles, tri_areas)
+    labels = _labels(point_data, 'drawem', white)
+
+    hull_points, hull_triangles, _ = read_vtk(outer)
+    radius = (3.0 * enclosed_volume(hull_points, hull_triangles) / (4.0 * pi)) ** (1.0 / 3.0)
+
+    regions = surface_regions(cortical, super_structures)
+    region_areas = region_sums(areas, labels, regions)
+    thickness = region_medians(point_data['thickness'], labels, regions)
+    sulc = region_medians(point_data['sulc'], labels, regions) * radius
+    curvature = region_medians(point_data['curvature'], labels, regions) * radius
+
+    measures = {}
+    for name, values in [('thickness', thickness), ('sulc', sulc),
+                         ('surface-area', region_areas), ('curvature', curvature)]:
+        measures[name] = values[:1]
+        measures[name + '-regions'] = values[1:]
+    measures['rel-surface-area-regions'] = region_areas[1:] / total_area
+    return measures
+
+
+def gi_measures(pial, outer, cortical, super_structures=None):
+    """
+    Computes the gyrification index (GI) measures of ``GI-measurements.sh``,
+    as the ratio between the pial and the outer pial areas of each region.
+
+    :param str pial: merged pial surface with the ``drawem`` point data array
+    :param str outer: merged outer pial surface with the ``drawem`` point data array
+    :param str cortical: file with the list of cortical labels
+    :param str super_structures: path to the super-structures definition
+    :return: a dictionary with the measures, keyed by output file suffix
+
+    """
+    regions = surface_regions(cortical, super_structures)
+    region_areas = []
+    for in_file in [pial, outer]:
+        points, triangles, point_data = read_vtk(in_file)
+        areas = vertex_areas(points, triangles)
+        region_areas.append(region_sums(areas, _labels(point_data, 'drawem', in_file), regions))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gindex = np.where(region_areas[1] > 0, region_areas[0] / region_areas[1], np.nan)
+    gindex[region_areas[0] <= 0] = np.nan
+    return {'GI': gindex[:1], 'GI-regions': gindex[1:]}
+
+
+def write_surface_measures(measures, out_prefix):
+    """
+    Writes the measures computed by :func:`surface_measures` or
+    :func:`gi_measures` to ``<out_prefix>-<measure>`` files, one line each.
+    Empty regions are written as ``-``.
+
+    """
+    out_files = []
+    for name, values in sorted(measures.items()):
+        out_file = '%s-%s' % (out_prefix, name)
+        write_values(values, out_file, fmt='%.5f')
+        out_files.append(out_file)
+    return out_files
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Image quality measures tests
+"""
+import json
+import numpy as np
+import nibabel as nb
+
+from structural_dhcp_mriqc.measures.image_qc import image_qc_measures, write_image_qc_json
+
+# Slabs of 3 slices (x) of 12x12 voxels: bg, csf, gm, wm and deep gray matter,
+# with two intensities (after the rescale to [0, 1000]) alternating along y
+SLABS = [(4, 0, 20), (1, 400, 600), (2, 200, 300), (3, 700, 800), (7, 900, 1000)]
+BIAS = [0, 0.8, 0.9, 1.1, 1.2]
+
+
+def _save(out_file, data):
+    nii = nb.Nifti1Image(data, np.eye(4))
+    nii.header.set_zooms((0.8, 0.8, 1.6))
+    nii.to_filename(out_file)
+    return out_file
+
+
+def test_image_qc_measures(tmpdir):
+    labels = np.zeros((15, 12, 12), dtype=np.int16)
+    img = np.zeros(labels.shape, dtype=np.float32)
+    bias = np.zeros(labels.shape, dtype=np.float32)
+    for i, (label, low, high) in enumerate(SLABS):
+        labels[3 * i:3 * i + 3] = label
+        img[3 * i:3 * i + 3, 0::2] = low
+        img[3 * i:3 * i + 3, 1::2] = high
+        bias[3 * i:3 * i + 3] = BIAS[i]
+
+    # the intensities are rescaled to [0, 1000]
+    measures = image_qc_measures(
+        _save(str(tmpdir.join('T2.nii.gz')), img / 2),
+        _save(str(tmpdir.join('mask.nii.gz')), np.ones(labels.shape, dtype=np.uint8)),
+        _save(str(tmpdir.join('bias.nii.gz')), bias),
+        _save(str(tmpdir.join('labels.nii.gz')), labels))
+
+    # fslstats -M/-S/-P: non-zero voxels of the 432 voxels of each tissue
+    bessel = np.sqrt(432 / 431.)
+    expected = {'summary_mean_bg': 20, 'summary_stdv_bg': 0,
+                'summary_p05_bg': 20, 'summary_p95_bg': 20,
+                'summary_mean_csf': 500, 'summary_stdv_csf': 100 * bessel,
+                'summary_p05_csf': 400, 'summary_p95_csf': 600,
+                'summary_mean_gm': 250, 'summary_stdv_gm': 50 * bessel,
+                'summary_p05_gm': 200, 'summary_p95_gm': 300,
+                'summary_mean_wm': 750, 'summary_stdv_wm': 50 * bessel,
+                'summary_p05_wm': 700, 'summary_p95_wm': 800}
+
+    # SNR: median / stdv (fslstats -p 50 / -s) of the opened masks of the tissues,
+    # the slabs without their 8 corners (424 voxels)
+    opened = np.sqrt(424 / 423.)
+    expected.update({'snr_csf': 500 / (100 * opened), 'snr_gm': 250 / (50 * opened),
+                     'snr_wm': 750 / (50 * opened)})
+    # all the tissues but bg (1728 voxels): median 650, mean 612.5
+    variance = (3590000 / 8. - 612.5 ** 2) * 1728 / 1727.
+    expected['snr'] = 650 / np.sqrt(variance)
+
+    # CNR and CJV (fslstats -m / -s over all the voxels of the masks)
+    expected['cnr'] = 500 / (10 * bessel)
+    expected['cjv'] = (50 * bessel + 50 * bessel) / 500
+
+    # INU: percentiles of the non-zero bias
+    expected.update({'inu_med': 1.0, 'inu_range': 0.4})
+
+    for key, value in expected.items():
+        assert np.isclose(measures[key], value, rtol=1e-5, atol=1e-5), key
+    assert [measures['size_%s' % a] for a in 'xyz'] == [15, 12, 12]
+    assert np.allclose([measures['spacing_%s' % a] for a in 'xyz'], [0.8, 0.8, 1.6])
+    assert 0 < measures['efc'] < 1
+
+    out_file = write_image_qc_json(measures, str(tmpdir.join('qc.json')), 'sub', 'ses', 'T2')
+    with open(out_file) as jfile:
+        entry = json.load(jfile)
+    assert entry['size_x'] == '15'
+    assert entry['summary_mean_csf'] == '500.000000'
+    assert entry['run_id'] == 'T2' and entry['exists'] == 'True'
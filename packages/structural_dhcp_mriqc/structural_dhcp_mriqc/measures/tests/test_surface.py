@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Surface measurements tests
+"""
+from math import pi
+import numpy as np
+
+from structural_dhcp_mriqc.measures.surface import (read_vtk, surface_measures, gi_measures,
+                                                    write_surface_measures)
+
+# Two unit squares side by side (z=0), two triangles each:
+#   3 --- 4 --- 5
+#   |   / |   / |
+#   0 --- 1 --- 2
+# Areas of the vertices (a third of their triangles): 1/3, 1/2, 1/6, 1/6, 1/2, 1/3
+GRID_POINTS = [[0, 0, 0], [1, 0, 0], [2, 0, 0], [0, 1, 0], [1, 1, 0], [2, 1, 0]]
+GRID_TRIANGLES = [[0, 1, 4], [0, 4, 3], [1, 2, 5], [1, 5, 4]]
+GRID_LABELS = [5, 5, 7, 0, 7, 9]
+GRID_THICKNESS = [1., 2., 3., 4., 5., 6.]
+
+# Cube of side 2 (volume 8), the outer surface
+CUBE_POINTS = [[x, y, z] for x in [0, 2] for y in [0, 2] for z in [0, 2]]
+CUBE_TRIANGLES = [[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+                  [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]]
+CUBE_RADIUS = (3.0 * 8 / (4.0 * pi)) ** (1.0 / 3.0)
+
+# Regions: all, the cortical labels 5, 7 and 8 (empty), the super-structure 1 (5+7, 7+8)
+CORTICAL = '5 7\n8\n'
+SUPER_STRUCTURES = '1 5 7 0 0\n1 7 8 0 0\n'
+
+
+def _write_vtk(out_file, points, triangles, arrays, binary=False):
+    """ Writes a legacy VTK polydata file, the first array as SCALARS, the others as a FIELD """
+    def block(values, dtype):
+        values = np.asarray(values, dtype=dtype).ravel()
+        if binary:
+            return values.tobytes() + b'\n'
+        return (' '.join(str(v) for v in values.tolist()) + '\n').encode('ascii')
+
+    triangles = np.asarray(triangles)
+    cells = np.hstack((np.full((len(triangles), 1), 3), triangles))
+    out = [b'# vtk DataFile Version 3.0\n', b'test surface\n',
+           b'BINARY\n' if binary else b'ASCII\n', b'DATASET POLYDATA\n',
+           ('POINTS %d float\n' % len(points)).encode('ascii'), block(points, '>f4'),
+           ('POLYGONS %d %d\n' % (len(cells), cells.size)).encode('ascii'), block(cells, '>i4')]
+    if arrays:
+        names = list(arrays)
+        out += [('POINT_DATA %d\n' % len(points)).encode('ascii'),
+                ('SCALARS %s float 1\n' % names[0]).encode('ascii'),
+                b'LOOKUP_TABLE default\n', block(arrays[names[0]], '>f4')]
+        if len(names) > 1:
+            out.append(('FIELD FieldData %d\n' % (len(names) - 1)).encode('ascii'))
+            for name in names[1:]:
+                vtktype, dtype = ('int', '>i4') if name == 'drawem' else ('double', '>f8')
+                out += [('%s 1 %d %s\n' % (name, len(points), vtktype)).encode('ascii'),
+                        block(arrays[name], dtype)]
+    with open(out_file, 'wb') as vfile:
+        vfile.write(b''.join(out))
+    return out_file
+
+
+def _grid_arrays(thickness=GRID_THICKNESS):
+    arrays = {'thickness': thickness}
+    arrays['sulc'] = [2 * v for v in thickness]
+    arrays['curvature'] = [-v for v in thickness]
+    arrays['drawem'] = GRID_LABELS
+    return dict((name, arrays[name]) for name in ['thickness', 'sulc', 'curvature', 'drawem'])
+
+
+def _inputs(tmpdir):
+    cortical = tmpdir.join('cortical.csv')
+    cortical.write(CORTICAL)
+    super_structures = tmpdir.join('super-structures.csv')
+    super_structures.write(SUPER_STRUCTURES)
+    outer = _write_vtk(str(tmpdir.join('outer.vtk')), CUBE_POINTS, CUBE_TRIANGLES, {})
+    return str(cortical), str(super_structures), outer
+
+
+def test_read_vtk(tmpdir):
+    for binary in [False, True]:
+        in_file = _write_vtk(str(tmpdir.join('grid%d.vtk' % binary)), GRID_POINTS,
+                             GRID_TRIANGLES, _grid_arrays(), binary=binary)
+        points, triangles, point_data = read_vtk(in_file)
+        assert np.allclose(points, GRID_POINTS)
+        assert np.all(triangles == GRID_TRIANGLES)
+        assert sorted(point_data) == ['curvature', 'drawem', 'sulc', 'thickness']
+        assert np.allclose(point_data['thickness'], GRID_THICKNESS)
+        assert np.all(point_data['drawem'] == GRID_LABELS)
+
+
+def test_surface_measures(tmpdir):
+    cortical, super_structures, outer = _inputs(tmpdir)
+    for binary in [False, True]:
+        white = _write_vtk(str(tmpdir.join('white%d.vtk' % binary)), GRID_POINTS,
+                           GRID_TRIANGLES, _grid_arrays(), binary=binary)
+        measures = surface_measures(white, outer, cortical, super_structures)
+
+        # all (labels > 0), 5, 7, 8 (empty), super-structure 1 (5+7, then 7+8)
+        areas = [2 - 1 / 6., 1 / 3. + 1 / 2., 1 / 6. + 1 / 2., 0, 3 / 2., 1 / 6. + 1 / 2.]
+        medians = [3, 1.5, 4, np.nan, 2.5, 4]
+        assert np.allclose(measures['surface-area'], areas[:1])
+        assert np.allclose(measures['surface-area-regions'], areas[1:])
+        assert np.allclose(measures['rel-surface-area-regions'], np.array(areas[1:]) / 2)
+        assert np.allclose(measures['thickness'], medians[:1])
+        assert np.allclose(measures['thickness-regions'], medians[1:], equal_nan=True)
+        assert np.allclose(measures['sulc-regions'], 2 * CUBE_RADIUS * np.array(medians[1:]),
+                           equal_nan=True)
+        assert np.allclose(measures['curvature'], [-3 * CUBE_RADIUS])
+
+    out_files = write_surface_measures(measures, str(tmpdir.join('sub')))
+    assert len(out_files) == len(measures)
+    assert tmpdir.join('sub-thickness-regions').read() == '1.50000 4.00000 - 2.50000 4.00000\n'
+    assert tmpdir.join('sub-surface-area').read() == '1.83333\n'
+    assert tmpdir.join('sub-rel-surface-area-regions').read() == \
+        '0.41667 0.33333 0.00000 0.75000 0.33333\n'
+
+
+def test_gi_measures(tmpdir):
+    cortical, super_structures, outer = _inputs(tmpdir)
+    arrays = {'drawem': GRID_LABELS}
+    # the pial surface is the outer one stretched twice along x, GI = 2
+    pial = _write_vtk(str(tmpdir.join('pial.vtk')), np.array(GRID_POINTS) * [2, 1, 1],
+                      GRID_TRIANGLES, arrays, binary=True)
+    outer_pial = _write_vtk(str(tmpdir.join('outer-pial.vtk')), GRID_POINTS,
+                            GRID_TRIANGLES, arrays)
+    measures = gi_measures(pial, outer_pial, cortical, super_structures)
+    assert np.allclose(measures['GI'], [2])
+    assert np.allclose(measures['GI-regions'], [2, 2, np.nan, 2, 2], equal_nan=True)
+
+    write_surface_measures(measures, str(tmpdir.join('sub')))
+    assert tmpdir.join('sub-GI-regions').read() == '2.00000 2.00000 - 2.00000 2.00000\n'
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Volume measurements tests
+"""
+import numpy as np
+import nibabel as nb
+
+from structural_dhcp_mriqc.measures.utils import bc_quotient
+from structural_dhcp_mriqc.measures.volume import volume_measures, write_volume_measures
+
+
+def _labels(out_file, counts):
+    """ A 4x4x4 label volume (voxels of 0.5 mm^3) with the given number of voxels per label """
+    data = np.zeros(64, dtype=np.uint8)
+    start = 0
+    for label, count in counts:
+        data[start:start + count] = label
+        start += count
+    nii = nb.Nifti1Image(data.reshape(4, 4, 4), np.eye(4))
+    nii.header.set_zooms((0.5, 0.5, 2.0))
+    nii.to_filename(out_file)
+    return out_file
+
+
+def test_volume_measures(tmpdir):
+    all_labels = _labels(str(tmpdir.join('all.nii.gz')),
+                         [(1, 10), (2, 6), (3, 3), (49, 2), (83, 1)])
+    tissue_labels = _labels(str(tmpdir.join('tissue.nii.gz')), [(1, 4), (2, 7), (4, 1)])
+    super_structures = tmpdir.join('super-structures.csv')
+    super_structures.write('2 3 1 2 2\n1 1 2 3 49\n1 2 3 83 7\n')
+
+    measures = volume_measures(all_labels, tissue_labels, str(super_structures))
+    # all the labels but 49 and 83: 19 voxels
+    assert np.allclose(measures['volume'], [9.5])
+    assert np.allclose(measures['volume-tissue-regions'], [2, 3.5, 0.5])
+    # the labels present, then the four columns of the super-structures 1 and 2
+    regions = [5, 3, 1.5, 1, 0.5, 8, 4.5, 2, 1, 1.5, 5, 3, 3]
+    assert np.allclose(measures['volume-all-regions'], regions)
+    assert np.allclose(measures['rel-volume-all-regions'], np.array(regions) / 9.5)
+
+    write_volume_measures(measures, str(tmpdir.join('sub')))
+    assert tmpdir.join('sub-volume').read() == '9.500000\n'
+    assert tmpdir.join('sub-volume-tissue-regions').read() == '2.000000 3.500000 0.500000\n'
+    # truncated as bc does (2 / 9.5 = 0.2105263)
+    assert tmpdir.join('sub-rel-volume-tissue-regions').read() == '.21052 .36842 .05263\n'
+    assert tmpdir.join('sub-rel-volume-all-regions').read() == (
+        '.52631 .31578 .15789 .10526 .05263 .84210 .47368 .21052 .10526 '
+        '.15789 .52631 .31578 .31578\n')
+
+
+def test_bc_quotient():
+    assert bc_quotient('2.000000', '9.500000') == '.21052'
+    assert bc_quotient('9.500000', '9.500000') == '1.00000'
+    assert bc_quotient('19.500000', '9.500000') == '2.05263'
+    assert bc_quotient('0.000001', '9.500000') == '0'
+    assert bc_quotient('-2', '9.5') == '-.21052'
+    assert bc_quotient('2', '0') == '-'
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+""" Helpers shared by the measurement engines """
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import OrderedDict
+from fractions import Fraction
+
+import numpy as np
+
+
+def read_super_structures(in_file):
+    """
+    Reads the super-structures definition file (``label_names/super-structures.csv``).
+
+    Each line has the form ``<super-structure> <col2> <col3> <col4> <col5>``, and
+    a super-structure may span several lines. For every super-structure, the labels
+    of each column are gathered (in file order), as done by ``cut -d' ' -f <col>``
+    in the original shell scripts.
+
+    :param str in_file: path to the super-structures file
+    :return: an ordered dictionary mapping each super-structure (sorted as
+      ``sort | uniq`` would) to a list with the four lists of labels of
+      columns 2 to 5.
+
+    """
+    rows = []
+    with open(in_file, 'r') as sfile:
+        for line in sfile:
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 5:
+                raise RuntimeError('Malformed line in %s: "%s"' % (in_file, line.strip()))
+            rows.append((fields[0], [int(f) for f in fields[1:]]))
+
+    supers = OrderedDict()
+    for sid in sorted(set(r[0] for r in rows)):
+        supers[sid] = [[labels[col] for ssid, labels in rows if ssid == sid]
+                       for col in range(4)]
+    return supers
+
+
+def read_dataset(in_file):
+    """
+    Reads the dataset CSV of the pipeline, with one line per session:
+    ``<subjectID>, <sessionID>, <age>``. The ``sub-`` and ``ses-`` prefixes
+    and the blanks around the fields are removed, empty lines are skipped.
+
+    :param str in_file: path to the dataset CSV
+    :return: a list of (subject, session, age) tuples
+
+    """
+    sessions = []
+    with open(in_file, 'r') as dfile:
+        for line in dfile:
+            if not line.strip():
+                continue
+            fields = [f.strip() for f in line.split(',')] + ['', '']
+            sessions.append((fields[0].replace('sub-', ''),
+                             fields[1].replace('ses-', ''), fields[2]))
+    return sessions
+
+
+def read_label_list(in_file):
+    """
+    Reads a list of labels, one or several per line, separated by white
+    spaces (e.g. ``$DRAWEMDIR/parameters/cortical.csv``)
+    """
+    with open(in_file, 'r') as lfile:
+        return [int(l) for l in lfile.read().split()]
+
+
+def write_values(values, out_file, fmt='%.5f'):
+    """ Writes a space-separated line of values to a file """
+    write_fields([format_value(v, fmt) for v in values], out_file)
+
+
+def write_fields(fields, out_file):
+    """ Writes a space-separated line of (formatted) fields to a file """
+    with open(out_file, 'w') as ofile:
+        ofile.write(' '.join(fields) + '\n')
+
+
+def format_value(value, fmt='%.5f'):
+    """ Formats a value, non-finite values are written as ``-`` """
+    if value is None or not np.isfinite(value):
+        return '-'
+    return fmt % value
+
+
+def bc_quotient(numerator, denominator, scale=5):
+    """
+    The quotient of two decimal numbers as printed by ``bc`` with ``scale``
+    (e.g. ``echo "scale=5;$l/$vol" | bc`` in the original shell scripts):
+    truncated to ``scale`` decimals, without the leading zero of the values
+    below 1, and ``0`` when it truncates to zero.
+
+    :param str numerator: the numerator, as written (e.g. ``'1234.500000'``)
+    :param str denominator: the denominator, as written
+    :param int scale: the number of decimals
+    :return: the quotient, ``-`` when the denominator is zero
+
+    """
+    numerator, denominator = Fraction(numerator), Fraction(denominator)
+    if denominator == 0:
+        return '-'
+    quotient = numerator / denominator
+    units = int(abs(quotient) * 10 ** scale)
+    if units == 0:
+        return '0'
+    intpart, decimals = divmod(units, 10 ** scale)
+    return '%s%s.%0*d' % ('-' if quotient < 0 else '', intpart or '', scale, decimals)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Volume-based measurements of the dHCP structural pipeline.
+
+All the regions, tissues and super-structures are computed from one
+:code:`np.bincount` of each label volume, replacing the per-structure
+``mirtk padding`` / ``fslstats -V`` loop of ``volume-measurements.sh``.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import nibabel as nb
+
+from .utils import read_super_structures, write_values, write_fields, bc_quotient
+
+# Format of the volumes, as printed by fslstats -V
+VOLUME_FMT = '%.6f'
+
+# Labels of the all-labels segmentation excluded from the brain volume
+# (lateral ventricles, CSF and extra-cranial background)
+NON_BRAIN_LABELS = [49, 50, 83, 84]
+
+
+def label_counts(in_file):
+    """
+    Reads a label volume and returns the number of voxels of each label
+    (indexed by label) and the volume of one voxel in mm^3.
+    """
+    nii = nb.load(in_file)
+    data = np.asanyarray(nii.dataobj)
+    if not np.issubdtype(data.dtype, np.integer):
+        data = np.rint(data)
+    data = data.astype(np.int64).ravel()
+    data = data[data > 0]
+    voxvol = float(np.prod(nii.header.get_zooms()[:3]))
+    return np.bincount(data), voxvol
+
+
+def region_volumes(counts, voxvol, labels=None):
+    """
+    Volume (mm^3) of each label. If ``labels`` is not given, the labels
+    present in the segmentation are reported (as ``mirtk measure-volume``).
+    """
+    if labels is None:
+        labels = np.flatnonzero(counts)
+        labels = labels[labels > 0]
+    labels = np.atleast_1d(np.array(labels, dtype=np.int64))
+    vols = np.zeros(len(labels), dtype=np.float64)
+    valid = labels < len(counts)
+    vols[valid] = counts[labels[valid]] * voxvol
+    return vols
+
+
+def volume_measures(all_labels, tissue_labels, super_structures=None,
+                    non_brain=None):
+    """
+    Computes the volume measurements of a subject.
+
+    :param str all_labels: path to the ``drawem_all_labels`` segmentation
+    :param str tissue_labels: path to the ``drawem_tissue_labels`` segmentation
+    :param str super_structures: path to the super-structures definition
+    :param list non_brain: labels of ``all_labels`` excluded from the brain volume
+    :return: a dictionary with the measures, keyed by output file suffix
+
+    """
+    if non_brain is None:
+        non_brain = NON_BRAIN_LABELS
+
+    counts, voxvol = label_counts(all_labels)
+    excluded = region_volumes(counts, voxvol, non_brain).sum()
+    brain = counts[1:].sum() * voxvol - excluded
+
+    tcounts, tvoxvol = label_counts(tissue_labels)
+    tissues = region_volumes(tcounts, tvoxvol)
+
+    regions = [region_volumes(counts, voxvol)]
+    if super_structures is not None:
+        for columns in read_super_structures(super_structures).values():
+            regions.append([region_volumes(counts, voxvol, col).sum()
+                            for col in columns])
+    regions = np.hstack(regions)
+
+    return {
+        'volume': np.array([brain]),
+        'volume-tissue-regions': tissues,
+        'rel-volume-tissue-regions': tissues / brain,
+        'volume-all-regions': regions,
+        'rel-volume-all-regions': regions / brain,
+    }
+
+
+def write_volume_measures(measures, out_prefix):
+    """
+    Writes the measures computed by :func:`volume_measures` to
+    ``<out_prefix>-<measure>`` files, one line each, as
+    ``volume-measurements.sh`` did: the volumes with 6 decimals, and the
+    relative volumes as ``bc`` (``scale=5``) computed them from the written
+    volumes, truncated (e.g. ``.12345``)
+
+    """
+    brain = VOLUME_FMT % measures['volume'][0]
+    out_files = []
+    for name, values in sorted(measures.items()):
+        out_file = '%s-%s' % (out_prefix, name)
+        if name.startswith('rel-'):
+            write_fields([bc_quotient(VOLUME_FMT % v, brain) for v in measures[name[4:]]],
+                         out_file)
+        else:
+            write_values(values, out_file, fmt=VOLUME_FMT)
+        out_files.append(out_file)
+    return out_files
@@ -15,3 +15,5 @@ metrics)` included within MRIQC.
 
 from .anatomical import *  # pylint: disable=wildcard-import
 from .functional import *  # pylint: disable=wildcard-import
+from .structural import structural_qc
+from .cohort import compute_cohort_qc
@@ -22,8 +22,147 @@ import numpy as np
 import scipy.ndimage as nd
 from scipy.stats import chi  # pylint: disable=E0611
 
+from .masks import TissueMasks, binary_opening_cropped
+
+# Maximum number of air voxels of the Chi fit of qi2
+QI2_MAX_SAMPLES = 100000
+# Maximum number of voxels read at once by tissue_stats
+CHUNK_SIZE = 1 << 20
+
 FSL_FAST_LABELS = {'csf': 1, 'gm': 2, 'wm': 3, 'bg': 0}
 
+def tissue_stats(img, seg, labels=None, percentiles=None, mask=None, chunk_size=CHUNK_SIZE):
+    """
+    Computes the statistics of the intensities of each label of a segmentation.
+
+    The volume is read over chunks of slices (last axis). The number of
+    voxels, sum and sum of squares of all the labels are accumulated with
+    one pass; the percentiles (if requested) are read from the intensities
+    of each label of interest, gathered with one more pass per label and
+    partitioned. The memory scales with ``chunk_size`` and the number of
+    voxels of the largest label, there is no copy of the whole volume.
+
+    :param numpy.ndarray img: input data
+    :param numpy.ndarray seg: segmentation, with non-negative integer labels
+    :param list labels: labels of interest (default: all the labels present)
+    :param list percentiles: percentiles computed for each label (e.g. ``[50]``)
+    :param numpy.ndarray mask: only the voxels within the mask are considered
+    :param int chunk_size: maximum number of voxels of a chunk (at least one slice)
+    :return: a dictionary with, for each label, a dictionary with the ``n``,
+      ``sum``, ``sumsq``, ``mean`` and ``std`` (with Bessel's correction) of
+      the intensities, and the ``percentiles`` (dictionary) if requested
+
+    """
+    seg = np.asanyarray(seg)
+    nbins = int(seg.max()) + 1 if seg.size else 1
+    if labels:
+        nbins = max(nbins, max(labels) + 1)
+
+    counts = np.zeros(nbins, dtype=np.int64)
+    sums = np.zeros(nbins)
+    sumsq = np.zeros(nbins)
+    for values, segvalues in _label_chunks(img, seg, mask, chunk_size):
+        counts += np.bincount(segvalues, minlength=nbins)
+        sums += np.bincount(segvalues, weights=values, minlength=nbins)
+        sumsq += np.bincount(segvalues, weights=np.square(values, dtype=np.float64),
+                             minlength=nbins)
+    if labels is None:
+        labels = [int(l) for l in np.nonzero(counts)[0]]
+
+    stats = {}
+    for label in labels:
+        nvox = int(counts[label])
+        entry = {'n': nvox, 'sum': float(sums[label]), 'sumsq': float(sumsq[label]),
+                 'mean': float(sums[label] / nvox) if nvox else np.nan}
+        entry['std'] = std_from_stats(entry)
+        if percentiles is not None:
+            values = _label_values(img, seg, mask, label, nvox, chunk_size)
+            entry['percentiles'] = dict(zip(percentiles, _partition_percentiles(values,
+                                                                                percentiles)))
+        stats[label] = entry
+    return stats
+
+
+def _label_chunks(img, seg, mask, chunk_size):
+    """
+    Iterates over the intensities and labels (raveled) of the voxels within
+    the mask of chunks of slices (last axis) of a volume
+    """
+    img = np.asanyarray(img)
+    slice_size = max(1, int(np.prod(seg.shape[:-1])))
+    nslices = max(1, chunk_size // slice_size)
+    for start in range(0, seg.shape[-1] if seg.ndim else 0, nslices):
+        slab = (Ellipsis, slice(start, start + nslices))
+        values = np.asarray(img[slab]).ravel()
+        segvalues = np.asarray(seg[slab]).ravel()
+        if mask is not None:
+            inmask = np.asarray(mask[slab]).ravel().astype(bool)
+            values = values[inmask]
+            segvalues = segvalues[inmask]
+        yield values, segvalues
+
+
+def _label_values(img, seg, mask, label, nvox, chunk_size):
+    """ The intensities of the ``nvox`` voxels of a label, gathered chunk by chunk """
+    values = np.empty(nvox, dtype=np.asanyarray(img).dtype)
+    start = 0
+    for chunk, segvalues in _label_chunks(img, seg, mask, chunk_size):
+        chunk = chunk[segvalues == label]
+        values[start:start + len(chunk)] = chunk
+        start += len(chunk)
+    return values
+
+
+def _partition_percentiles(values, percentiles):
+    """
+    The percentiles (linear interpolation, as :func:`numpy.percentile`) of
+    values, which are partitioned in place around the ranks of the percentiles
+    """
+    if not len(values):
+        return [np.nan] * len(percentiles)
+    positions = [p / 100. * (len(values) - 1) for p in percentiles]
+    bounds = [(int(np.floor(pos)), int(np.ceil(pos))) for pos in positions]
+    values.partition(sorted(set(r for b in bounds for r in b)))
+    return [float(values[lower]) + (float(values[upper]) - float(values[lower])) * (pos - lower)
+            for pos, (lower, upper) in zip(positions, bounds)]
+
+
+def std_from_stats(stats, center=None, ddof=1):
+    """
+    The standard deviation of the intensities from their number, sum and sum of
+    squares (see :func:`tissue_stats`), computed around their mean or ``center``.
+    """
+    nvox = stats['n']
+    if nvox - ddof <= 0:
+        return np.nan
+    if center is None:
+        center = stats['sum'] / nvox
+    sqdev = stats['sumsq'] - 2.0 * center * stats['sum'] + nvox * center ** 2
+    return float(np.sqrt(max(sqdev, 0.0) / (nvox - ddof)))
+
+
+def snr_from_stats(stats):
+    """ The :abbr:`SNR (Signal-to-Noise Ratio)` (see :func:`snr`) of a foreground region """
+    median = stats['percentiles'][50]
+    return float(median / std_from_stats(stats, center=median))
+
+
+def cnr_from_stats(stats, lbl=None):
+    """ The :abbr:`CNR (Contrast-to-Noise Ratio)` (see :func:`cnr`) from the tissue statistics """
+    if lbl is None:
+        lbl = FSL_FAST_LABELS
+    return float(np.abs(stats[lbl['gm']]['mean'] - stats[lbl['wm']]['mean']) /
+                 std_from_stats(stats[lbl['bg']], ddof=0))
+
+
+def cjv_from_stats(stats, lbl=None):
+    """ The :abbr:`CJV (coefficient of joint variation)` (see :func:`cjv`) from the tissue statistics """
+    if lbl is None:
+        lbl = FSL_FAST_LABELS
+    wm, gm = stats[lbl['wm']], stats[lbl['gm']]
+    return float((wm['std'] + gm['std']) / (wm['mean'] - gm['mean']))
+
+
 def snr(img, smask, nmask=None, erode=True, fglabel=1):
     r"""
     Calculate the :abbr:`SNR (Signal-to-Noise Ratio)`.
@@ -48,7 +187,8 @@ def snr(img, smask, nmask=None, erode=True, fglabel=1):
 
 
     :param numpy.ndarray img: input data
-    :param numpy.ndarray fgmask: input foreground mask or segmentation
+    :param numpy.ndarray fgmask: input foreground mask or segmentation, or
+      the :class:`~structural_dhcp_mriqc.qc.masks.TissueMasks` of the segmentation
     :param numpy.ndarray bgmask: input background mask or segmentation
     :param bool erode: erode masks before computations.
     :param str fglabel: foreground label in the segmentation data.
@@ -163,7 +303,7 @@ def fber(img, seg, air=None):
 
 
 
-def efc(img):
+def efc(img, slab_size=None):
     """
     Calculate the :abbr:`EFC (Entropy Focus Criterion)` [Atkinson1997]_.
     Uses the Shannon entropy of voxel intensities as an indication of ghosting
@@ -174,13 +314,17 @@ def efc(img):
     different dimensions.
 
     :param numpy.ndarray img: input data
+    :param int slab_size: if set, the image is streamed in slabs of this number
+      of slices (last axis), so that the temporaries of the computation are
+      bounded by the size of a slab (see :func:`efc_streamed`)
 
     """
+    if slab_size:
+        return efc_streamed(img, slab_size)
 
     # Calculate the maximum value of the EFC (which occurs any time all
     # voxels have the same value)
-    efc_max = 1.0 * np.prod(img.shape) * (1.0 / np.sqrt(np.prod(img.shape))) * \
-                np.log(1.0 / np.sqrt(np.prod(img.shape)))
+    efc_max = _efc_max(img.shape)
 
     # Calculate the total image energy
     b_max = np.sqrt((img**2).sum())
@@ -189,6 +333,36 @@ def efc(img):
     return float((1.0 / efc_max) * np.sum((img / b_max) * np.log((img + 1e-16) / b_max)))
 
 
+def _efc_max(shape):
+    return 1.0 * np.prod(shape) * (1.0 / np.sqrt(np.prod(shape))) * \
+        np.log(1.0 / np.sqrt(np.prod(shape)))
+
+
+def _slabs(img, slab_size):
+    """ Slabs of ``slab_size`` slices (last axis) of an image, as float64 copies """
+    for start in range(0, img.shape[-1], slab_size):
+        yield np.array(img[..., start:start + slab_size], dtype=np.float64)
+
+
+def efc_streamed(img, slab_size=8):
+    """
+    Calculate the :abbr:`EFC (Entropy Focus Criterion)` as :func:`efc`, with
+    two passes over slabs of the image: one for the total energy and one for
+    the entropy. Slabs are taken along the last axis, the contiguous one of
+    (Fortran-ordered) NIfTI data, so memory-mapped images are read sequentially.
+
+    :param numpy.ndarray img: input data
+    :param int slab_size: number of slices of a slab
+
+    """
+    b_max = np.sqrt(sum(np.square(slab).sum() for slab in _slabs(img, slab_size)))
+    entropy = 0.0
+    for slab in _slabs(img, slab_size):
+        slab /= b_max
+        entropy += np.sum(slab * np.log(slab + 1e-16 / b_max))
+    return float(entropy / _efc_max(img.shape))
+
+
 def art_qi1(airmask, artmask):
     """
     Detect artifacts in the image using the method described in [Mortamet2009]_.
@@ -205,14 +379,22 @@ def art_qi1(airmask, artmask):
     return float(artmask.sum() / float(airmask.sum() + artmask.sum()))
 
 
-def art_qi2(img, airmask, artmask, ncoils=1):
+def art_qi2(img, airmask, artmask, ncoils=1, max_samples=QI2_MAX_SAMPLES, seed=0):
     """
     Calculates **qi2**, the distance between the distribution
     of noise voxel (non-artifact background voxels) intensities, and a
     centered Chi distribution.
 
+    The Chi distribution is fitted on a random subsample of the air voxels
+    (at most ``max_samples``, drawn reproducibly with ``seed``), as the fit
+    on all of them (tens of millions of voxels) dominates the computation.
+
     :param numpy.ndarray img: input data
     :param numpy.ndarray airmask: input air mask without artifacts
+    :param numpy.ndarray artmask: input artifacts mask
+    :param int ncoils: number of coils (initial estimate of the degrees of freedom)
+    :param int max_samples: maximum number of voxels of the fit (``None``: all)
+    :param int seed: seed of the random subsample
 
     """
 
@@ -220,20 +402,21 @@ def art_qi2(img, airmask, artmask, ncoils=1):
     data = img[airmask > 0]
     # Estimate data pdf
     hist, bin_edges = np.histogram(data, density=True, bins=128)
-    bin_centers = [np.mean(bin_edges[i:i+1]) for i in range(len(bin_edges)-1)]
+    bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
     max_pos = np.argmax(hist)
 
     # Fit central chi distribution
-    param = chi.fit(data, 2*ncoils, loc=bin_centers[max_pos])
+    sample = data
+    if max_samples is not None and data.size > max_samples:
+        sample = data[np.random.RandomState(seed).choice(data.size, max_samples,
+                                                         replace=False)]
+    param = chi.fit(sample, 2*ncoils, loc=bin_centers[max_pos])
     pdf_fitted = chi.pdf(bin_centers, *param[:-2], loc=param[-2], scale=param[-1])
 
     # Find t2 (intensity at half width, right side)
     ihw = 0.5 * hist[max_pos]
-    t2idx = 0
-    for i in range(max_pos + 1, len(bin_centers)):
-        if hist[i] < ihw:
-            t2idx = i
-            break
+    below = np.flatnonzero(hist[max_pos + 1:] < ihw)
+    t2idx = max_pos + 1 + below[0] if below.size else 0
 
     # Compute goodness-of-fit (gof)
     gof = np.abs(hist[t2idx:] - pdf_fitted[t2idx:]).sum() / airmask.sum()
@@ -289,14 +472,17 @@ def summary_stats(img, pvms):
     p95 = {}
     p05 = {}
 
-    if np.array(pvms).ndim == 4:
-        pvms.insert(0, np.array(pvms).sum(axis=0))
-    elif np.array(pvms).ndim == 3:
-        bgpvm = np.ones_like(pvms)
-        pvms = [bgpvm - pvms, pvms]
+    # The maps are not stacked into a single array, nor is the input list modified
+    ndim = pvms.ndim if isinstance(pvms, np.ndarray) else np.ndim(pvms[0]) + 1
+    if ndim == 4:
+        total = np.zeros(np.shape(pvms[0]), dtype=np.float32)
+        for pvm in pvms:
+            total += pvm
+        pvms = [total] + list(pvms)
+    elif ndim == 3:
+        pvms = [1. - pvms, pvms]
     else:
-        raise RuntimeError('Incorrect image dimensions (%d)' %
-            np.array(pvms).ndim)
+        raise RuntimeError('Incorrect image dimensions (%d)' % ndim)
 
     if len(pvms) == 4:
         labels = list(FSL_FAST_LABELS.items())
@@ -305,30 +491,30 @@ def summary_stats(img, pvms):
 
     for k, lid in labels:
         im_lid = pvms[lid] * img
-        mean[k] = float(im_lid[im_lid > 0].mean())
-        stdv[k] = float(im_lid[im_lid > 0].std())
-        p95[k] = float(np.percentile(im_lid[im_lid > 0], 95))
-        p05[k] = float(np.percentile(im_lid[im_lid > 0], 5))
+        im_lid = im_lid[im_lid > 0]
+        mean[k] = float(im_lid.mean())
+        stdv[k] = float(im_lid.std())
+        p05[k], p95[k] = [float(v) for v in np.percentile(im_lid, [5, 95])]
 
     return mean, stdv, p95, p05
 
 def _prepare_mask(mask, label, erode=True):
-    fgmask = mask.copy()
-
-    if np.issubdtype(fgmask.dtype, np.integer):
+    if isinstance(mask, TissueMasks):
         if isinstance(label, string_types):
             label = FSL_FAST_LABELS[label]
+        return mask.opened(label) if erode else mask.mask(label)
 
-        fgmask[fgmask != label] = 0
-        fgmask[fgmask == label] = 1
-    else:
-        fgmask[fgmask > .95] = 1.
-        fgmask[fgmask < 1.] = 0
+    if np.issubdtype(mask.dtype, np.integer):
+        if isinstance(label, string_types):
+            label = FSL_FAST_LABELS[label]
+        return TissueMasks(mask, labels=[label], erode=erode).opened(label) if erode \
+            else mask == label
 
+    fgmask = mask > .95
     if erode:
         # Create a structural element to be used in an opening operation.
         struc = nd.generate_binary_structure(3, 2)
-        # Perform an opening operation on the background data.
-        fgmask = nd.binary_opening(fgmask, structure=struc).astype(np.uint8)
+        # Perform an opening operation on the background data, within its bounding box
+        fgmask = binary_opening_cropped(fgmask, structure=struc)
 
     return fgmask
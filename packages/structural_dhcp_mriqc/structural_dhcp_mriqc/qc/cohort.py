@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Anatomical :abbr:`QC (Quality Control)` measures of a whole cohort, computed
+in a pool of processes without building a nipype workflow.
+
+The images of the next scans are read (and converted into the image cache,
+see :mod:`structural_dhcp_mriqc.utils.images`) by a prefetching thread while
+the workers compute the measures of the current ones, and the measures are
+streamed to a csv file as they are computed. The images converted by a run
+are removed at its end.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import csv
+import warnings
+from collections import OrderedDict, deque
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from six import string_types
+import pandas as pd
+
+from .structural import (structural_qc, prefetch_structural_qc, flatten_dict, STRUCTURAL_MEASURES,
+                         AIR_MEASURES, ARTIFACT_MEASURES, TIME_MEASURES)
+from ..utils.images import temporary_image_cache
+
+# Fields of the entries of a manifest, in the order of the tuples
+MANIFEST_FIELDS = ['in_file', 'in_segm', 'in_bias', 'in_pvms']
+OPTIONAL_FIELDS = ['in_noinu', 'air_msk', 'artifact_msk']
+ID_FIELDS = ['subject_id', 'session_id', 'run_id']
+
+
+def _manifest_entry(entry):
+    """
+    An entry of a manifest as a dictionary: a tuple (image, segmentation, bias, pvms)
+    or a dictionary with these fields, and optionally ``in_noinu``, ``air_msk``,
+    ``artifact_msk`` and the IDs
+    of the scan (``subject_id``, ``session_id``, ``run_id``)
+    """
+    if not isinstance(entry, dict):
+        entry = dict(zip(MANIFEST_FIELDS, entry))
+    missing = [f for f in MANIFEST_FIELDS if f not in entry]
+    if missing:
+        raise RuntimeError('Manifest entry %s is missing %s' % (entry, ', '.join(missing)))
+    entry = dict(entry)
+    if isinstance(entry['in_pvms'], string_types):
+        entry['in_pvms'] = [entry['in_pvms']]
+    return entry
+
+
+def _qc_args(entry):
+    return ((entry['in_file'], entry['in_segm'], entry['in_bias'], entry['in_pvms']),
+            {k: entry.get(k) for k in OPTIONAL_FIELDS})
+
+
+def _prefetch(entry):
+    args, kwargs = _qc_args(entry)
+    try:
+        prefetch_structural_qc(*args, **kwargs)
+    except Exception:  # pylint: disable=W0703
+        # Errors are reported by the computation
+        pass
+    return entry
+
+
+def _csv_fields(entries):
+    """
+    The columns of the csv file: the IDs, the image and all the measures that
+    the entries can have
+    """
+    measures = STRUCTURAL_MEASURES + TIME_MEASURES
+    if any(entry.get('air_msk') for entry in entries):
+        measures = measures + AIR_MEASURES
+        if any(entry.get('air_msk') and entry.get('artifact_msk') for entry in entries):
+            measures = measures + ARTIFACT_MEASURES
+    return ([f for f in ID_FIELDS if any(f in entry for entry in entries)] + ['in_file'] +
+            sorted(measures))
+
+
+def _cohort_worker(task):
+    entry, efc_slab = task
+    row = OrderedDict((f, entry[f]) for f in ID_FIELDS if f in entry)
+    row['in_file'] = entry['in_file']
+    args, kwargs = _qc_args(entry)
+    try:
+        measures = flatten_dict(structural_qc(*args, efc_slab=efc_slab, **kwargs))
+    except Exception as exc:  # pylint: disable=W0703
+        return row, '%s: %s' % (entry['in_file'], exc)
+    for key in sorted(measures):
+        row[key] = measures[key]
+    return row, None
+
+
+def compute_cohort_qc(manifest, n_jobs=1, out_file=None, efc_slab=None, prefetch=True):
+    """
+    Computes the anatomical QC measures of the scans of a cohort.
+
+    :param list manifest: the scans, tuples (image, segmentation, bias, pvms)
+      or dictionaries with the fields ``in_file``, ``in_segm``, ``in_bias`` and
+      ``in_pvms``, and optionally ``in_noinu``, ``air_msk``, ``artifact_msk``
+      (see :func:`~structural_dhcp_mriqc.qc.structural.structural_qc`),
+      ``subject_id``, ``session_id`` and ``run_id`` (written to the results)
+    :param int n_jobs: number of worker processes (0: number of CPUs)
+    :param str out_file: csv file to which the measures are written as they
+      are computed
+    :param int efc_slab: compute the EFC over slabs of this number of slices
+    :param bool prefetch: read the images of the next scans while the measures
+      of the current ones are computed
+    :return: a :class:`pandas.DataFrame` with the measures of the scans, in
+      the order of the manifest (scans that failed are reported with a warning
+      and left out)
+
+    """
+    entries = [_manifest_entry(entry) for entry in manifest]
+    if not entries:
+        return pd.DataFrame()
+    n_jobs = max(1, min(n_jobs or cpu_count(), len(entries)))
+
+    with temporary_image_cache():
+        prefetcher = ThreadPool(1) if prefetch else None
+        pool = Pool(n_jobs) if n_jobs > 1 else None
+        try:
+            rows = _stream_rows(_schedule(entries, efc_slab, pool, prefetcher, n_jobs),
+                                out_file, _csv_fields(entries))
+        except BaseException:
+            for workers in [pool, prefetcher]:
+                if workers is not None:
+                    workers.terminate()
+            raise
+        for workers in [pool, prefetcher]:
+            if workers is not None:
+                workers.close()
+                workers.join()
+    return pd.DataFrame(rows)
+
+
+def _schedule(entries, efc_slab, pool, prefetcher, n_jobs):
+    """
+    Computes the measures of the entries (in ``pool`` if any), with at most
+    ``n_jobs`` computations running and the images of the next ``n_jobs``
+    entries being prefetched (by ``prefetcher`` if any). Yields the results
+    in the order of the entries.
+    """
+    pending = iter(entries)
+    prefetched = deque()
+    running = deque()
+
+    def _top_up():
+        while len(prefetched) < n_jobs:
+            entry = next(pending, None)
+            if entry is None:
+                return
+            prefetched.append(prefetcher.apply_async(_prefetch, (entry,))
+                              if prefetcher is not None else entry)
+
+    _top_up()
+    while prefetched or running:
+        while prefetched and len(running) < n_jobs:
+            entry = prefetched.popleft()
+            if prefetcher is not None:
+                entry = entry.get()
+            # the next entries are prefetched while this one is computed
+            _top_up()
+            task = (entry, efc_slab)
+            running.append(pool.apply_async(_cohort_worker, (task,)) if pool is not None
+                           else _cohort_worker(task))
+        result = running.popleft()
+        yield result.get() if pool is not None else result
+
+
+def _stream_rows(results, out_file=None, fieldnames=None):
+    """
+    Collects the rows of the results, writing them to ``out_file`` (with the
+    columns ``fieldnames``) as they come; a row with other columns is an error
+    """
+    rows = []
+    csvfile = writer = None
+    try:
+        if out_file:
+            csvfile = open(out_file, 'w')
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, restval='')
+            writer.writeheader()
+        for row, error in results:
+            if error is not None:
+                warnings.warn('QC measures could not be computed for %s' % error)
+                continue
+            if writer is not None:
+                writer.writerow(row)
+                csvfile.flush()
+            rows.append(row)
+    finally:
+        if csvfile is not None:
+            csvfile.close()
+    return rows
@@ -18,8 +18,9 @@ Computation of the quality assessment measures on functional MRI
 import os.path as op
 import numpy as np
 import nibabel as nb
-from nitime import algorithms as nta
-import scipy
+
+# Maximum number of values of the chunks of the functional datasets
+CHUNK_SIZE = 1 << 22
 
 
 def gsr(epi_data, mask, direction="y", ref_file=None, out_file=None):
@@ -104,7 +105,7 @@ def gsr(epi_data, mask, direction="y", ref_file=None, out_file=None):
     return float(ghost/signal)
 
 
-def dvars(func, mask, output_all=False, out_file=None):
+def dvars(func, mask, output_all=False, out_file=None, chunk_size=CHUNK_SIZE):
     """
     Compute the mean :abbr:`DVARS (D referring to temporal
     derivative of timecourses, VARS referring to RMS variance over voxels)`
@@ -116,16 +117,23 @@ def dvars(func, mask, output_all=False, out_file=None):
 
     .. note:: Implementation details
 
-      Uses the implementation of the `Yule-Walker equations
-      from nitime
+      The :abbr:`AR (auto-regressive)` filtering of the fMRI signal uses the
+      solution of the order-1 Yule-Walker equations, the lag-1 autocorrelation
+      of each voxel (as the `implementation from nitime
       <http://nipy.org/nitime/api/generated/nitime.algorithms.autoregressive.html\
-#nitime.algorithms.autoregressive.AR_est_YW>`_
-      for the :abbr:`AR (auto-regressive)` filtering of the fMRI signal.
+#nitime.algorithms.autoregressive.AR_est_YW>`_), computed for all the
+      voxels at once.
+
+      The time series are read over chunks of slices of the dataset (see
+      :func:`masked_time_series`), the standard deviations over the voxels
+      are accumulated chunk by chunk, so that the memory scales with
+      ``chunk_size`` and not with the size of the dataset.
 
     :param numpy.ndarray func: functional data, after head-motion-correction.
     :param numpy.ndarray mask: a 3D mask of the brain
     :param bool output_all: write out all dvars
     :param str out_file: a path to which the standardized dvars should be saved.
+    :param int chunk_size: maximum number of values of a chunk
     :return: the standardized DVARS
 
     """
@@ -134,38 +142,56 @@ def dvars(func, mask, output_all=False, out_file=None):
             "Input fMRI dataset should be 4-dimensional" % func)
 
     # Remove zero-variance voxels across time axis
-    zv_mask = zero_variance(func, mask)
-    idx = np.where(zv_mask > 0)
-    mfunc = func[idx[0], idx[1], idx[2], :]
+    zv_mask = zero_variance(func, mask, chunk_size)
 
     # Robust standard deviation
-    func_sd = (np.percentile(mfunc, 75) -
-               np.percentile(mfunc, 25)) / 1.349
-
-    # Demean
-    mfunc -= mfunc.mean(axis=1)[..., np.newaxis]
-
-    # AR1
-    ak_coeffs = np.apply_along_axis(nta.AR_est_YW, 1, mfunc, 1)
-
-    # Predicted standard deviation of temporal derivative
-    func_sd_pd = np.squeeze(np.sqrt((2 * (1 - ak_coeffs[:, 0])).tolist()) * func_sd)
+    pct75, pct25 = masked_percentiles(func, zv_mask, [75, 25], chunk_size)
+    func_sd = (pct75 - pct25) / 1.349
+
+    nvoxels = 0
+    diff_mean = np.zeros(func.shape[-1] - 1)
+    diff_m2 = np.zeros(func.shape[-1] - 1)
+    sd_factors = []
+    vx_stdz = []
+    vx_index = []
+    for slab, inmask, mfunc in masked_time_series(func, zv_mask, chunk_size):
+        # Demean
+        mfunc -= mfunc.mean(axis=1)[..., np.newaxis]
+
+        # AR1, predicted standard deviation of temporal derivative (in units of func_sd)
+        factors = np.sqrt(2 * (1 - ar1_coeffs(mfunc)))
+        sd_factors.append(factors)
+
+        # Compute temporal difference time series
+        func_diff = np.diff(mfunc, axis=1)
+
+        # Mean and sum of squared deviations over the voxels, merged with the previous chunks
+        chunk_mean = func_diff.mean(axis=0)
+        chunk_m2 = np.square(func_diff - chunk_mean).sum(axis=0)
+        total = nvoxels + len(func_diff)
+        delta = chunk_mean - diff_mean
+        diff_mean += delta * len(func_diff) / total
+        diff_m2 += chunk_m2 + np.square(delta) * nvoxels * len(func_diff) / total
+        nvoxels = total
+
+        if output_all:
+            # voxelwise standardization
+            vx_stdz.append((func_diff / (factors * func_sd)[:, np.newaxis]).std(1, ddof=1))
+            i, j, k = np.nonzero(inmask)
+            vx_index.append(np.ravel_multi_index((i, j, k + slab[2].start), mask.shape))
+
+    func_sd_pd = np.concatenate(sd_factors) * func_sd
     diff_sd_mean = func_sd_pd[func_sd_pd > 0].mean()
 
-    # Compute temporal difference time series
-    func_diff = np.diff(mfunc, axis=1)
-
     # DVARS (no standardization)
-    dvars_nstd = func_diff.std(axis=0)
+    dvars_nstd = np.sqrt(diff_m2 / nvoxels)
 
     # standardization
     dvars_stdz = dvars_nstd / diff_sd_mean
 
-    # voxelwise standardization
-    diff_vx_stdz = func_diff / np.array([func_sd_pd] * func_diff.shape[-1]).T
-    dvars_vx_stdz = diff_vx_stdz.std(1, ddof=1)
-
     if output_all:
+        # in the order of the voxels in the volume
+        dvars_vx_stdz = np.concatenate(vx_stdz)[np.argsort(np.concatenate(vx_index))]
         gendvars = np.vstack((dvars_stdz, dvars_nstd, dvars_vx_stdz))
     else:
         gendvars = dvars_stdz.reshape(len(dvars_stdz), 1)
@@ -176,6 +202,21 @@ def dvars(func, mask, output_all=False, out_file=None):
     return gendvars
 
 
+def ar1_coeffs(mfunc):
+    """
+    The coefficients of the order-1 :abbr:`AR (auto-regressive)` model of
+    time series (the solution of the Yule-Walker equations, i.e. their lag-1
+    autocorrelation), computed for all the series at once.
+
+    :param numpy.ndarray mfunc: demeaned time series (one per row)
+    :return: the coefficient of each time series
+
+    """
+    lag0 = np.einsum('ij,ij->i', mfunc, mfunc)
+    lag1 = np.einsum('ij,ij->i', mfunc[:, 1:], mfunc[:, :-1])
+    return lag1 / lag0
+
+
 def fd_jenkinson(in_file, rmax=80., out_file=None):
     """
     Compute the :abbr:`FD (framewise displacement)` [Jenkinson2002]_
@@ -200,9 +241,6 @@ def fd_jenkinson(in_file, rmax=80., out_file=None):
 
     """
 
-    import sys
-    import math
-
     if out_file is None:
         fname, ext = op.splitext(op.basename(in_file))
         out_file = op.abspath('%s_fdfile%s' % (fname, ext))
@@ -212,69 +250,173 @@ def fd_jenkinson(in_file, rmax=80., out_file=None):
     if 'rel.rms' in in_file:
         return in_file
 
-    pm_ = np.genfromtxt(in_file)
-    original_shape = pm_.shape
-    pm = np.zeros((pm_.shape[0], pm_.shape[1] + 4))
-    pm[:, :original_shape[1]] = pm_
-    pm[:, original_shape[1]:] = [0.0, 0.0, 0.0, 1.0]
-
-    # rigid body transformation matrix
-    T_rb_prev = np.matrix(np.eye(4))
-
-    flag = 0
-    X = [0]  # First timepoint
-    for i in range(0, pm.shape[0]):
-        # making use of the fact that the order of aff12 matrix is "row-by-row"
-        T_rb = np.matrix(pm[i].reshape(4, 4))
-
-        if flag == 0:
-            flag = 1
-        else:
-            M = np.dot(T_rb, T_rb_prev.I) - np.eye(4)
-            A = M[0:3, 0:3]
-            b = M[0:3, 3]
-
-            FD_J = math.sqrt(
-                (rmax * rmax / 5) * np.trace(np.dot(A.T, A)) + np.dot(b.T, b))
-            X.append(FD_J)
-
-        T_rb_prev = T_rb
+    # making use of the fact that the order of aff12 matrix is "row-by-row"
+    pm_ = np.atleast_2d(np.genfromtxt(in_file))
+    rigid = np.zeros((pm_.shape[0], 4, 4))
+    rigid[:, :3, :] = pm_.reshape(-1, 3, 4)
+    rigid[:, 3, 3] = 1.0
+
+    # rigid body transformations relative to the previous timepoint, all at once
+    M = np.matmul(rigid[1:], np.linalg.inv(rigid[:-1])) - np.eye(4)
+    A = M[:, 0:3, 0:3]
+    b = M[:, 0:3, 3]
+
+    # trace(A^T A) is the sum of the squares of A
+    FD_J = np.sqrt((rmax * rmax / 5) * np.square(A).sum(axis=(1, 2)) +
+                   np.square(b).sum(axis=1))
+    X = np.hstack(([0], FD_J))  # First timepoint
     np.savetxt(out_file, X)
     return out_file
 
 
-def gcor(func, mask):
+def gcor(func, mask, chunk_size=CHUNK_SIZE):
     """
     Compute the :abbr:`GCOR (global correlation)`.
 
+    The z-scored time series of the voxels are summed over chunks of slices
+    of the dataset (see :func:`masked_time_series`), so that the memory
+    scales with ``chunk_size`` and not with the size of the dataset.
+
     :param numpy.ndarray func: input fMRI dataset, after motion correction
     :param numpy.ndarray mask: 3D brain mask
+    :param int chunk_size: maximum number of values of a chunk
     :return: the computed GCOR value
 
     """
-    # Remove zero-variance voxels across time axis
-    tv_mask = zero_variance(func, mask)
-    idx = np.where(tv_mask > 0)
-    zscores = scipy.stats.mstats.zscore(func[idx[0], idx[1], idx[2], :], axis=1)
-    avg_ts = zscores.mean(axis=0)
+    sum_ts = np.zeros(func.shape[-1])
+    nvoxels = 0
+    for _, _, series in masked_time_series(func, mask, chunk_size):
+        # Remove zero-variance voxels across time axis
+        series -= series.mean(axis=1)[:, np.newaxis]
+        stdev = series.std(axis=1)
+        nonzero = stdev > 0
+        sum_ts += (series[nonzero] / stdev[nonzero, np.newaxis]).sum(axis=0)
+        nvoxels += int(nonzero.sum())
+    avg_ts = sum_ts / nvoxels
     return float(avg_ts.transpose().dot(avg_ts) / len(avg_ts))
 
-def zero_variance(func, mask):
+
+def zero_variance(func, mask, chunk_size=CHUNK_SIZE):
     """
     Mask out voxels with zero variance across t-axis
 
     :param numpy.ndarray func: input fMRI dataset, after motion correction
     :param numpy.ndarray mask: 3D brain mask
+    :param int chunk_size: maximum number of values of a chunk of the dataset
+      (see :func:`masked_time_series`)
     :return: the 3D mask of voxels with nonzero variance across :math:`t`.
     :rtype: numpy.ndarray
 
     """
-    idx = np.where(mask > 0)
-    func = func[idx[0], idx[1], idx[2], :]
-    tvariance = func.var(axis=1)
-    tv_mask = np.zeros_like(tvariance)
-    tv_mask[tvariance > 0] = 1
-
     newmask = np.zeros_like(mask)
-    newmask[idx] = tv_mask
+    for slab, inmask, series in masked_time_series(func, mask, chunk_size):
+        newmask[slab][inmask] = series.var(axis=1) > 0
     return newmask
+
+
+def masked_time_series(func, mask, chunk_size=CHUNK_SIZE):
+    """
+    Iterates over the time series of the voxels of a mask, in chunks of slices
+    (last spatial axis) of the dataset. A memory-mapped dataset is read one
+    chunk at a time.
+
+    :param numpy.ndarray func: input fMRI dataset
+    :param numpy.ndarray mask: 3D brain mask
+    :param int chunk_size: maximum number of values of a chunk (at least one slice)
+    :return: an iterator over tuples with the slices of the chunk (index of the
+      3D volume), the mask within the chunk and the (float64) time series of
+      the voxels of the mask within the chunk (one per row)
+
+    """
+    slice_size = int(np.prod(func.shape[:2])) * func.shape[-1]
+    nslices = max(1, chunk_size // slice_size)
+    for start in range(0, func.shape[2], nslices):
+        slab = (slice(None), slice(None), slice(start, start + nslices))
+        inmask = mask[slab] > 0
+        if not inmask.any():
+            continue
+        yield slab, inmask, np.asarray(func[slab][inmask], dtype=np.float64)
+
+
+def masked_percentiles(func, mask, percentiles, chunk_size=CHUNK_SIZE, nbins=1024):
+    """
+    Exact percentiles (linear interpolation, as :func:`numpy.percentile`) of
+    the values of the voxels of a mask, read over chunks of the dataset (see
+    :func:`masked_time_series`). The values of the ranks of the percentiles
+    are found by refining histograms of the values, until at most
+    ``chunk_size`` values are left to sort.
+
+    :param numpy.ndarray func: input fMRI dataset
+    :param numpy.ndarray mask: 3D brain mask
+    :param list percentiles: the percentiles (between 0 and 100)
+    :param int chunk_size: maximum number of values of a chunk
+    :param int nbins: number of bins of the histograms
+    :return: the list of the percentiles
+
+    """
+    def chunks():
+        for _, _, series in masked_time_series(func, mask, chunk_size):
+            yield series.ravel()
+
+    nvalues = 0
+    low, high = np.inf, -np.inf
+    for values in chunks():
+        nvalues += values.size
+        low = min(low, values.min())
+        high = max(high, values.max())
+    if nvalues == 0:
+        raise RuntimeError('Percentiles of an empty mask')
+
+    positions = [q / 100. * (nvalues - 1) for q in percentiles]
+    ranks = set([int(np.floor(p)) for p in positions] + [int(np.ceil(p)) for p in positions])
+    kth = {}
+    for rank in sorted(ranks):
+        if rank not in kth:
+            below, values = _rank_values(chunks, rank, low, high, nvalues, chunk_size, nbins)
+            # the other ranks within the sorted values
+            for other in ranks:
+                if below <= other < below + len(values):
+                    kth[other] = values[other - below]
+
+    result = []
+    for pos in positions:
+        lower, upper = kth[int(np.floor(pos))], kth[int(np.ceil(pos))]
+        result.append(lower + (upper - lower) * (pos - np.floor(pos)))
+    return result
+
+
+def _rank_values(chunks, rank, low, high, count, chunk_size, nbins):
+    """
+    The sorted values of an interval of values containing the value of a
+    rank, and the number of values lower than the interval.
+    """
+    below = 0
+    closed = True  # the interval includes high
+    while count > chunk_size and low < high:
+        edges = np.linspace(low, high, nbins + 1)
+        counts = np.zeros(nbins, dtype=np.int64)
+        for values in chunks():
+            values = _within(values, low, high, closed)
+            bins = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, nbins - 1)
+            counts += np.bincount(bins, minlength=nbins)
+        cumulated = np.cumsum(counts)
+        index = int(np.searchsorted(cumulated, rank - below, side='right'))
+        interval = (edges[index], edges[index + 1] if index < nbins - 1 else high,
+                    closed and index == nbins - 1)
+        if interval == (low, high, closed):
+            # the bins cannot be refined
+            break
+        below += int(cumulated[index] - counts[index])
+        count = int(counts[index])
+        low, high, closed = interval
+
+    if low == high:
+        return below, np.full(count, low)
+    values = np.sort(np.concatenate([_within(v, low, high, closed) for v in chunks()]))
+    return below, values
+
+
+def _within(values, low, high, closed):
+    if closed:
+        return values[(values >= low) & (values <= high)]
+    return values[(values >= low) & (values < high)]
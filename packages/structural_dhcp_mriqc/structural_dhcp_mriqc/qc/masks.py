@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Binary masks (and their morphological openings) of the labels of a
+segmentation, computed at once from a single label volume.
+
+The bounding boxes of all the labels are found with one pass over the
+volume (:func:`label_bboxes`), and each mask is stored cropped to its
+bounding box and packed (one bit per voxel), so that keeping the masks of
+all the tissues of a session costs a fraction of one copy of the
+segmentation. Morphological operations are run within the (padded)
+bounding boxes only.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import OrderedDict
+import numpy as np
+import scipy.ndimage as nd
+
+
+def label_bboxes(segmentation, labels=None, pad=0):
+    """
+    The bounding boxes of the labels of a segmentation, from a single pass
+    over the volume, so that they can be shared by all the operations on
+    the masks of the labels.
+
+    >>> seg = np.zeros((10, 10, 10), dtype=np.uint8)
+    >>> seg[2:5, 3:6, 4:7] = 2
+    >>> bboxes = label_bboxes(seg, pad=1)
+    >>> list(bboxes.keys()), bboxes[2]
+    ([2], (slice(1, 6, None), slice(2, 7, None), slice(3, 8, None)))
+
+    :param numpy.ndarray segmentation: the segmentation, with non-negative integer labels
+    :param list labels: the labels (default: all the labels present in the segmentation)
+    :param int pad: padding of the bounding boxes (clipped to the volume)
+    :return: an ordered dictionary with the bounding box (tuple of slices) of
+      each label, ``None`` for labels not present in the segmentation (the
+      bounding box of the background 0 is the whole volume)
+
+    """
+    seg = np.asanyarray(segmentation)
+    if seg.dtype == np.bool_:
+        seg = seg.view(np.uint8)
+    objects = nd.find_objects(seg)
+    if labels is None:
+        labels = [lid + 1 for lid, obj in enumerate(objects) if obj is not None]
+    bboxes = OrderedDict()
+    for label in labels:
+        label = int(label)
+        if label == 0:
+            bboxes[label] = tuple(slice(0, s) for s in seg.shape)
+        elif label <= len(objects) and objects[label - 1] is not None:
+            bboxes[label] = pad_bbox(objects[label - 1], pad, seg.shape)
+        else:
+            bboxes[label] = None
+    return bboxes
+
+
+def mask_bbox(mask, pad=0):
+    """
+    The (padded) bounding box of a binary mask, ``None`` if the mask is empty.
+    """
+    mask = np.asanyarray(mask)
+    if mask.dtype != np.bool_:
+        mask = mask != 0
+    return label_bboxes(mask, labels=[1], pad=pad)[1]
+
+
+def pad_bbox(bbox, pad, shape):
+    """ Pads a bounding box, clipped to an image shape """
+    if not pad:
+        return bbox
+    return tuple(slice(max(0, sl.start - pad), min(size, sl.stop + pad))
+                 for sl, size in zip(bbox, shape))
+
+
+def binary_opening_cropped(mask, structure=None):
+    """
+    The morphological opening of a binary mask, computed within its bounding
+    box only: the opening is contained in the mask, so the result is the
+    same as on the whole volume.
+    """
+    mask = np.asanyarray(mask, dtype=np.bool_)
+    opened = np.zeros(mask.shape, dtype=np.bool_)
+    bbox = mask_bbox(mask)
+    if bbox is not None:
+        if structure is None:
+            structure = nd.generate_binary_structure(mask.ndim, 2)
+        opened[bbox] = nd.binary_opening(mask[bbox], structure=structure)
+    return opened
+
+
+class _PackedMask(object):
+    """ A binary mask cropped to a bounding box and packed to bits """
+
+    def __init__(self, mask, bbox):
+        self.bbox = bbox
+        self.shape = mask.shape
+        self.count = int(np.count_nonzero(mask))
+        self.bits = np.packbits(mask, axis=None)
+
+    def unpack(self):
+        size = int(np.prod(self.shape))
+        return np.unpackbits(self.bits, count=size).view(np.bool_).reshape(self.shape)
+
+
+class TissueMasks(object):
+    """
+    The binary masks of the labels of a segmentation.
+
+    >>> seg = np.zeros((10, 10, 10), dtype=np.uint8)
+    >>> seg[2:8, 2:8, 2:8] = 3
+    >>> seg[0, 0, 0] = 2
+    >>> masks = TissueMasks(seg, labels=[2, 3])
+    >>> int(masks.mask(3).sum()), int(masks.opened(3).sum()), int(masks.opened(2).sum())
+    (216, 208, 0)
+
+    :param numpy.ndarray segmentation: the segmentation, with non-negative integer labels
+    :param list labels: the labels for which masks are computed (default: all
+      the labels present in the segmentation, but the background 0)
+    :param bool erode: also compute the morphological openings of the masks
+    :param numpy.ndarray structure: structuring element of the openings
+      (default: 18-connectivity)
+
+    """
+
+    def __init__(self, segmentation, labels=None, erode=True, structure=None):
+        seg = np.asanyarray(segmentation)
+        if not np.issubdtype(seg.dtype, np.integer):
+            seg = np.rint(seg).astype(np.int32)
+        if seg.size and seg.min() < 0:
+            raise RuntimeError('Segmentation labels should be non-negative')
+        self.shape = seg.shape
+        self.structure = structure
+        if self.structure is None:
+            self.structure = nd.generate_binary_structure(seg.ndim, 2)
+
+        # Bounding boxes of all the labels from one pass over the volume
+        bboxes = label_bboxes(seg, labels)
+        if labels is None:
+            labels = [label for label in bboxes if label != 0]
+        self._masks = OrderedDict()
+        self._opened = OrderedDict()
+        for label in labels:
+            label = int(label)
+            bbox = bboxes[label]
+            if bbox is None:
+                bbox = tuple(slice(0, 0) for s in self.shape)
+            mask = seg[bbox] == label
+            self._masks[label] = _PackedMask(mask, bbox)
+            if erode:
+                # The opening is contained in the mask, cropping to the
+                # bounding box does not change the result
+                self._opened[label] = _PackedMask(
+                    nd.binary_opening(mask, structure=self.structure), bbox)
+
+    @property
+    def labels(self):
+        """ The labels with masks """
+        return list(self._masks.keys())
+
+    def bbox(self, label):
+        """ The bounding box (tuple of slices) of a label """
+        return self._masks[label].bbox
+
+    def count(self, label, opened=False):
+        """ The number of voxels of the mask of a label """
+        return self._packed(label, opened).count
+
+    def _packed(self, label, opened=False):
+        if not opened:
+            return self._masks[label]
+        if label not in self._opened:
+            packed = self._masks[label]
+            self._opened[label] = _PackedMask(
+                nd.binary_opening(packed.unpack(), structure=self.structure), packed.bbox)
+        return self._opened[label]
+
+    def _expand(self, packed):
+        mask = np.zeros(self.shape, dtype=np.bool_)
+        mask[packed.bbox] = packed.unpack()
+        return mask
+
+    def mask(self, label):
+        """ The full-size binary mask of a label """
+        return self._expand(self._packed(label))
+
+    def opened(self, label):
+        """ The full-size morphological opening of the mask of a label """
+        return self._expand(self._packed(label, opened=True))
+
+    def segmentation(self, opened=False, dtype=np.uint8):
+        """ The label volume of the masks (or of their openings) """
+        seg = np.zeros(self.shape, dtype=dtype)
+        for label in self.labels:
+            packed = self._packed(label, opened)
+            seg[packed.bbox][packed.unpack()] = label
+        return seg
+
+    def values(self, img, label, opened=False):
+        """ The values of an image within the mask (or its opening) of a label """
+        packed = self._packed(label, opened)
+        return img[packed.bbox][packed.unpack()]
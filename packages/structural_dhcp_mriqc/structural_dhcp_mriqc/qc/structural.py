@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+The anatomical :abbr:`QC (Quality Control)` measures of a structural image,
+computed from its files. This is the computation behind the
+:class:`~structural_dhcp_mriqc.interfaces.qc.StructuralQC` interface, which
+can also be run without nipype (see :mod:`structural_dhcp_mriqc.qc.cohort`).
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+
+from .anatomical import (efc, fber, art_qi1, art_qi2, volume_fraction, rpve, summary_stats,
+                         FSL_FAST_LABELS, tissue_stats, snr_from_stats, cnr_from_stats,
+                         cjv_from_stats)
+from .masks import TissueMasks
+from ..utils.images import load_image, load_data
+
+# The measures of structural_qc (flattened, see flatten_dict), and those that
+# are only computed with the air mask, with the artifacts mask and for 4D images
+STRUCTURAL_MEASURES = [
+    'cjv', 'cnr', 'efc', 'icvs_csf', 'icvs_gm', 'icvs_wm', 'inu_med', 'inu_range',
+    'rpve_csf', 'rpve_gm', 'rpve_wm', 'size_x', 'size_y', 'size_z',
+    'snr_csf', 'snr_gm', 'snr_total', 'snr_wm', 'spacing_x', 'spacing_y', 'spacing_z'] + \
+    ['summary_%s_%s' % (stat, tissue) for stat in ['mean', 'p05', 'p95', 'stdv']
+     for tissue in ['bg', 'csf', 'gm', 'wm']]
+AIR_MEASURES = ['fber']
+ARTIFACT_MEASURES = ['qi1', 'qi2']
+TIME_MEASURES = ['size_t', 'spacing_tr']
+
+
+def _structural_images(in_file, in_segm, in_bias, in_pvms, in_noinu=None, air_msk=None,
+                       artifact_msk=None):
+    """ The images read by :func:`structural_qc`, with their loading options """
+    images = [(in_file, {'nonnegative': True}),
+              (in_noinu or in_file, {'nonnegative': True}),
+              (in_segm, {'dtype': np.uint8}),
+              (in_bias, {})]
+    images += [(fname, {}) for fname in in_pvms]
+    images += [(fname, {'dtype': np.uint8}) for fname in [air_msk, artifact_msk] if fname]
+    return images
+
+
+def prefetch_structural_qc(in_file, in_segm, in_bias, in_pvms, in_noinu=None, air_msk=None,
+                           artifact_msk=None):
+    """
+    Reads the images of :func:`structural_qc` ahead of the computation:
+    compressed images are converted into the image cache and the data is
+    read once, so that it is in the page cache when the measures are computed.
+    """
+    for fname, options in _structural_images(in_file, in_segm, in_bias, in_pvms, in_noinu,
+                                             air_msk, artifact_msk):
+        data = load_data(fname, **options)
+        data.max()
+        del data
+
+
+def structural_qc(in_file, in_segm, in_bias, in_pvms, in_noinu=None, efc_slab=None,
+                  air_msk=None, artifact_msk=None):
+    """
+    Computes the anatomical QC measures of a structural image.
+
+    :param str in_file: the structural image
+    :param str in_segm: the segmentation (FSL FAST labels)
+    :param str in_bias: the bias field
+    :param list in_pvms: the partial volume maps (FSL FAST, CSF, GM and WM)
+    :param str in_noinu: the image after INU correction (default: ``in_file``)
+    :param int efc_slab: compute the EFC over slabs of this number of slices
+      (default: whole volume)
+    :param str air_msk: the air mask, without artifacts (enables the FBER, qi1 and qi2)
+    :param str artifact_msk: the artifacts mask (enables qi1 and qi2)
+    :return: a dictionary with the measures (nested, see :func:`flatten_dict`)
+
+    """
+    results = {}
+    # Images are memory-mapped read-only float32 arrays (NaNs and, where
+    # relevant, negative values replaced with zeros), see utils.images
+    imnii, imdata = load_image(in_file, nonnegative=True)
+    erode = np.all(np.array(imnii.header.get_zooms()[:3],
+                            dtype=np.float32) < 1.2)
+
+    # Load image corrected for INU
+    inudata = load_data(in_noinu or in_file, nonnegative=True)
+
+    segdata = load_data(in_segm, dtype=np.uint8)
+
+    # Statistics of all the tissues, computed once: counts, sums and sums of
+    # squares in one pass; medians (SNR) from the (opened) tissue masks
+    segstats = tissue_stats(inudata, segdata, labels=list(range(4)))
+    snrseg = segdata
+    if erode:
+        snrseg = TissueMasks(segdata, labels=[FSL_FAST_LABELS[t] for t in ['csf', 'gm', 'wm']],
+                             erode=erode).segmentation(opened=True)
+    snrstats = tissue_stats(inudata, snrseg, labels=[1, 2, 3], percentiles=[50])
+    del snrseg
+
+    # SNR
+    snrvals = []
+    results['snr'] = {}
+    for tlabel in ['csf', 'wm', 'gm']:
+        snrvals.append(snr_from_stats(snrstats[FSL_FAST_LABELS[tlabel]]))
+        results['snr'][tlabel] = snrvals[-1]
+    results['snr']['total'] = float(np.mean(snrvals))
+
+    # CNR
+    results['cnr'] = cnr_from_stats(segstats)
+
+    # EFC
+    results['efc'] = efc(inudata, slab_size=efc_slab)
+
+    # FBER and artifacts, when the air and artifacts masks are given
+    if air_msk:
+        airdata = load_data(air_msk, dtype=np.uint8)
+        results['fber'] = fber(inudata, segdata, airdata)
+        if artifact_msk:
+            artdata = load_data(artifact_msk, dtype=np.uint8)
+            results['qi1'] = art_qi1(airdata, artdata)
+            results['qi2'] = art_qi2(imdata, airdata, artdata)
+            del artdata
+        del airdata
+
+    # CJV
+    results['cjv'] = cjv_from_stats(segstats)
+
+    pvmdata = [load_data(fname) for fname in in_pvms]
+
+    # ICVs
+    results['icvs'] = volume_fraction(pvmdata)
+
+    # RPVE
+    results['rpve'] = rpve(pvmdata, segdata)
+
+    # Summary stats
+    mean, stdv, p95, p05 = summary_stats(imdata, pvmdata)
+    results['summary'] = {'mean': mean, 'stdv': stdv,
+                          'p95': p95, 'p05': p05}
+
+    # Image specs
+    results['size'] = {'x': int(imdata.shape[0]),
+                       'y': int(imdata.shape[1]),
+                       'z': int(imdata.shape[2])}
+    results['spacing'] = {
+        i: float(v) for i, v in zip(
+            ['x', 'y', 'z'], imnii.header.get_zooms()[:3])}
+
+    try:
+        results['size']['t'] = int(imdata.shape[3])
+    except IndexError:
+        pass
+
+    try:
+        results['spacing']['tr'] = float(imnii.header.get_zooms()[3])
+    except IndexError:
+        pass
+
+    # Bias
+    bias = load_data(in_bias)[segdata > 0]
+    cent5, inu_med, cent95 = np.percentile(bias, [5., 50., 95.])
+    results['inu'] = {
+        'range': float(np.abs(cent95 - cent5)),
+        'med': float(inu_med)}  #pylint: disable=E1101
+    return results
+
+
+def flatten_dict(indict):
+    """ Flattens a dictionary of measures (``{'snr': {'gm': ..}}`` to ``{'snr_gm': ..}``) """
+    out_qc = {}
+    for k, value in list(indict.items()):
+        if not isinstance(value, dict):
+            out_qc[k] = value
+        else:
+            for subk, subval in list(value.items()):
+                if not isinstance(subval, dict):
+                    out_qc['%s_%s' % (k, subk)] = subval
+                else:
+                    for ssubk, ssubval in list(subval.items()):
+                        out_qc['%s_%s_%s' % (k, subk, ssubk)] = ssubval
+    return out_qc
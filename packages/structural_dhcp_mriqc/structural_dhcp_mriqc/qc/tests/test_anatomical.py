@@ -16,7 +16,8 @@ import glob
 import nibabel as nb
 
 from structural_dhcp_mriqc.data import get_brainweb_1mm_normal
-from structural_dhcp_mriqc.qc.anatomical import snr, cjv, art_qi1
+from structural_dhcp_mriqc.qc.anatomical import (snr, cnr, cjv, efc, art_qi1, art_qi2, tissue_stats,
+                                                  snr_from_stats, cnr_from_stats, cjv_from_stats)
 from structural_dhcp_mriqc.interfaces.anatomical import artifact_mask
 import numpy as np
 # from numpy.testing import allclose
@@ -124,3 +125,60 @@ def test_artifacts():
         values.append(art_qi1(airdata, artmask))
 
     return np.all(values > .05)
+
+
+def test_tissue_stats():
+    rng = np.random.RandomState(1234)
+    seg = rng.randint(0, 4, size=(30, 30, 30)).astype(np.uint8)
+    seg[5:20, 5:25, 5:25] = 3
+    seg[20:28, 5:25, 5:25] = 2
+    imdata = (rng.normal(100.0, 20.0, size=seg.shape) + 50 * seg).astype(np.float32)
+
+    stats = tissue_stats(imdata, seg, percentiles=[50])
+    assert np.isclose(cnr_from_stats(stats), cnr(imdata, seg), rtol=1e-5)
+    assert np.isclose(cjv_from_stats(stats), cjv(imdata, seg=seg), rtol=1e-5)
+    assert np.isclose(snr_from_stats(stats[3]), snr(imdata, seg, fglabel=3, erode=False),
+                      rtol=1e-5)
+
+    stats = tissue_stats(imdata, seg, labels=[1, 3, 5], percentiles=[5, 50, 95])
+    for label in [1, 3]:
+        assert np.allclose([stats[label]['percentiles'][p] for p in [5, 50, 95]],
+                           np.percentile(imdata[seg == label], [5, 50, 95]))
+    assert stats[5]['n'] == 0 and np.isnan(stats[5]['percentiles'][50])
+    assert tissue_stats(imdata, seg, labels=[], percentiles=[50]) == {}
+
+    # Chunks of one slice, within a mask, of F-ordered volumes (as memory-mapped NIfTI)
+    mask = rng.uniform(size=seg.shape) > 0.3
+    chunked = tissue_stats(np.asfortranarray(imdata), np.asfortranarray(seg), mask=mask,
+                           percentiles=[0, 25, 50, 100], chunk_size=1)
+    assert sorted(chunked.keys()) == [0, 1, 2, 3]
+    for label in range(4):
+        values = imdata[mask & (seg == label)]
+        assert chunked[label]['n'] == values.size
+        assert np.isclose(chunked[label]['mean'], values.mean(dtype=np.float64))
+        assert np.isclose(chunked[label]['std'], values.std(ddof=1, dtype=np.float64))
+        assert np.allclose([chunked[label]['percentiles'][p] for p in [0, 25, 50, 100]],
+                           np.percentile(values, [0, 25, 50, 100]))
+
+
+def test_efc_streamed():
+    rng = np.random.RandomState(1234)
+    imdata = rng.uniform(0.0, 100.0, size=(30, 30, 30)).astype(np.float32)
+    imdata[imdata < 20.0] = 0.0
+
+    assert np.isclose(efc(imdata, slab_size=7), efc(imdata), rtol=1e-5)
+    assert np.isclose(efc(imdata, slab_size=1), efc(imdata), rtol=1e-5)
+
+
+def test_art_qi2_subsample():
+    from scipy.stats import chi
+    rng = np.random.RandomState(1234)
+    imdata = chi.rvs(2, scale=10.0, size=(40, 40, 40), random_state=rng).astype(np.float32)
+    airmask = np.ones(imdata.shape, dtype=np.uint8)
+    airmask[10:30, 10:30, 10:30] = 0
+    artmask = np.zeros_like(airmask)
+    artmask[:2, :2, :2] = 1
+
+    qi2 = art_qi2(imdata, airmask, artmask, max_samples=20000)
+    assert qi2 == art_qi2(imdata, airmask, artmask, max_samples=20000)
+    assert np.isclose(qi2, art_qi2(imdata, airmask, artmask, max_samples=None), rtol=0.1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Cohort QC tests
+"""
+import os.path as op
+import numpy as np
+import nibabel as nb
+import pandas as pd
+
+from structural_dhcp_mriqc.qc.cohort import compute_cohort_qc
+
+
+def _scan(out_dir, name, rng, masks=False):
+    def _save(suffix, data):
+        fname = op.join(out_dir, '%s_%s.nii.gz' % (name, suffix))
+        nb.Nifti1Image(data, np.eye(4)).to_filename(fname)
+        return fname
+
+    seg = rng.randint(0, 4, size=(20, 22, 24)).astype(np.uint8)
+    entry = {'subject_id': name,
+             'in_file': _save('T2w', (rng.uniform(0, 100, seg.shape) + 50 * seg).astype(np.float32)),
+             'in_segm': _save('seg', seg),
+             'in_bias': _save('bias', rng.uniform(0.9, 1.1, seg.shape).astype(np.float32)),
+             'in_pvms': [_save('pvm%d' % label, ((seg == label) *
+                                                rng.uniform(0.1, 0.99, seg.shape)).astype(np.float32))
+                         for label in [1, 2, 3]]}
+    if masks:
+        air = np.zeros(seg.shape, dtype=np.uint8)
+        air[:4] = 1
+        art = np.zeros(seg.shape, dtype=np.uint8)
+        art[:1, :3] = 1
+        entry['air_msk'] = _save('air', air)
+        entry['artifact_msk'] = _save('art', art)
+    return entry
+
+
+def test_cohort_serial_pool(tmpdir):
+    rng = np.random.RandomState(1234)
+    manifest = [_scan(str(tmpdir), 'sub%d' % i, rng, masks=i == 2) for i in range(4)]
+
+    serial = compute_cohort_qc(manifest, n_jobs=1, prefetch=False,
+                               out_file=str(tmpdir.join('serial.csv')))
+    pooled = compute_cohort_qc(manifest, n_jobs=2, prefetch=True,
+                               out_file=str(tmpdir.join('pooled.csv')))
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert list(serial['subject_id']) == ['sub0', 'sub1', 'sub2', 'sub3']
+
+    # The measures of the masks only computed for the third scan are in the csv
+    written = pd.read_csv(str(tmpdir.join('pooled.csv')))
+    for measure in ['fber', 'qi1', 'qi2']:
+        assert measure in written.columns
+        assert written[measure].notnull().tolist() == [False, False, True, False]
+    assert np.allclose(written[serial.columns[2:]].values.astype(float),
+                       serial[serial.columns[2:]].values.astype(float), equal_nan=True)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Tissue masks tests
+"""
+import numpy as np
+import scipy.ndimage as nd
+
+from structural_dhcp_mriqc.qc.masks import TissueMasks, binary_opening_cropped
+
+
+def test_tissue_masks():
+    rng = np.random.RandomState(1234)
+    seg = rng.randint(0, 4, size=(30, 35, 40)).astype(np.uint8)
+    seg[5:20, 5:30, 10:30] = 2
+    seg[22:28, 2:12, 0:5] = 3
+    struc = nd.generate_binary_structure(3, 2)
+
+    masks = TissueMasks(seg)
+    assert masks.labels == [1, 2, 3]
+    for label in masks.labels:
+        ref = seg == label
+        assert np.all(masks.mask(label) == ref)
+        assert np.all(masks.opened(label) == nd.binary_opening(ref, structure=struc))
+        assert masks.count(label) == ref.sum()
+        assert np.all(masks.values(seg, label) == label)
+
+
+def test_binary_opening_cropped():
+    rng = np.random.RandomState(1234)
+    mask = np.zeros((30, 35, 40), dtype=np.bool_)
+    mask[5:20, 5:30, 10:30] = rng.uniform(size=(15, 25, 20)) > 0.2
+    mask[0:4, 0:4, 0:4] = True
+    struc = nd.generate_binary_structure(3, 2)
+
+    assert np.all(binary_opening_cropped(mask, structure=struc) ==
+                  nd.binary_opening(mask, structure=struc))
+    assert not binary_opening_cropped(np.zeros_like(mask)).any()
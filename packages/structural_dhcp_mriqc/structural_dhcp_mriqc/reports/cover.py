@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Rendering of the cover pages of the reports.
+
+The covers of the individual reports only differ in a few fields of their
+template (the subject, the time stamp and the tables). A
+:class:`CoverRenderer` keeps the compiled template, one
+:class:`~structural_dhcp_rst2pdf.createpdf.RstToPdf` (with its stylesheets
+and fonts loaded) and the parsed doctree of the template with placeholders
+for these fields; a cover is rendered by filling a copy of the doctree,
+parsing only the tables.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os.path as op
+
+import jinja2
+
+# Fields of the templates that change with every cover: inline text and tables
+INLINE_FIELDS = ['sub_id', 'timestamp']
+TABLE_FIELDS = ['imparams', 'pipeparams']
+
+# Renderers of this process, by template and RstToPdf
+_RENDERERS = {}
+
+
+def _placeholder(field):
+    return 'DHCPMRIQC%sFIELD' % field.replace('_', '').upper()
+
+
+def _findall(doctree, condition):
+    # Node.traverse is deprecated in recent docutils
+    findall = getattr(doctree, 'findall', doctree.traverse)
+    return list(findall(condition))
+
+
+def rst_table(rows, colnames):
+    """
+    A simple reST table
+
+    :param list rows: the rows, lists of strings
+    :param list colnames: the headers of the columns
+    :return: the table (text)
+
+    """
+    colsizes = [max([len(colname)] + [len(row[i]) for row in rows])
+                for i, colname in enumerate(colnames)]
+    colformat = ' '.join('{:<%d}' % c for c in colsizes)
+    sep = colformat.format(*['=' * c for c in colsizes])
+    return '\n'.join([sep, colformat.format(*colnames), sep] +
+                     [colformat.format(*row) for row in rows] + [sep])
+
+
+class CoverRenderer(object):
+    """
+    Renders cover pages from a (jinja) reST template
+
+    :param str template_file: the template
+    :param rst2pdf: the :class:`~structural_dhcp_rst2pdf.createpdf.RstToPdf`
+      writing the PDF files (default: a new one)
+
+    """
+
+    def __init__(self, template_file, rst2pdf=None):
+        if rst2pdf is None:
+            from structural_dhcp_rst2pdf.createpdf import RstToPdf
+            rst2pdf = RstToPdf()
+        self.rst2pdf = rst2pdf
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(searchpath=op.dirname(op.abspath(template_file))),
+            trim_blocks=True, lstrip_blocks=True)
+        self.template = env.get_template(op.basename(template_file))
+        self._skeletons = {}
+        self._fragments = None
+
+    def _settings_overrides(self):
+        """ The docutils settings of :meth:`RstToPdf.createPdf` """
+        settings_overrides = {}
+        if self.rst2pdf.language:
+            settings_overrides['language_code'] = self.rst2pdf.docutils_language
+        settings_overrides['strip_elements_with_classes'] = \
+            self.rst2pdf.strip_elements_with_classes
+        return settings_overrides
+
+    def _parse(self, text):
+        """ Parses reST as :meth:`RstToPdf.createPdf` does """
+        import docutils.core
+        return docutils.core.publish_doctree(text, settings_overrides=self._settings_overrides())
+
+    def _parse_fragment(self, text):
+        """
+        Parses a fragment of reST (e.g. a table) with the parser only, without
+        setting up a docutils publisher every time
+        """
+        from docutils.parsers.rst import Parser
+        from docutils.utils import new_document
+        if self._fragments is None:
+            try:
+                from docutils.frontend import get_default_settings
+                settings = get_default_settings(Parser)
+            except ImportError:
+                from docutils.frontend import OptionParser
+                settings = OptionParser(components=(Parser,)).get_default_values()
+            for name, value in self._settings_overrides().items():
+                setattr(settings, name, value)
+            self._fragments = (Parser(), settings)
+        parser, settings = self._fragments
+        document = new_document('<cover>', settings)
+        parser.parse(text, document)
+        return document.children
+
+    def _skeleton(self, context):
+        """ The doctree of the template, with placeholders for the fields that change """
+        fields = INLINE_FIELDS + TABLE_FIELDS
+        key = (tuple(sorted((k, v) for k, v in context.items() if k not in fields)),
+               tuple(f for f in fields if context.get(f)))
+        if key not in self._skeletons:
+            placeholders = dict(context)
+            placeholders.update({f: _placeholder(f) for f in key[1]})
+            self._skeletons[key] = self._parse(self.template.render(placeholders))
+        return self._skeletons[key]
+
+    def render(self, context, out_file):
+        """
+        Writes a cover page
+
+        :param dict context: the values of the fields of the template
+        :param str out_file: the PDF file
+        :return: ``out_file``
+
+        """
+        from docutils import nodes
+
+        doctree = self._skeleton(context).deepcopy()
+        inline = {_placeholder(f): '%s' % context[f] for f in INLINE_FIELDS if context.get(f)}
+        if inline:
+            for text in _findall(doctree, nodes.Text):
+                value = text.astext()
+                if any(p in value for p in inline):
+                    for placeholder, field in inline.items():
+                        value = value.replace(placeholder, field)
+                    text.parent.replace(text, nodes.Text(value))
+
+        for field in TABLE_FIELDS:
+            if not context.get(field):
+                continue
+            placeholder = _placeholder(field)
+            for par in _findall(doctree, nodes.paragraph):
+                if par.astext() == placeholder:
+                    par.replace_self([node.deepcopy() for node in
+                                      self._parse_fragment(context[field])])
+
+        self.rst2pdf.createPdf(doctree=doctree, output=out_file, compressed=True)
+        return out_file
+
+
+def cover_renderer(template_file, rst2pdf=None):
+    """ The :class:`CoverRenderer` of a template, created once per process """
+    key = (op.abspath(template_file), id(rst2pdf) if rst2pdf is not None else None)
+    if key not in _RENDERERS:
+        _RENDERERS[key] = CoverRenderer(template_file, rst2pdf=rst2pdf)
+    return _RENDERERS[key]
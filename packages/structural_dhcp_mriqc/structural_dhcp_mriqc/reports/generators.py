@@ -17,16 +17,18 @@ import os.path as op
 import collections
 import glob
 import json
+from multiprocessing import Pool, cpu_count
+from six import string_types
 
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-
-import jinja2
 
 from ..interfaces.viz_utils import plot_measures, plot_all, plot_mosaic
+from ..measures.qc_json import read_measures
+from .rendering import ReportPages
+from .cover import cover_renderer, rst_table
 
 # matplotlib.rc('figure', figsize=(11.69, 8.27))  # for DINA4 size
 STRUCTURAL_QCGROUPS = [
@@ -75,8 +77,7 @@ def workflow_report(qctype, settings=None):
     """ Creates the report """
     import datetime
 
-    with open(settings['qc_measures'], 'r') as jsondata: 
-        datalist=json.load(jsondata)["data"]
+    datalist = read_measures(settings['qc_measures'])
 
     out_csv = op.join(settings['output_dir'], 'image_QC_measures.csv')
     dframe = generate_csv_from_json_list(datalist, qctype, settings, out_csv)
@@ -102,8 +103,7 @@ def workflow_report(qctype, settings=None):
     func2 = None
     dframe2 = None
     if qctype2 != '':
-        with open(settings['dhcp_measures'], 'r') as jsondata: 
-            datalist=json.load(jsondata)["data"]
+        datalist = read_measures(settings['dhcp_measures'])
         out_csv = op.join(settings['output_dir'], 'pipeline_QC_measures.csv')
         dframe2 = generate_csv_from_json_list(datalist, qctype2, settings, out_csv)
         func2 = getattr(sys.modules[__name__], 'report_' + qctype2)
@@ -139,144 +139,153 @@ def workflow_report(qctype, settings=None):
         concat_pdf(pdf_group, out_group_file)
         result['group'] = {'success': True, 'path': out_group_file}
 
+    # Generate individual reports for subjects, in a pool of processes
+    # sharing the group data
+    nthreads = settings.get('nthreads') or cpu_count()
+    initargs = (dframe, dframe2, qctype, qctype2, work_dir, out_file)
     out_indiv_files = []
-    # Generate individual reports for subjects
-    for subid in sub_list:
-        # Get subject-specific info
-        subdf = dframe.loc[dframe['subject_id'] == subid]
-        sessions = sorted(pd.unique(subdf.session_id.ravel()))
-        plots = []
-        sess_scans = []
-        # Re-build mosaic location
-        for sesid in sessions:
-            sesdf = subdf.loc[subdf['session_id'] == sesid]
-            scans = sorted(pd.unique(sesdf.run_id.ravel()))
-
-            # Each scan has a volume and (optional) fd plot
-            for scanid in scans:
-                fpdf = op.join(work_dir, 'anatomical_%s_%s_%s.pdf' %
-                               (subid, sesid, scanid))
-
-                if op.isfile(fpdf):
-                    plots.append(fpdf)
-
-                fpdf = op.join(work_dir, 'structural_dhcp_%s_%s_%s.pdf' %
-                               (subid, sesid, scanid))
-
-                if op.isfile(fpdf):
-                    plots.append(fpdf)
-
-            sess_scans.append('%s (%s)' % (sesid, ', '.join(scans)))
-
-        # Summary cover
-        # sfailed = []
-        # if failed:
-        #     sfailed = ['%s (%s)' % (s[1], s[2])
-        #                for s in failed if subid == s[0]]
-        out_sum = op.join(work_dir, '%s_summary_%s.pdf' % (qctype, subid))
-        summary_cover(dframe, qctype, dframe2, sub_id=subid, out_file=out_sum)
-        plots.insert(0, out_sum)
-
-        # Summary (violinplots) of QC measures
-        qc_ms = op.join(work_dir, '%s_measures_%s.pdf' % (qctype, subid))
-
-        func(dframe, subject=subid, out_file=qc_ms)
-        plots.append(qc_ms)
-
-        # Summary (violinplots) of QC measures dhcp
-        if qctype2 != '':
-            qc_ms = op.join(work_dir, '%s_measures_%s.pdf' % (qctype2, subid))
-
-            func2(dframe2, subject=subid, out_file=qc_ms)
-            plots.append(qc_ms)
-
+    if nthreads > 1 and len(sub_list) > 1:
+        pool = Pool(min(nthreads, len(sub_list)), initializer=_init_report_worker,
+                    initargs=initargs)
+        try:
+            reports = list(pool.imap(_individual_report, sub_list))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_report_worker(*initargs)
+        reports = [_individual_report(subid) for subid in sub_list]
 
-        if len(plots) > 0:
-            # Generate final report with collected pdfs in plots
-            sub_path = out_file % subid
-            concat_pdf(plots, sub_path)
+    for subid, sub_path in reports:
+        if sub_path is not None:
             out_indiv_files.append(sub_path)
             result[subid] = {'success': True, 'path': sub_path}
     return out_group_file, out_indiv_files, result
 
 
 
+# State of the processes generating the individual reports
+_REPORT_WORKER = {}
 
 
+def _init_report_worker(dframe, dframe2, qctype, qctype2, work_dir, out_file):
+    """
+    Initializes a process generating individual reports: keeps the group
+    data, and warms up matplotlib/seaborn and the RstToPdf stylesheet so that
+    they are loaded once per process instead of once per report.
+    """
+    import seaborn as sns  # pylint: disable=W0612
+    from structural_dhcp_rst2pdf.createpdf import RstToPdf
 
+    _REPORT_WORKER.update({
+        'dframe': dframe, 'dframe2': dframe2, 'qctype': qctype, 'qctype2': qctype2,
+        'work_dir': work_dir, 'out_file': out_file, 'rst2pdf': RstToPdf()})
+    plt.close(plt.figure())
 
 
-def summary_cover(dframe, qctype, pipeline_frame, failed=None, sub_id=None, out_file=None):
-    """ Generates a cover page with subject information """
-    global version
-    import datetime
-    import numpy as np
-    from structural_dhcp_rst2pdf.createpdf import RstToPdf
-    import pkg_resources as pkgr
+def _individual_report(subid):
+    """ Generates the individual report of a subject """
+    dframe = _REPORT_WORKER['dframe']
+    dframe2 = _REPORT_WORKER['dframe2']
+    qctype = _REPORT_WORKER['qctype']
+    qctype2 = _REPORT_WORKER['qctype2']
+    work_dir = _REPORT_WORKER['work_dir']
+    out_file = _REPORT_WORKER['out_file']
+    func = getattr(sys.modules[__name__], 'report_' + qctype)
+    func2 = getattr(sys.modules[__name__], 'report_' + qctype2) if qctype2 != '' else None
+
+    # Get subject-specific info
+    subdf = dframe.loc[dframe['subject_id'] == subid]
+    sessions = sorted(pd.unique(subdf.session_id.ravel()))
+    plots = []
+    sess_scans = []
+    # Re-build mosaic location
+    for sesid in sessions:
+        sesdf = subdf.loc[subdf['session_id'] == sesid]
+        scans = sorted(pd.unique(sesdf.run_id.ravel()))
+
+        # Each scan has a volume and (optional) fd plot
+        for scanid in scans:
+            fpdf = op.join(work_dir, 'anatomical_%s_%s_%s.pdf' %
+                           (subid, sesid, scanid))
+
+            if op.isfile(fpdf):
+                plots.append(fpdf)
+
+            fpdf = op.join(work_dir, 'structural_dhcp_%s_%s_%s.pdf' %
+                           (subid, sesid, scanid))
+
+            if op.isfile(fpdf):
+                plots.append(fpdf)
+
+        sess_scans.append('%s (%s)' % (sesid, ', '.join(scans)))
+
+    # Summary cover
+    # sfailed = []
+    # if failed:
+    #     sfailed = ['%s (%s)' % (s[1], s[2])
+    #                for s in failed if subid == s[0]]
+    out_sum = op.join(work_dir, '%s_summary_%s.pdf' % (qctype, subid))
+    summary_cover(dframe, qctype, dframe2, sub_id=subid, out_file=out_sum,
+                  rst2pdf=_REPORT_WORKER.get('rst2pdf'))
+    plots.insert(0, out_sum)
+
+    # Summary (violinplots) of QC measures
+    qc_ms = op.join(work_dir, '%s_measures_%s.pdf' % (qctype, subid))
+
+    func(dframe, subject=subid, out_file=qc_ms)
+    plots.append(qc_ms)
+
+    # Summary (violinplots) of QC measures dhcp
+    if qctype2 != '':
+        qc_ms = op.join(work_dir, '%s_measures_%s.pdf' % (qctype2, subid))
 
-    if failed is None:
-        failed = []
+        func2(dframe2, subject=subid, out_file=qc_ms)
+        plots.append(qc_ms)
 
-    newdf = dframe.copy()
-    if sub_id is not None:
-        newdf = newdf[newdf.subject_id.astype('unicode') == sub_id]
-
-    if 'exists' in newdf:
-        for col in ['size_x', 'size_y', 'size_z','spacing_x', 'spacing_y', 'spacing_z']:
-            newdf.loc[newdf['exists'] == 'False', col] = pd.Series( 0 , index=newdf.index)
-    # Format the size
-    #pylint: disable=E1101
-    newdf[['size_x', 'size_y', 'size_z']] = newdf[['size_x', 'size_y', 'size_z']].astype(np.uint16)
-    #formatter = lambda row: ur'%d \u00D7 %d \u00D7 %d' % (
-    formatter = lambda row: r'%d x %d x %d' % (
-        row['size_x'], row['size_y'], row['size_z'])
-    newdf['size'] = newdf[['size_x', 'size_y', 'size_z']].apply(formatter, axis=1)
-
-    # Format spacing
-    newdf[['spacing_x', 'spacing_y', 'spacing_z']] = newdf[[
-        'spacing_x', 'spacing_y', 'spacing_z']].astype(np.float32)  #pylint: disable=E1101
-    #formatter = lambda row: ur'%.3f \u00D7 %.3f \u00D7 %.3f' % (
-    formatter = lambda row: r'%.3f x %.3f x %.3f' % (
-        row['spacing_x'], row['spacing_y'], row['spacing_z'])
-    newdf['spacing'] = newdf[['spacing_x', 'spacing_y', 'spacing_z']].apply(formatter, axis=1)
+
+    sub_path = None
+    if len(plots) > 0:
+        # Generate final report with collected pdfs in plots
+        sub_path = out_file % subid
+        concat_pdf(plots, sub_path)
+    return subid, sub_path
+
+
+def _cover_tables(dframe, pipeline_frame, sub_id=None):
+    """ The tables (reST) of image parameters and pipeline steps of a cover page """
+    import re
+    import numpy as np
+
+    def _rows(frame):
+        if sub_id is not None:
+            frame = frame.loc[frame.subject_id.astype('unicode') == sub_id]
+        return frame.to_dict('records')
 
     # columns
     cols = ['session_id', 'run_id', 'size', 'spacing']
     colnames = ['Session', ' Scan ', 'Size', 'Spacing']
-    if 'tr' in newdf.columns.ravel():
+    if 'tr' in dframe.columns:
         cols.append('tr')
         colnames.append('TR (sec)')
-    if 'size_t' in newdf.columns.ravel():
+    if 'size_t' in dframe.columns:
         cols.append('size_t')
         colnames.append(r'\# Timepoints')
-
-    # Format parameters table
     if sub_id is None:
         cols.insert(0, 'subject_id')
         colnames.insert(0, 'Subject')
 
-    if 'exists' in newdf:
-        for col in ['size', 'spacing']:
-            newdf.loc[newdf['exists'] == 'False', col] = pd.Series('missing', index=newdf.index)
-
-    newdf = newdf[cols]
-
-    colsizes = []
-    for col, colname in zip(cols, colnames):
-        newdf[[col]] =newdf[[col]].astype('unicode')
-        colsize = newdf.loc[:, col].map(len).max()
-        colsizes.append(colsize if colsize > len(colname) else len(colname))
-
-    colformat = u' '.join(u'{:<%d}' % c for c in colsizes)
-    formatter = lambda row: colformat.format(*row)
-    rowsformatted = newdf[cols].apply(formatter, axis=1).ravel().tolist()
-    # rowsformatted = [formatter.format(*row) for row in newdf.iterrows()]
-    header = colformat.format(*colnames)
-    sep = colformat.format(*['=' * c for c in colsizes])
-    ptable = '\n'.join([sep, header, sep] + rowsformatted + [sep])
-
-    title = 'dHCP MRIQC: %s MRI %s report' % (qctype, 'group' if sub_id is None else 'individual')
-
+    rows = []
+    for rec in _rows(dframe):
+        if rec.get('exists', 'True') == 'False':
+            rec['size'] = rec['spacing'] = 'missing'
+        else:
+            rec['size'] = '%d x %d x %d' % tuple(np.array(
+                [rec['size_x'], rec['size_y'], rec['size_z']]).astype(np.uint16))
+            rec['spacing'] = '%.3f x %.3f x %.3f' % tuple(np.array(
+                [rec['spacing_x'], rec['spacing_y'], rec['spacing_z']]).astype(np.float32))
+        rows.append(['%s' % rec[col] for col in cols])
+    ptable = rst_table(rows, colnames)
 
     pipeline_table = ''
     if pipeline_frame is not None:
@@ -287,27 +296,37 @@ def summary_cover(dframe, qctype, pipeline_frame, failed=None, sub_id=None, out_
         if sub_id is None:
             cols.insert(0, 'subject_id')
             colnames.insert(0, 'Subject')
-        else:
-            pipeline_frame = pipeline_frame.loc[pipeline_frame.subject_id.astype('unicode') == sub_id]
-        if len(pipeline_frame)>0:
-            pipeline_frame = pipeline_frame[cols]
-            pipeline_frame = pipeline_frame.replace({'True': 'Pass'}, regex=True)
-            pipeline_frame = pipeline_frame.replace({'False': 'Fail'}, regex=True)
-
-            colsizes = []
-            for col, colname in zip(cols, colnames):
-                pipeline_frame[[col]] =pipeline_frame[[col]].astype('unicode')
-                colsize = pipeline_frame.loc[:, col].map(len).max()
-                colsizes.append(colsize if colsize > len(colname) else len(colname))
-
-            colformat = u' '.join(u'{:<%d}' % c for c in colsizes)
-            formatter = lambda row: colformat.format(*row)
-            rowsformatted = pipeline_frame[cols].apply(formatter, axis=1).ravel().tolist()
-            header = colformat.format(*colnames)
-            sep = colformat.format(*['=' * c for c in colsizes])
-            pipeline_table = '\n'.join([sep, header, sep] + rowsformatted + [sep])
+
+        def _status(value):
+            if isinstance(value, string_types):
+                value = re.sub('False', 'Fail', re.sub('True', 'Pass', value))
+            return '%s' % value
+
+        rows = [[_status(rec[col]) for col in cols] for rec in _rows(pipeline_frame)]
+        if rows:
+            pipeline_table = rst_table(rows, colnames)
+    return ptable, pipeline_table
 
 
+def summary_cover(dframe, qctype, pipeline_frame, failed=None, sub_id=None, out_file=None,
+                  rst2pdf=None):
+    """
+    Generates a cover page with subject information. An existing
+    :class:`RstToPdf` (``rst2pdf``) can be reused to avoid loading the
+    stylesheets again; the template is parsed once per process (see
+    :class:`~structural_dhcp_mriqc.reports.cover.CoverRenderer`).
+    """
+    global version
+    import datetime
+    import pkg_resources as pkgr
+
+    if failed is None:
+        failed = []
+
+    ptable, pipeline_table = _cover_tables(dframe, pipeline_frame, sub_id=sub_id)
+
+    title = 'dHCP MRIQC: %s MRI %s report' % (qctype, 'group' if sub_id is None else 'individual')
+
     # Substitution dictionary
     context = {
         'title': title + '\n' + ''.join(['='] * len(title)),
@@ -322,16 +341,14 @@ def summary_cover(dframe, qctype, pipeline_frame, failed=None, sub_id=None, out_
         context['sub_id'] = sub_id
 
     if sub_id is None:
-        template = ConfigGen(pkgr.resource_filename(
-            'structural_dhcp_mriqc', op.join('data', 'reports', 'cover_group.rst')))
+        template = pkgr.resource_filename(
+            'structural_dhcp_mriqc', op.join('data', 'reports', 'cover_group.rst'))
     else:
-        template = ConfigGen(pkgr.resource_filename(
-            'structural_dhcp_mriqc', op.join('data', 'reports', 'cover_individual.rst')))
-
-    RstToPdf().createPdf(
-        text=template.compile(context), output=out_file, compressed=True)
-
+        template = pkgr.resource_filename(
+            'structural_dhcp_mriqc', op.join('data', 'reports', 'cover_individual.rst'))
 
+    cover_renderer(template, rst2pdf=rst2pdf).render(context, out_file)
+    return out_file
 
 
 def write_histograms(qcframe, dhcpframe, out_file='report.pdf', figsize=(11.69, 5)):
@@ -344,7 +361,7 @@ def write_histograms(qcframe, dhcpframe, out_file='report.pdf', figsize=(11.69,
     title = 'dHCP MRIQC: anatomical MRI group report'
     text="- Date and time: "+str(datetime.datetime.now().strftime("%Y-%m-%d, %H:%M"))+"\n"
     text+="- dHCP MRIQC version: "+str(version)
-    report = PdfPages(out_file)
+    report = ReportPages(out_file)
 
     fig = plt.figure(figsize=(figsize[0],2))
     ax = fig.add_axes([0,0,1,1])
@@ -356,7 +373,7 @@ def write_histograms(qcframe, dhcpframe, out_file='report.pdf', figsize=(11.69,
     ax.set_axis_off()
     fig.suptitle(title, fontsize=20, x=0.1, horizontalalignment='left')  
     plt.show()
-    report.savefig(fig, dpi=300)
+    report.savefig(fig)
 
 
     numplots = 3
@@ -422,7 +439,7 @@ def write_histograms(qcframe, dhcpframe, out_file='report.pdf', figsize=(11.69,
     plt.show()
 
     fig.suptitle('Scans statistics')
-    report.savefig(fig, dpi=300)
+    report.savefig(fig)
     fig.clf()
 
     report.close()
@@ -431,20 +448,112 @@ def write_histograms(qcframe, dhcpframe, out_file='report.pdf', figsize=(11.69,
     return out_file
 
 
-def concat_pdf(in_files, out_file='concatenated.pdf'):
-    """ Concatenate PDF list (http://stackoverflow.com/a/3444735) """
+def _pdf_digest(obj, memo):
+    """
+    A digest of a PDF object and the objects it references (None if they
+    reference each other), identifying identical objects across documents
+    """
+    import hashlib
+    from PyPDF2.generic import IndirectObject, DictionaryObject, ArrayObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        key = (id(obj.pdf), obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = None
+            memo[key] = _pdf_digest(obj.getObject(), memo) or False
+        return memo[key] or None
+
+    sha = hashlib.sha1(type(obj).__name__.encode('utf-8'))
+    if isinstance(obj, DictionaryObject):
+        for key in sorted(obj):
+            digest = _pdf_digest(obj.raw_get(key), memo)
+            if digest is None:
+                return None
+            sha.update(('%s=%s;' % (key, digest)).encode('utf-8'))
+        if isinstance(obj, StreamObject):
+            sha.update(obj._data)  # pylint: disable=protected-access
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            digest = _pdf_digest(item, memo)
+            if digest is None:
+                return None
+            sha.update(('%s;' % digest).encode('utf-8'))
+    else:
+        sha.update(repr(obj).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _share_resources(pages):
+    """
+    Points the fonts and images of the pages that are identical (e.g. the
+    fonts and group figures repeated by every individual report) to the same
+    object, so that they are written once
+    """
+    from PyPDF2.generic import IndirectObject
+
+    shared = {}
+    memo = {}
+    for page in pages:
+        if '/Resources' not in page:
+            continue
+        resources = page['/Resources']
+        for category in ['/Font', '/XObject']:
+            if category not in resources:
+                continue
+            entries = resources[category]
+            for name in list(entries.keys()):
+                ref = entries.raw_get(name)
+                if not isinstance(ref, IndirectObject):
+                    continue
+                digest = _pdf_digest(ref, memo)
+                if digest is not None:
+                    entries[name] = shared.setdefault((category, digest), ref)
+
+
+def concat_pdf(in_files, out_file='concatenated.pdf', append=False):
+    """
+    Concatenate PDF list (http://stackoverflow.com/a/3444735). All the inputs
+    are opened and the output is written once, with identical fonts and images
+    shared across pages.
+
+    :param list in_files: the PDF files
+    :param str out_file: the concatenated PDF file
+    :param bool append: append the pages to those of ``out_file``, if it exists
+    :return: ``out_file``
+
+    """
     from PyPDF2 import PdfFileWriter, PdfFileReader
 
-    with open(out_file, 'wb') as out_pdffile:
-        outpdf = PdfFileWriter()
+    if append and op.exists(out_file):
+        in_files = [out_file] + list(in_files)
 
+    in_pdffiles = []
+    try:
+        pages = []
         for in_file in in_files:
-            with open(in_file, 'rb') as in_pdffile:
-                inpdf = PdfFileReader(in_pdffile)
-                for fpdf in range(inpdf.numPages):
-                    outpdf.addPage(inpdf.getPage(fpdf))
-                outpdf.write(out_pdffile)
+            in_pdffiles.append(open(in_file, 'rb'))
+            inpdf = PdfFileReader(in_pdffiles[-1])
+            pages += [inpdf.getPage(fpdf) for fpdf in range(inpdf.numPages)]
+        _share_resources(pages)
 
+        outpdf = PdfFileWriter()
+        for page in pages:
+            outpdf.addPage(page)
+
+        # out_file may be one of the inputs (append), it is replaced when complete
+        tmp_file = '%s.%d.tmp' % (out_file, os.getpid())
+        try:
+            with open(tmp_file, 'wb') as out_pdffile:
+                outpdf.write(out_pdffile)
+        except:
+            if op.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+    finally:
+        for in_pdffile in in_pdffiles:
+            in_pdffile.close()
+
+    os.rename(tmp_file, out_file)
     return out_file
 
 
@@ -467,7 +576,7 @@ def _write_report(dframe, groups, sub_id=None, sc_split=False, condensed=True,
                 headers.append(h)
         for r in rem:
             g.remove(r)
-    report = PdfPages(out_file)
+    report = ReportPages(out_file)
 
     groupadd = ''
     subadd = ''
@@ -489,7 +598,7 @@ def _write_report(dframe, groups, sub_id=None, sc_split=False, condensed=True,
                 fig = plot_all(df, groups, strip_nsubj=2, title='QC measures '+groupadd)
            else:
                 fig = plot_measures(df, headers, title='QC measures '+groupadd)
-           report.savefig(fig, dpi=300)
+           report.savefig(fig)
            fig.clf()
         else:         
             subdf = df.copy().loc[df['subject_id'] == sub_id]   
@@ -499,12 +608,12 @@ def _write_report(dframe, groups, sub_id=None, sc_split=False, condensed=True,
                 for ss in sessions:
                     subtitle = '(subject %s_%s%s)' % (sub_id, ss, subadd)
                     fig = plot_all(df, groups, subject=sub_id, session=ss, strip_nsubj=2, title='QC measures ' + subtitle)
-                    report.savefig(fig, dpi=300)
+                    report.savefig(fig)
                     fig.clf()
             else:       
                 subtitle = '(subject %s%s)' % (sub_id, subadd)
                 fig = plot_measures(df, headers, subject=sub_id, title='QC measures ' + subtitle)
-                report.savefig(fig, dpi=300)
+                report.savefig(fig)
                 fig.clf()
 
     report.close()
@@ -602,24 +711,3 @@ def _flatten(in_dict, parent_key='', sep='_'):
         else:
             items.append((new_key, val))
     return dict(items)
-
-
-class ConfigGen(object):
-    """
-    Utility class for generating a config file from a jinja template.
-    https://github.com/oesteban/endofday/blob/f2e79c625d648ef45b08cc1f11fd0bd84342d604/endofday/core/template.py
-    """
-    def __init__(self, template_str):
-        self.template_str = template_str
-        self.env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(searchpath='/'),
-            trim_blocks=True, lstrip_blocks=True)
-
-    def compile(self, configs):
-        template = self.env.get_template(self.template_str)
-        return template.render(configs)
-
-    def generate_conf(self, configs, path):
-        output = self.compile(configs)
-        with open(path, 'w+') as output_file:
-            output_file.write(output)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+How the figures of the reports are written to PDF.
+
+Dense artists (images, e.g. the mosaics, and collections with many points
+or vertices, e.g. strip plots and violins) are rasterised at the report DPI,
+while text, lines and axes stay vector graphics. The DPI is
+``$DHCP_MRIQC_REPORT_DPI`` (default: 150).
+
+A report can be given a size and time budget (``$DHCP_MRIQC_REPORT_MAX_MB``,
+``$DHCP_MRIQC_REPORT_MAX_SECONDS``, default: none). The size of each page is
+estimated before it is added (it is rendered alone into memory). A page that
+would exceed the budget is rasterised at 72 DPI instead, and so are the next
+pages; if it still exceeds it, it is skipped, and so are the next pages. Once
+the time budget is exceeded, the next pages are rasterised at 72 DPI, then
+skipped. Closing a report that skipped pages issues a warning.
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import os.path as op
+import time
+from io import BytesIO
+from warnings import warn
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.collections import Collection
+from matplotlib.image import AxesImage
+from matplotlib.backends.backend_pdf import PdfPages
+
+DPI_ENV = 'DHCP_MRIQC_REPORT_DPI'
+MAX_SIZE_ENV = 'DHCP_MRIQC_REPORT_MAX_MB'
+MAX_TIME_ENV = 'DHCP_MRIQC_REPORT_MAX_SECONDS'
+DEFAULT_DPI = 150
+MIN_DPI = 72
+# Collections with at least these many points and vertices are rasterised
+DENSE_ELEMENTS = 100
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def report_dpi():
+    """ The DPI of the rasterised artists of the reports """
+    return _env_float(DPI_ENV, DEFAULT_DPI)
+
+
+def _elements(collection):
+    return len(collection.get_offsets()) + sum(len(path.vertices)
+                                               for path in collection.get_paths())
+
+
+def rasterize_dense(fig, min_elements=DENSE_ELEMENTS):
+    """
+    Rasterises the images of a figure and its collections with at least
+    ``min_elements`` points and vertices, the other artists (text, lines,
+    axes) are kept as vector graphics
+    """
+    for artist in fig.findobj(lambda obj: isinstance(obj, (AxesImage, Collection))):
+        if isinstance(artist, AxesImage) or _elements(artist) >= min_elements:
+            artist.set_rasterized(True)
+    return fig
+
+
+def save_figure(fig, out_file, dpi=None):
+    """ Writes a figure with the dense artists rasterised at ``dpi`` (default: the report DPI) """
+    rasterize_dense(fig)
+    fig.savefig(out_file, dpi=dpi or report_dpi())
+    return out_file
+
+
+class ReportPages(object):
+    """
+    A multi-page PDF report (see :class:`matplotlib.backends.backend_pdf.PdfPages`)
+    written with the rendering policy of this module
+
+    :param str out_file: the PDF file
+    :param float dpi: the DPI of the rasterised artists (default: the report DPI)
+    :param float max_size: the size budget of the report, in MB
+    :param float max_time: the time budget of the report, in seconds
+
+    """
+
+    def __init__(self, out_file, dpi=None, max_size=None, max_time=None):
+        self.out_file = out_file
+        self.dpi = dpi or report_dpi()
+        self.max_size = max_size if max_size is not None else _env_float(MAX_SIZE_ENV, 0)
+        self.max_time = max_time if max_time is not None else _env_float(MAX_TIME_ENV, 0)
+        self.size = 0  # estimated size of the pages added
+        self.skipped = 0  # pages skipped once over budget at the lowest DPI
+        self._skip = False
+        self._start = time.time()
+        self._pages = PdfPages(out_file)
+
+    def savefig(self, fig):
+        """
+        Adds a figure as a page of the report, unless it exceeds the budget
+        of the report at the lowest DPI
+
+        :return: whether the page was added
+        """
+        if self._skip:
+            self.skipped += 1
+            return False
+        rasterize_dense(fig)
+        if self.max_size:
+            size = _page_size(fig, self.dpi)
+            if self._over_size(size) and self.dpi > MIN_DPI:
+                self._lower_dpi('size (%g MB)' % self.max_size)
+                size = _page_size(fig, self.dpi)
+            if self._over_size(size):
+                self._skip_next('size (%g MB)' % self.max_size)
+                self.skipped += 1
+                return False
+            self.size += size
+        self._pages.savefig(fig, dpi=self.dpi)
+        if self.max_time and time.time() - self._start > self.max_time:
+            # for the next pages
+            if self.dpi > MIN_DPI:
+                self._lower_dpi('time (%g s)' % self.max_time)
+            else:
+                self._skip_next('time (%g s)' % self.max_time)
+        return True
+
+    def _over_size(self, size):
+        return self.size + size > self.max_size * (1 << 20)
+
+    def _lower_dpi(self, budget):
+        self.dpi = MIN_DPI
+        warn('Report %s exceeds its %s budget, the pages are rasterised at %g DPI' %
+             (self.out_file, budget, self.dpi))
+
+    def _skip_next(self, budget):
+        self._skip = True
+        warn('Report %s exceeds its %s budget at %g DPI, the pages are skipped' %
+             (self.out_file, budget, self.dpi))
+
+    def close(self):
+        """
+        Finalises the report, with a warning if pages were skipped
+
+        :return: whether all the pages were added
+        """
+        self._pages.close()
+        if self.skipped:
+            warn('Report %s is incomplete, %d pages exceeding its budget were skipped' %
+                 (self.out_file, self.skipped))
+        return not self.skipped
+
+
+def _page_size(fig, dpi):
+    """ The size of the PDF of a figure alone, an estimate of the size of its page """
+    page = BytesIO()
+    fig.savefig(page, format='pdf', dpi=dpi)
+    return len(page.getvalue())
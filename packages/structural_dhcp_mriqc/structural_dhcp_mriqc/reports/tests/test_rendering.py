@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Report rendering tests
+"""
+import os.path as op
+import warnings
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from structural_dhcp_mriqc.reports.rendering import ReportPages, MIN_DPI
+
+
+def _figure(rng):
+    fig = plt.figure(figsize=(6, 6))
+    fig.add_subplot(111).imshow(rng.uniform(size=(600, 600)), interpolation='nearest')
+    return fig
+
+
+def test_report_budget(tmpdir):
+    rng = np.random.RandomState(1234)
+    out_file = str(tmpdir.join('report.pdf'))
+    report = ReportPages(out_file, dpi=150, max_size=1)
+    added = []
+    dpis = []
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        for _ in range(6):
+            fig = _figure(rng)
+            added.append(report.savefig(fig))
+            dpis.append(report.dpi)
+            plt.close(fig)
+        complete = report.close()
+
+    # A page at 150 DPI is about 0.4 MB, at 72 DPI about 0.1 MB: two pages at
+    # 150 DPI, one at 72 DPI, then the pages are skipped
+    assert dpis == [150, 150, MIN_DPI, MIN_DPI, MIN_DPI, MIN_DPI]
+    assert added == [True, True, True, False, False, False]
+    assert report.skipped == 3
+    assert not complete
+    assert len(caught) == 3
+    assert op.getsize(out_file) <= 1 << 20
+
+def test_report_no_budget(tmpdir):
+    rng = np.random.RandomState(1234)
+    report = ReportPages(str(tmpdir.join('report.pdf')), dpi=100, max_size=0)
+    for _ in range(2):
+        fig = _figure(rng)
+        assert report.savefig(fig)
+        plt.close(fig)
+    assert report.close()
+    assert report.dpi == 100
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+dHCP structural pipeline measurements
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+
+from structural_dhcp_mriqc import __version__
+
+
+def _volume(opts):
+    from structural_dhcp_mriqc.measures.volume import volume_measures, write_volume_measures
+    measures = volume_measures(opts.all_labels, opts.tissue_labels,
+                               super_structures=opts.super_structures)
+    write_volume_measures(measures, opts.out_prefix)
+
+
+def _surface(opts):
+    from structural_dhcp_mriqc.measures.surface import (
+        surface_measures, gi_measures, write_surface_measures)
+    if opts.white is None and opts.pial is None:
+        raise RuntimeError('At least one of --white or --pial should be provided')
+    if opts.white is not None:
+        measures = surface_measures(opts.white, opts.outer, opts.cortical,
+                                    super_structures=opts.super_structures)
+        write_surface_measures(measures, opts.out_prefix)
+    if opts.pial is not None:
+        measures = gi_measures(opts.pial, opts.outer, opts.cortical,
+                               super_structures=opts.super_structures)
+        write_surface_measures(measures, opts.out_prefix)
+
+
+def _image_qc(opts):
+    from structural_dhcp_mriqc.measures.image_qc import image_qc_measures, write_image_qc_json
+    measures = image_qc_measures(opts.restore, opts.brain_mask, opts.bias, opts.tissue_labels,
+                                 efc_slab=opts.efc_slab)
+    write_image_qc_json(measures, opts.out_file, opts.subject_id, opts.session_id,
+                        opts.run_id, reorient=opts.reorient)
+
+
+def _gather(opts):
+    from structural_dhcp_mriqc.measures.gather import gather_measures
+    columnar = None if opts.columnar == 'none' else opts.columnar
+    invalid = gather_measures(opts.dataset_csv, opts.work_dir, opts.label_dir,
+                              opts.out_file, columnar=columnar)
+    for subject, session, errors in invalid:
+        print('%s %s: %s' % (subject, session, '; '.join(errors)), file=sys.stderr)
+    if invalid and opts.strict:
+        sys.exit(1)
+
+
+def _cache(opts):
+    import os.path as op
+    from structural_dhcp_mriqc.measures import cache
+    subj = op.basename(op.normpath(opts.subject_dir))
+    manifest = cache.manifest_file(opts.subject_dir, subj)
+    inputs = cache.stage_inputs(opts.stage, opts.anat_dir, subj,
+                                super_structures=opts.super_structures, cortical=opts.cortical)
+    if opts.action == 'check':
+        sys.exit(cache.check_stage(manifest, opts.stage, inputs,
+                                   cache.stage_outputs(opts.stage, opts.subject_dir, subj)))
+    cache.update_stage(manifest, opts.stage, inputs, complete=opts.action == 'finish')
+
+
+def _merge_json(opts):
+    from structural_dhcp_mriqc.measures.qc_json import merge_qc_jsons
+    _, errors = merge_qc_jsons(opts.work_dir, opts.out_dir, dataset_csv=opts.dataset_csv,
+                               nthreads=opts.nthreads)
+    for error in errors:
+        print('Skipped %s' % error, file=sys.stderr)
+
+
+def _run(opts):
+    from structural_dhcp_mriqc.measures.pipeline import run_sessions, print_summary
+    results = run_sessions(opts.dataset_csv, opts.derivatives_dir, opts.scripts_dir,
+                           opts.work_dir, stage=opts.stage, nthreads=opts.nthreads,
+                           retries=opts.retries, log_dir=opts.log_dir)
+    if print_summary(results, log_dir=opts.log_dir) > 0:
+        sys.exit(1)
+
+
+def main():
+    """Entry point"""
+    parser = ArgumentParser(description='dHCP structural pipeline measurements',
+                            formatter_class=RawTextHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version='structural_dhcp_mriqc version ' + __version__)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p_volume = subparsers.add_parser('volume', help='volume-based measurements')
+    p_volume.add_argument('--all-labels', action='store', required=True,
+                          help='drawem_all_labels segmentation')
+    p_volume.add_argument('--tissue-labels', action='store', required=True,
+                          help='drawem_tissue_labels segmentation')
+    p_volume.add_argument('--super-structures', action='store',
+                          help='super-structures definition file')
+    p_volume.add_argument('-o', '--out-prefix', action='store', required=True,
+                          help='prefix of the output files')
+    p_volume.set_defaults(func=_volume)
+
+    p_surface = subparsers.add_parser('surface', help='surface-based measurements')
+    p_surface.add_argument('--white', action='store',
+                           help='merged white surface (thickness, sulc, curvature, drawem)'
+                                ', computes the thickness, sulc, surface area and curvature')
+    p_surface.add_argument('--pial', action='store',
+                           help='merged pial surface (drawem), computes the GI')
+    p_surface.add_argument('--outer', action='store', required=True,
+                           help='merged outer pial surface (drawem)')
+    p_surface.add_argument('--cortical', action='store', required=True,
+                           help='list of cortical labels ($DRAWEMDIR/parameters/cortical.csv)')
+    p_surface.add_argument('--super-structures', action='store',
+                           help='super-structures definition file')
+    p_surface.add_argument('-o', '--out-prefix', action='store', required=True,
+                           help='prefix of the output files')
+    p_surface.set_defaults(func=_surface)
+
+    p_qc = subparsers.add_parser('image-qc', help='image quality measures of a T1w/T2w image')
+    p_qc.add_argument('--restore', action='store', required=True,
+                      help='bias-corrected image (*_restore.nii.gz)')
+    p_qc.add_argument('--brain-mask', action='store', required=True, help='brain mask')
+    p_qc.add_argument('--bias', action='store', required=True, help='bias field')
+    p_qc.add_argument('--tissue-labels', action='store', required=True,
+                      help='drawem_tissue_labels segmentation')
+    p_qc.add_argument('--subject-id', action='store', required=True, help='subject ID')
+    p_qc.add_argument('--session-id', action='store', required=True, help='session ID')
+    p_qc.add_argument('--run-id', action='store', required=True, help='run ID (T1 or T2)')
+    p_qc.add_argument('--reorient', action='store', default='',
+                      help='original image, used for the report mosaics')
+    p_qc.add_argument('--efc-slab', action='store', type=int, default=0,
+                      help='compute the EFC over slabs of this number of slices, '
+                           'with bounded memory (default: 0, whole volume)')
+    p_qc.add_argument('-o', '--out-file', action='store', required=True,
+                      help='output json file')
+    p_qc.set_defaults(func=_image_qc)
+
+    p_gather = subparsers.add_parser('gather', help='gather the measurements of a dataset')
+    p_gather.add_argument('work_dir', action='store',
+                          help='working directory with the measurements of the sessions')
+    p_gather.add_argument('dataset_csv', action='store',
+                          help='dataset CSV: <subjectID>, <sessionID>, <age>')
+    p_gather.add_argument('--label-dir', action='store', required=True,
+                          help='directory with the label names (label_names)')
+    p_gather.add_argument('-o', '--out-file', action='store', required=True,
+                          help='output CSV file')
+    p_gather.add_argument('--columnar', action='store', default='parquet',
+                          choices=['parquet', 'feather', 'none'],
+                          help='format of the columnar copy of the output')
+    p_gather.add_argument('--strict', action='store_true', default=False,
+                          help='exit with an error if a session has missing or '
+                               'malformed measurements')
+    p_gather.set_defaults(func=_gather)
+
+    p_cache = subparsers.add_parser(
+        'cache', help='cache manifest of the measurements of a session',
+        description='check: exits with 0 if the stage is up to date, 10 if its inputs did not\n'
+                    '       change but it did not complete, 3 if its inputs or the code changed\n'
+                    '       (any other status is an error)\n'
+                    'start: records the inputs of the stage, before computing it\n'
+                    'finish: marks the stage as completed',
+        formatter_class=RawTextHelpFormatter)
+    p_cache.add_argument('action', action='store', choices=['check', 'start', 'finish'])
+    p_cache.add_argument('--stage', action='store', required=True, choices=['volume', 'surface'],
+                         help='stage of the measurements')
+    p_cache.add_argument('--subject-dir', action='store', required=True,
+                         help='output directory of the session (sub-<subject>_ses-<session>)')
+    p_cache.add_argument('--anat-dir', action='store', required=True,
+                         help='anat directory of the session in the derivatives')
+    p_cache.add_argument('--super-structures', action='store',
+                         help='super-structures definition file')
+    p_cache.add_argument('--cortical', action='store',
+                         help='list of cortical labels ($DRAWEMDIR/parameters/cortical.csv)')
+    p_cache.set_defaults(func=_cache)
+
+    p_json = subparsers.add_parser('merge-json', help='merge the QC json files of a dataset')
+    p_json.add_argument('work_dir', action='store',
+                        help='working directory with the measurements of the sessions')
+    p_json.add_argument('dataset_csv', action='store', nargs='?',
+                        help='dataset CSV: <subjectID>, <sessionID>, <age> '
+                             '(default: all the sessions in work_dir)')
+    p_json.add_argument('-o', '--out-dir', action='store', required=True,
+                        help='output directory of dhcp-measurements.json(l) '
+                             'and qc-measurements.json(l)')
+    p_json.add_argument('-t', '--nthreads', action='store', type=int, default=1,
+                        help='number of json files read concurrently')
+    p_json.set_defaults(func=_merge_json)
+
+    p_run = subparsers.add_parser('run', help='run the measurement scripts over a dataset')
+    p_run.add_argument('derivatives_dir', action='store',
+                       help='derivatives directory of the structural pipeline')
+    p_run.add_argument('dataset_csv', action='store',
+                       help='dataset CSV: <subjectID>, <sessionID>, <age>')
+    p_run.add_argument('--stage', action='store', choices=['measures', 'qc'],
+                       default='measures', help='measurements to compute')
+    p_run.add_argument('--scripts-dir', action='store', required=True,
+                       help='directory of the measurement scripts')
+    p_run.add_argument('-d', '--work-dir', action='store', required=True,
+                       help='working directory of the scripts')
+    p_run.add_argument('-t', '--nthreads', action='store', type=int, default=1,
+                       help='number of sessions processed concurrently')
+    p_run.add_argument('--retries', action='store', type=int, default=1,
+                       help='number of retries of a failed session')
+    p_run.add_argument('--log-dir', action='store', default='logs',
+                       help='directory of the per-session log files')
+    p_run.set_defaults(func=_run)
+
+    opts = parser.parse_args()
+    opts.func(opts)
+
+
+if __name__ == '__main__':
+    main()
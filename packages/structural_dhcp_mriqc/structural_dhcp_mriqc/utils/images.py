@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Shared access to the NIfTI images read by the QC measures and the reports.
+
+The data of an image is exposed as a read-only, memory-mapped array of the
+requested type (float32 by default, with NaNs replaced by zeros unless
+asked otherwise):
+
+* uncompressed images that already have the requested type (and no scaling)
+  are memory-mapped directly;
+* other images (e.g. ``.nii.gz``) are converted once to an uncompressed
+  NIfTI file in a cache directory, which is then memory-mapped (the
+  conversion reads and writes blocks of slices, it never holds the whole
+  data in memory); images read only once are converted in memory instead
+  (``cache=False``).
+
+The cache is shared by all the processes that read the same image, so that
+their data lives once in the page cache instead of once per process. The
+cache directory is ``$DHCP_MRIQC_IMAGE_CACHE`` (default: a folder of the
+user in the temporary directory). It must be private to the user (mode
+0700), since a cached file is identified by the path, size and modification
+time of its source, and the conversion options, only. The least recently
+used files are removed when the cache exceeds ``$DHCP_MRIQC_IMAGE_CACHE_MAX_GB``
+(default: 20 GB), and the runs over a cohort use a cache of their own,
+removed at the end (see :func:`temporary_image_cache`).
+
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import os.path as op
+import stat
+import shutil
+import getpass
+import hashlib
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+import nibabel as nb
+from nibabel.volumeutils import apply_read_scaling
+
+CACHE_ENV = 'DHCP_MRIQC_IMAGE_CACHE'
+MAX_SIZE_ENV = 'DHCP_MRIQC_IMAGE_CACHE_MAX_GB'
+DEFAULT_MAX_SIZE = 20
+# Maximum number of values of an image converted at once into the cache
+BLOCK_SIZE = 1 << 22
+
+
+def image_cache_dir():
+    """ The directory of the cached images """
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return op.join(tempfile.gettempdir(), 'structural_dhcp_mriqc_images-%s' % user)
+
+
+def _private_dir(cache_dir):
+    """ Creates the cache directory (mode 0700), checks that it is private to the user """
+    if not op.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir, 0o700)
+        except OSError:
+            if not op.isdir(cache_dir):
+                raise
+    dstat = os.lstat(cache_dir)
+    if stat.S_ISLNK(dstat.st_mode) or dstat.st_mode & 0o077 or \
+            (hasattr(os, 'getuid') and dstat.st_uid != os.getuid()):
+        raise RuntimeError('The image cache %s must be a directory of the user with mode 0700 '
+                           '(see $%s)' % (cache_dir, CACHE_ENV))
+    return cache_dir
+
+
+def clear_image_cache():
+    """ Removes the cached images """
+    cache_dir = image_cache_dir()
+    if op.isdir(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+@contextmanager
+def temporary_image_cache():
+    """
+    Runs a block (and the processes it starts) with an image cache of its
+    own, in the image cache directory, which is removed at the end
+    """
+    previous = os.environ.get(CACHE_ENV)
+    cache_dir = tempfile.mkdtemp(prefix='run-', dir=_private_dir(image_cache_dir()))
+    os.environ[CACHE_ENV] = cache_dir
+    try:
+        yield cache_dir
+    finally:
+        if previous is None:
+            del os.environ[CACHE_ENV]
+        else:
+            os.environ[CACHE_ENV] = previous
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _evict(cache_dir, keep=None):
+    """
+    Removes the least recently used images of the cache (but ``keep``) while
+    the cache is larger than ``$DHCP_MRIQC_IMAGE_CACHE_MAX_GB``. The images
+    still mapped by other processes remain readable until they are closed.
+    """
+    max_size = float(os.environ.get(MAX_SIZE_ENV) or DEFAULT_MAX_SIZE) * (1 << 30)
+    files = []
+    for fname in os.listdir(cache_dir):
+        path = op.join(cache_dir, fname)
+        if not fname.endswith('.nii') or fname.endswith('.tmp.nii') or path == keep:
+            continue
+        try:
+            fstat = os.stat(path)
+        except OSError:
+            continue
+        files.append((fstat.st_mtime, fstat.st_size, path))
+    total = sum(f[1] for f in files) + (op.getsize(keep) if keep else 0)
+    for _, size, path in sorted(files):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _cache_file(in_file, dtype, nonnegative, fill_nan):
+    fstat = os.stat(in_file)
+    key = '%s|%d|%r|%s|%d|%d' % (op.abspath(in_file), fstat.st_size, fstat.st_mtime,
+                                 np.dtype(dtype).str, nonnegative, fill_nan)
+    return op.join(image_cache_dir(), hashlib.sha1(key.encode('utf-8')).hexdigest() + '.nii')
+
+
+def _convert(data, dtype, nonnegative, fill_nan):
+    if np.issubdtype(dtype, np.integer):
+        if not np.issubdtype(data.dtype, np.integer):
+            data = np.rint(np.nan_to_num(data))
+        data = data.astype(dtype)
+    else:
+        data = data.astype(dtype, copy=False)
+        if fill_nan:
+            data = np.nan_to_num(data)
+    if nonnegative:
+        if not data.flags.writeable:
+            data = data.copy()
+        data[data < 0] = 0
+    return data
+
+
+def _blocks(nii):
+    """
+    Iterates over blocks of slices (last axis) of the data of an image, with
+    at most ``BLOCK_SIZE`` values each (at least one slice). The file is read
+    sequentially, a compressed file is decompressed once.
+
+    :return: an iterator over tuples with the index of the block and its
+      (scaled) data
+    """
+    proxy = nii.dataobj
+    if not isinstance(proxy, nb.arrayproxy.ArrayProxy) or getattr(proxy, 'order', 'F') != 'F':
+        yield Ellipsis, np.asanyarray(proxy)
+        return
+    shape = proxy.shape
+    slice_size = int(np.prod(shape[:-1]))
+    nslices = max(1, BLOCK_SIZE // slice_size)
+    with nb.openers.ImageOpener(proxy.file_like) as fobj:
+        fobj.seek(proxy.offset)
+        for start in range(0, shape[-1], nslices):
+            count = min(nslices, shape[-1] - start)
+            raw = np.frombuffer(fobj.read(slice_size * count * proxy.dtype.itemsize),
+                                dtype=proxy.dtype)
+            raw = raw.reshape(shape[:-1] + (count,), order='F')
+            yield ((Ellipsis, slice(start, start + count)),
+                   apply_read_scaling(raw, np.asanyarray(proxy.slope), np.asanyarray(proxy.inter)))
+
+
+def _write_cache(nii, out_file, dtype, nonnegative, fill_nan):
+    """
+    Converts an image into an uncompressed NIfTI file, one block of slices
+    at a time (see :func:`_blocks`), so that the whole data of the image is
+    never in memory.
+    """
+    hdr = nb.Nifti1Header.from_header(nii.header)
+    hdr.set_data_dtype(dtype)
+    hdr.set_slope_inter(1, 0)
+    hdr['vox_offset'] = 0
+    shape = nii.shape
+    with open(out_file, 'wb') as ofile:
+        hdr.write_to(ofile)
+        offset = hdr.get_data_offset()
+        ofile.truncate(offset + int(np.prod(shape)) * hdr.get_data_dtype().itemsize)
+    data = np.memmap(out_file, dtype=hdr.get_data_dtype(), mode='r+', offset=offset,
+                     shape=shape, order='F')
+    for index, block in _blocks(nii):
+        data[index] = _convert(block, dtype, nonnegative, fill_nan)
+    data.flush()
+    del data
+
+
+def _is_direct(nii, in_file, dtype, nonnegative, fill_nan):
+    """ Whether the image can be memory-mapped as it is """
+    if in_file.endswith('.gz') or nonnegative:
+        return False
+    slope, inter = nii.dataobj.slope, nii.dataobj.inter
+    if nii.get_data_dtype() != np.dtype(dtype) or slope not in (1, None) or \
+            inter not in (0, None):
+        return False
+    if fill_nan and np.issubdtype(dtype, np.floating):
+        # NaNs should be replaced, check chunk-wise on the memory map
+        data = np.asanyarray(nii.dataobj)
+        for chunk in np.array_split(data.reshape(-1), max(1, data.size // (1 << 22))):
+            if np.isnan(chunk).any():
+                return False
+    return True
+
+
+def load_image(in_file, dtype=np.float32, nonnegative=False, fill_nan=True, cache=True):
+    """
+    Loads an image for reading.
+
+    :param str in_file: the NIfTI image
+    :param dtype: the type of the data (float data is rounded when converted
+      to integer types)
+    :param bool nonnegative: replace negative values with zeros
+    :param bool fill_nan: replace NaNs with zeros (float types)
+    :param bool cache: convert the image into the image cache, otherwise
+      (images read only once) it is converted in memory
+    :return: a tuple with the nibabel image (header and affine of ``in_file``)
+      and the read-only data array
+
+    """
+    nii = nb.load(in_file, mmap='r')
+    if _is_direct(nii, in_file, dtype, nonnegative, fill_nan):
+        return nii, _readonly(np.asanyarray(nii.dataobj))
+    if not cache:
+        return nii, _readonly(_convert(np.asanyarray(nii.dataobj), dtype, nonnegative, fill_nan))
+
+    _private_dir(image_cache_dir())
+    cache_file = _cache_file(in_file, dtype, nonnegative, fill_nan)
+    if op.exists(cache_file):
+        # Marks the image as recently used
+        os.utime(cache_file, None)
+    else:
+        # Written to a temporary file first, concurrent readers only see complete files
+        tmp_file = '%s.%d.tmp.nii' % (cache_file[:-4], os.getpid())
+        try:
+            _write_cache(nii, tmp_file, dtype, nonnegative, fill_nan)
+        except:
+            if op.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        os.rename(tmp_file, cache_file)
+        _evict(op.dirname(cache_file), keep=cache_file)
+
+    data = np.asanyarray(nb.load(cache_file, mmap='r').dataobj)
+    return nii, _readonly(data)
+
+
+def load_data(in_file, dtype=np.float32, nonnegative=False, fill_nan=True, cache=True):
+    """ Loads the (read-only) data of an image, see :func:`load_image` """
+    return load_image(in_file, dtype=dtype, nonnegative=nonnegative, fill_nan=fill_nan,
+                      cache=cache)[1]
+
+
+def _readonly(data):
+    data = data.view()
+    data.flags.writeable = False
+    return data
@@ -26,6 +26,7 @@ from nipype import config as ncfg
 
 from structural_dhcp_mriqc.reports.generators import workflow_report
 from structural_dhcp_mriqc.workflows import core as mwc
+from structural_dhcp_mriqc.utils.images import temporary_image_cache
 from structural_dhcp_mriqc import __version__
 
 
@@ -51,6 +52,9 @@ def main():
                          help='Write workflow graph.')
     g_input.add_argument('--use-plugin', action='store', default=None,
                          help='nipype plugin configuration file')
+    g_input.add_argument('--direct', action='store_true', default=False,
+                         help='run the per-scan steps as plain function calls in a pool of\n'
+                              'processes (--nthreads) instead of a nipype workflow')
 
     g_input.add_argument('--save-memory', action='store_true', default=False,
                          help='Save as much memory as possible')
@@ -59,9 +63,9 @@ def main():
 
 
     g_input.add_argument('--qc-measures', action='store',
-                         help='path to JSON file with qc measures')
+                         help='path to JSON (or JSON-lines) file with qc measures')
     g_input.add_argument('--dhcp-measures', action='store',
-                         help='path to JSON file with dhcp measurements')
+                         help='path to JSON (or JSON-lines) file with dhcp measurements')
 
 
     g_outputs = parser.add_argument_group('Outputs')
@@ -100,6 +104,26 @@ def main():
     if opts.ants_settings:
         settings['ants_settings'] = opts.ants_settings
 
+    dtype='anat'
+    settings['qc_measures'] = opts.qc_measures
+    settings['dhcp_measures'] = opts.dhcp_measures
+
+    # The images converted into the image cache by the run are removed at the end
+    with temporary_image_cache():
+        _run(opts, settings, dtype)
+
+
+def _run(opts, settings, dtype):
+    """ Runs the steps of the scans (nipype workflow or direct) and the group report """
+    if opts.direct:
+        if settings['nthreads'] == 0:
+            settings['nthreads'] = cpu_count()
+        mwc.ms_anat_dhcp_direct(subject_id=opts.subject_id, session_id=opts.session_id,
+                                run_id=opts.run_id, settings=settings)
+        if opts.subject_id is None:
+            workflow_report(dtype, settings)
+        return
+
     log_dir = op.join(settings['work_dir'] + '_log')
     if not op.exists(log_dir):
         os.makedirs(log_dir)
@@ -124,10 +148,6 @@ def main():
             plugin_settings['plugin'] = 'MultiProc'
             plugin_settings['plugin_args'] = {'n_procs': settings['nthreads']}
 
-    dtype='anat'
-    settings['qc_measures'] = opts.qc_measures
-    settings['dhcp_measures'] = opts.dhcp_measures
-
     # if settings['qc_measures'] == None:
     #     workflow = mwc.ms_anat_dhcp(subject_id=opts.subject_id, session_id=opts.session_id,
     #                        run_id=opts.run_id, settings=settings)
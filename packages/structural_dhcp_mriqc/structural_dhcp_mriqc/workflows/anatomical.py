@@ -78,6 +78,27 @@ def anat_qc_workflow_dhcp(name='MRIQC_Anat', settings=None):
 
 
 
+def plot_scan_mosaic(scan):
+    """
+    The steps of :func:`anat_qc_workflow_dhcp` as a plain function: plots the
+    mosaic of a scan (with the defaults of
+    :class:`~structural_dhcp_mriqc.interfaces.viz.PlotMosaic`) into
+    ``<out_dir>/anatomical_<subject>_<session>_<run>.pdf``.
+
+    :param tuple scan: the subject_id, session_id, run_id, image and out_dir
+    :return: the mosaic file
+
+    """
+    from ..interfaces.viz_utils import plot_mosaic
+    from ..reports.rendering import save_figure
+    subject_id, session_id, run_id, in_file, out_dir = scan
+    title = 'Volume, subject %s (%s)' % (subject_id, '_'.join([session_id, run_id]))
+    fig = plot_mosaic(in_file, title=title, figsize=(11.69, 8.27))
+    out_file = op.join(out_dir, 'anatomical_%s_%s_%s.pdf' % (subject_id, session_id, run_id))
+    save_figure(fig, out_file)
+    return out_file
+
+
 def anat_qc_workflow_dhcp1(name='MRIQC_Anat', settings=None):
     """
     One-subject-one-session-one-run pipeline to extract the NR-IQMs from
@@ -9,6 +9,9 @@
 # @Last modified by:   oesteban
 # @Last Modified time: 2016-05-04 14:53:43
 """ The core module combines the existing workflows """
+import os.path as op
+from warnings import warn
+from multiprocessing import Pool, cpu_count
 from six import string_types
 from .anatomical import anat_qc_workflow
 from .functional import fmri_qc_workflow
@@ -26,33 +29,44 @@ def get_vars(list, subject_id, session_id, run_id):
     return list[subject_id+"_"+session_id+"_"+run_id]
 
 from .anatomical import anat_qc_workflow_dhcp
-def ms_anat_dhcp(settings=None, subject_id=None, session_id=None, run_id=None):
-    """ Multi-subject anatomical workflow wrapper """
-    # Run single subject mode if only one subject id is provided
+
+
+def dhcp_scans(settings, subject_id=None, session_id=None, run_id=None):
+    """
+    The scans of the QC measures (``settings['qc_measures']``) selected by
+    subject, session and run.
+
+    :return: a list of tuples (subject_id, session_id, run_id, reorient)
+
+    """
     if subject_id is not None and isinstance(subject_id, string_types):
         subject_id = [subject_id]
 
-    import json
     import pandas as pd
-    with open(settings['qc_measures'], 'r') as jsondata:
-        json_list = json.load(jsondata)
-        sub_list = pd.DataFrame(json_list['data'])
+    from ..measures.qc_json import read_measures
+    sub_list = pd.DataFrame(read_measures(settings['qc_measures']))
 
     if subject_id is not None:
-        sub_list = sub_list.loc[sub_list['subject_id'] == subject_id]
+        sub_list = sub_list.loc[sub_list['subject_id'].isin(subject_id)]
     if session_id is not None:
         sub_list = sub_list.loc[sub_list['session_id'] == session_id]
     if run_id is not None:
         sub_list = sub_list.loc[sub_list['run_id'] == run_id]
 
     if sub_list.empty:
-        raise RuntimeError('No scans found in %s' % settings['dhcp_data'])
+        raise RuntimeError('No scans found in %s' % settings['qc_measures'])
 
+    return [(i['subject_id'], i['session_id'], i['run_id'], i['reorient'])
+            for _, i in sub_list.iterrows()]
+
+
+def ms_anat_dhcp(settings=None, subject_id=None, session_id=None, run_id=None):
+    """ Multi-subject anatomical workflow wrapper """
     data_list = []
     data_list_info = {}
-    for d, i in sub_list.iterrows(): 
-        data_list.append((i['subject_id'], i['session_id'], i['run_id']))
-        data_list_info[i['subject_id']+"_"+i['session_id']+"_"+i['run_id']] = (i['reorient'])
+    for subid, sesid, runid, reorient in dhcp_scans(settings, subject_id, session_id, run_id):
+        data_list.append((subid, sesid, runid))
+        data_list_info[subid + "_" + sesid + "_" + runid] = reorient
 
     inputnode = pe.Node(niu.IdentityInterface(fields=['subject_id', 'session_id', 'run_id']), name='inputnode')
     inputnode.synchronize = True
@@ -75,6 +89,34 @@ def ms_anat_dhcp(settings=None, subject_id=None, session_id=None, run_id=None):
     return workflow
 
 
+def ms_anat_dhcp_direct(settings=None, subject_id=None, session_id=None, run_id=None):
+    """
+    Runs the steps of :func:`ms_anat_dhcp` (the mosaic plot of each scan,
+    renamed and saved into the working directory) as plain function calls in
+    a pool of processes, without the bookkeeping of a nipype workflow.
+
+    :return: the list of mosaic files written
+
+    """
+    from .anatomical import plot_scan_mosaic
+    scans = []
+    for subid, sesid, runid, reorient in dhcp_scans(settings, subject_id, session_id, run_id):
+        if not reorient or not op.exists(reorient):
+            warn('No image to plot for subject %s, session %s, run %s' % (subid, sesid, runid))
+            continue
+        scans.append((subid, sesid, runid, reorient, settings['work_dir']))
+
+    nthreads = min(settings.get('nthreads') or cpu_count(), max(1, len(scans)))
+    if nthreads == 1:
+        return [plot_scan_mosaic(scan) for scan in scans]
+    pool = Pool(nthreads)
+    try:
+        return pool.map(plot_scan_mosaic, scans, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def ms_anat(settings=None, subject_id=None, session_id=None, run_id=None):
     """ Multi-subject anatomical workflow wrapper """
     # Run single subject mode if only one subject id is provided
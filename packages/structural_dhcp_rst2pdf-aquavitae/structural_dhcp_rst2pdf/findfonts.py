@@ -9,6 +9,7 @@ then create structural_dhcp_rst2pdf-ready font-aliases.
 
 import os
 import sys
+import json
 
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import (
@@ -21,6 +22,7 @@ from reportlab.pdfbase.ttfonts import (
 from reportlab.lib.fonts import addMapping
 
 from structural_dhcp_rst2pdf.log import log
+from structural_dhcp_rst2pdf.config import cfdir
 
 flist = []
 afmList = []
@@ -45,55 +47,253 @@ fonts = {}
 families = {}
 fontMappings = {}
 
+# On-disk index of the fonts found in the folders of flist: the font files of
+# each folder, with their size, modification time and what was read from
+# them. A folder is scanned again when its modification time changed, a font
+# file is read again when its size or modification time changed
+indexFile = os.environ.get('STRUCTURAL_DHCP_RST2PDF_FONT_INDEX') or \
+    os.path.join(cfdir, 'fontindex.json')
+INDEX_VERSION = 2
+fontExtensions = ['.ttf', '.ttc', '.afm', '.pfb']
 
-def loadFonts():
+# While journal is a list, the fonts registered with ReportLab and their
+# mappings are recorded in it, in order, so that they can be registered again
+# (see replayFonts) without looking them up
+journal = None
+
+
+def readTTF(ttf):
+    """
+    The family, font name, full name, bold and italic flags of a TrueType
+    font, or None if it can't be read.
+    """
+    try:
+        font = TTFontFile(ttf)
+    except TTFError:
+        return None
+    return [font.familyName.lower().decode(), font.name.decode(),
+            font.fullName.decode(), FF_FORCEBOLD == FF_FORCEBOLD & font.flags,
+            FF_ITALIC == FF_ITALIC & font.flags]
+
+
+def readAFM(afm):
+    """
+    The family, font name, full name, bold and italic flags of a Type 1 font
+    (from its .afm file).
+    """
+    family = None
+    fontName = None
+    fullName = None
+    italic = False
+    bold = False
+    for line in open(afm, 'r'):
+        line = line.strip()
+        if line.startswith('StartCharMetrics'):
+            break
+        elif line.startswith('FamilyName'):
+            family = ' '.join(line.split(' ')[1:]).lower()
+        elif line.startswith('FontName'):
+            fontName = line.split(' ')[1]
+        # TODO: find a way to alias the fullname to this font
+        # so you can use names like "Bitstream Charter Italic"
+        elif line.startswith('FullName'):
+            fullName = ' '.join(line.split(' ')[1:])
+        elif line.startswith('Weight'):
+            w = line.split(' ')[1]
+            if w == 'Bold':
+                bold = True
+        elif line.startswith('ItalicAngle'):
+            if line.split(' ')[1] != '0.0':
+                italic = True
+    return [family, fontName, fullName or fontName, bold, italic]
+
+
+def readIndex():
+    """ The font index (folders), empty if there is none """
+    try:
+        with open(indexFile, 'r') as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if index.get('version') != INDEX_VERSION:
+        return {}
+    return index.get('folders', {})
+
+
+def writeIndex(folders):
+    """ Saves the font index, replacing the file once complete """
+    try:
+        folder = os.path.dirname(indexFile)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmpFile = '%s.%d.tmp' % (indexFile, os.getpid())
+        with open(tmpFile, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'folders': folders}, f)
+        os.rename(tmpFile, indexFile)
+    except (IOError, OSError) as e:
+        log.info('Could not write the font index %s: %s' % (indexFile, e))
+
+
+def fileStat(path):
+    """ The size and modification time of a file, or None if it can't be read """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def scanFolder(folder, index):
+    """
+    The entry of a folder in the index, scanning the folder (and reading its
+    new or modified font files) if it changed since it was indexed.
+
+    Returns the entry, or None if the folder can't be read.
+    """
+    try:
+        mtime = os.stat(folder).st_mtime
+    except OSError:
+        return None
+    entry = index.get(folder)
+    # A font file replaced in place does not change the folder
+    if entry is not None and entry['mtime'] == mtime and \
+            all(fileStat(os.path.join(folder, f)) == [size, fmtime]
+                for f, size, fmtime, _ in entry['files']):
+        return entry
+
+    known = {}
+    if entry is not None:
+        known = dict((f, ([size, fmtime], record))
+                     for f, size, fmtime, record in entry['files'])
+    dirs = []
+    files = []
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return None
+    for f in names:
+        path = os.path.join(folder, f)
+        if os.path.isdir(path):
+            # Like os.walk, symbolic links to folders are not followed
+            if not os.path.islink(path):
+                dirs.append(f)
+            continue
+        ext = os.path.splitext(f)[-1]
+        if ext not in fontExtensions:
+            continue
+        stat = fileStat(path)
+        if stat is None:
+            continue
+        if f in known and known[f][0] == stat:
+            record = known[f][1]
+        elif ext in ['.ttf', '.ttc']:
+            record = readTTF(path)
+        elif ext == '.afm':
+            record = readAFM(path)
+        else:
+            record = None
+        files.append([f] + stat + [record])
+
+    entry = {'mtime': mtime, 'dirs': dirs, 'files': files}
+    index[folder] = entry
+    return entry
+
+
+def walkIndex(root, index):
+    """ The folders under root with their index entries, in os.walk order """
+    entry = scanFolder(root, index)
+    if entry is None:
+        return
+    yield root, entry
+    for d in entry['dirs']:
+        for folder, subentry in walkIndex(os.path.join(root, d), index):
+            yield folder, subentry
+
+
+def updateIndex(roots=None):
+    """
+    Brings the font index of the folders in roots (default: flist) up to
+    date, rescanning only the folders that changed, and saves it.
+
+    Returns the index (folders).
+    """
+    index = readIndex()
+    before = json.dumps(index, sort_keys=True)
+    for root in (flist if roots is None else roots):
+        for _ in walkIndex(os.path.abspath(root), index):
+            pass
+    if json.dumps(index, sort_keys=True) != before:
+        writeIndex(index)
+    return index
+
+
+def prewarmFonts(roots=None):
+    """
+    Builds (or refreshes) the font index of the folders in roots (default:
+    flist), so that new processes find the fonts without scanning them.
+
+    Returns the number of font files indexed.
+    """
+    index = updateIndex(roots)
+    return sum(len(entry['files']) for entry in index.values())
+
+
+def addFont(fontName, fullName, family, bold, italic, files):
+    fonts[fontName.lower()] = files + (family,)
+    fonts[fullName.lower()] = files + (family,)
+    fonts[fullName.lower().replace('italic', 'oblique')] = files + (family,)
+
+    # And we can try to build/fill the family mapping
+    if family not in families:
+        families[family] = [fontName, fontName, fontName, fontName]
+    if bold and italic:
+        families[family][3] = fontName
+    elif bold:
+        families[family][1] = fontName
+    elif italic:
+        families[family][2] = fontName
+    # FIXME: what happens if there are Demi and Medium
+    # weights? We get a random one.
+    else:
+        families[family][0] = fontName
+
+
+def loadFonts(refresh=False):
     """
     Search the system and build lists of available fonts.
+
+    The fonts are read from the font index, where only the folders that
+    changed since they were indexed are scanned again. With refresh, the
+    lists are built again (e.g. after flist changed).
     """
+    if refresh:
+        del afmList[:], ttfList[:]
+        pfbList.clear()
+        fonts.clear()
+        families.clear()
     if not afmList and not pfbList and not ttfList:
         # Find all ".afm" and ".pfb" files files
+        index = updateIndex()
+        records = {}
         for root in flist:
-            for folder, _, names in os.walk(root):
-                for f in names:
+            for folder, entry in walkIndex(os.path.abspath(root), index):
+                for f, _, _, record in entry['files']:
+                    path = os.path.join(folder, f)
                     ext = os.path.splitext(f)[-1]
                     if ext in ['.ttf', '.ttc']:
-                        ttfList.append(os.path.join(folder, f))
+                        ttfList.append(path)
                     if ext == '.afm':
-                        afmList.append(os.path.join(folder, f))
+                        afmList.append(path)
                     if ext == '.pfb':
-                        pfbList[f[:-4]] = os.path.join(folder, f)
+                        pfbList[f[:-4]] = path
+                    records[path] = record
 
         for ttf in ttfList:
             #Find out how to process these
-            try:
-                font = TTFontFile(ttf)
-            except TTFError:
+            if records[ttf] is None:
                 continue
-
-            family = font.familyName.lower().decode()
-            fontName = font.name.decode()
-            baseName = os.path.basename(ttf)[:-4]
-            fullName = font.fullName.decode()
-
-            fonts[fontName.lower()] = (ttf, ttf, family)
-            fonts[fullName.lower()] = (ttf, ttf, family)
-            fonts[fullName.lower().replace('italic', 'oblique')] = (ttf, ttf, family)
-            bold = (FF_FORCEBOLD == FF_FORCEBOLD & font.flags)
-            italic = (FF_ITALIC == FF_ITALIC & font.flags)
-
-            # And we can try to build/fill the family mapping
-            if family not in families:
-                families[family] = [fontName, fontName, fontName, fontName]
-            if bold and italic:
-                families[family][3] = fontName
-            elif bold:
-                families[family][1] = fontName
-            elif italic:
-                families[family][2] = fontName
-            # FIXME: what happens if there are Demi and Medium
-            # weights? We get a random one.
-            else:
-                families[family][0] = fontName
+            family, fontName, fullName, bold, italic = records[ttf]
+            addFont(fontName, fullName, family, bold, italic, (ttf, ttf))
 
         # Now we have full afm and pbf lists, process the
         # afm list to figure out family name, weight and if
@@ -101,30 +301,7 @@ def loadFonts():
         # matching pfb file is
 
         for afm in afmList:
-            family = None
-            fontName = None
-            italic = False
-            bold = False
-            for line in open(afm, 'r'):
-                line = line.strip()
-                if line.startswith('StartCharMetrics'):
-                    break
-                elif line.startswith('FamilyName'):
-                    family = ' '.join(line.split(' ')[1:]).lower()
-                elif line.startswith('FontName'):
-                    fontName = line.split(' ')[1]
-                # TODO: find a way to alias the fullname to this font
-                # so you can use names like "Bitstream Charter Italic"
-                elif line.startswith('FullName'):
-                    fullName = ' '.join(line.split(' ')[1:])
-                elif line.startswith('Weight'):
-                    w = line.split(' ')[1]
-                    if w == 'Bold':
-                        bold = True
-                elif line.startswith('ItalicAngle'):
-                    if line.split(' ')[1] != '0.0':
-                        italic = True
-
+            family, fontName, fullName, bold, italic = records[afm]
             baseName = os.path.basename(afm)[:-4]
             if family in Ignored:
                 continue
@@ -135,24 +312,7 @@ def loadFonts():
                 continue
 
             # So now we have a font we know we can embed.
-            fonts[fontName.lower()] = (afm, pfbList[baseName], family)
-            fonts[fullName.lower()] = (afm, pfbList[baseName], family)
-            fonts[fullName.lower().replace('italic', 'oblique')] = \
-                (afm, pfbList[baseName], family)
-
-            # And we can try to build/fill the family mapping
-            if family not in families:
-                families[family] = [fontName, fontName, fontName, fontName]
-            if bold and italic:
-                families[family][3] = fontName
-            elif bold:
-                families[family][1] = fontName
-            elif italic:
-                families[family][2] = fontName
-            # FIXME: what happens if there are Demi and Medium
-            # weights? We get a random one.
-            else:
-                families[family][0] = fontName
+            addFont(fontName, fullName, family, bold, italic, (afm, pfbList[baseName]))
 
 
 def findFont(fname):
@@ -268,6 +428,59 @@ def findTTFont(fname):
         return variants
 
 
+def _record(*operation):
+    if journal is not None:
+        journal.append(operation)
+
+
+def registerTTFont(name, filename):
+    """ Registers a TrueType font with ReportLab """
+    pdfmetrics.registerFont(TTFont(name, filename))
+    _record('ttf', name, filename)
+
+
+def registerType1Font(name, afm, pfb):
+    """ Registers a Type 1 font (its .afm and .pfb files) with ReportLab """
+    face = pdfmetrics.EmbeddedType1Face(afm, pfb)
+    pdfmetrics.registerTypeFace(face)
+    font = pdfmetrics.Font(face, name, "WinAnsiEncoding")
+    log.info('Registering font: %s from %s' % (face, name))
+    pdfmetrics.registerFont(font)
+    _record('type1', name, afm, pfb)
+
+
+def mapFamily(face, regular, italic, bold, bolditalic):
+    """ Maps the variants of a font family (see reportlab.lib.fonts.addMapping) """
+    addMapping(face, 0, 0, regular)
+    addMapping(face, 0, 1, italic)
+    addMapping(face, 1, 0, bold)
+    addMapping(face, 1, 1, bolditalic)
+    _record('family', face, regular, italic, bold, bolditalic)
+
+
+def replayFonts(operations):
+    """
+    Registers the fonts of a journal again, the fonts already registered
+    with ReportLab are kept.
+
+    Raises an exception if a font file can't be read anymore.
+    """
+    for operation in operations:
+        if operation[0] == 'family':
+            mapFamily(*operation[1:])
+        elif operation[0] == 'ttf':
+            if operation[1] in pdfmetrics._fonts:
+                _record(*operation)
+            else:
+                registerTTFont(*operation[1:])
+        else:
+            # Type 1 fonts are found by the name of their face
+            if operation[1] in pdfmetrics._typefaces:
+                _record(*operation)
+            else:
+                registerType1Font(*operation[1:])
+
+
 def autoEmbed(fname):
     """
     Given a font name, do a best-effort of embedding the font and its variants.
@@ -283,27 +496,14 @@ def autoEmbed(fname):
             family = families[font[2]]
 
             # Register the whole family of faces
-            faces = [pdfmetrics.EmbeddedType1Face(*fonts[fn.lower()][:2])
-                     for fn in family]
-            for face in faces:
-                pdfmetrics.registerTypeFace(face)
-
-            for face, name in zip(faces, family):
+            for name in family:
                 fontList.append(name)
-                font = pdfmetrics.Font(face, name, "WinAnsiEncoding")
-                log.info('Registering font: %s from %s' % (face, name))
-                pdfmetrics.registerFont(font)
+                registerType1Font(name, *fonts[name.lower()][:2])
 
             # Map the variants
             regular, italic, bold, bolditalic = family
-            addMapping(fname, 0, 0, regular)
-            addMapping(fname, 0, 1, italic)
-            addMapping(fname, 1, 0, bold)
-            addMapping(fname, 1, 1, bolditalic)
-            addMapping(regular, 0, 0, regular)
-            addMapping(regular, 0, 1, italic)
-            addMapping(regular, 1, 0, bold)
-            addMapping(regular, 1, 1, bolditalic)
+            mapFamily(fname, regular, italic, bold, bolditalic)
+            mapFamily(regular, regular, italic, bold, bolditalic)
             log.info('Embedding as %s' % fontList)
             return fontList
         else:  # A TTF font
@@ -316,19 +516,17 @@ def autoEmbed(fname):
             vname = os.path.basename(variant)[:-4]
             try:
                 if vname not in pdfmetrics._fonts:
-                    _font = TTFont(vname, variant)
                     log.info('Registering font: %s from %s' % (vname, variant))
-                    pdfmetrics.registerFont(_font)
+                    registerTTFont(vname, variant)
+                else:
+                    _record('ttf', vname, variant)
             except TTFError:
                 log.error('Error registering font: %s from %s' % (vname, variant))
             else:
                 fontList.append(vname)
         regular, bold, italic, bolditalic = [
             os.path.basename(variant)[:-4] for variant in variants]
-        addMapping(regular, 0, 0, regular)
-        addMapping(regular, 0, 1, italic)
-        addMapping(regular, 1, 0, bold)
-        addMapping(regular, 1, 1, bolditalic)
+        mapFamily(regular, regular, italic, bold, bolditalic)
         log.info('Embedding via findTTFont as %s' % fontList)
     return fontList
 
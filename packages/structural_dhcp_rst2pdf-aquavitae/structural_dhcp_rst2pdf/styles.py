@@ -6,7 +6,9 @@
 
 import collections
 import copy
+import hashlib
 import os
+import pickle
 import re
 import sys
 
@@ -22,10 +24,8 @@ import reportlab.lib.units as units
 # from reportlab.platypus import *
 
 # from reportlab.lib.enums import *
-from reportlab.lib.fonts import addMapping
 from reportlab.lib.styles import StyleSheet1, getSampleStyleSheet
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 
 import reportlab.lib.pagesizes as pagesizes
 import reportlab.rl_config
@@ -33,6 +33,7 @@ import reportlab.rl_config
 from rson import loads as rson_loads
 
 from structural_dhcp_rst2pdf import findfonts
+from structural_dhcp_rst2pdf.config import cfdir
 from structural_dhcp_rst2pdf.log import log
 
 from structural_dhcp_rst2pdf.opt_imports import ParagraphStyle, wordaxe, wordaxe_version
@@ -41,6 +42,15 @@ HAS_WORDAXE = wordaxe is not None
 
 unit_separator = re.compile(r'(-?[0-9.]*)')
 
+# Compiled stylesheets: the merged and resolved StyleSheet of a list of
+# stylesheets (and the fonts it registered), pickled in a file named after a
+# hash of the contents of the stylesheets, the font path and the DPI
+cacheDir = os.environ.get('STRUCTURAL_DHCP_RST2PDF_STYLE_CACHE') or \
+    os.path.join(cfdir, 'stylecache')
+CACHE_VERSION = 1
+# The compiled stylesheets loaded or written by this process, by key
+_compiled = {}
+
 
 class StyleSheet(object):
 
@@ -87,7 +97,8 @@ class StyleSheet(object):
                 name = names.pop()
                 yield name, styles[name]
 
-    def __init__(self, flist, font_path=None, style_path=None, def_dpi=300):
+    def __init__(self, flist, font_path=None, style_path=None, def_dpi=300,
+                 cache=True):
         log.info('Using stylesheets: %s' % ','.join(flist))
         # find base path
         if hasattr(sys, 'frozen'):
@@ -142,8 +153,34 @@ class StyleSheet(object):
 
         self.languages = []
 
-        ssdata = self.readSheets(flist)
+        # Load the compiled stylesheets if they are in the cache, otherwise
+        # compile them, recording the fonts that are registered
+        ssnames = list(flist)
+        key = self.cacheKey(ssnames) if cache else None
+        if key is None or not self.loadCompiled(key):
+            ssdata = self.readSheets(flist)
+            journal = findfonts.journal
+            findfonts.journal = []
+            try:
+                self.compileSheets(ssdata)
+            finally:
+                fonts, findfonts.journal = findfonts.journal, journal
+            if journal is not None:
+                journal.extend(fonts)
+            if key is not None:
+                self.saveCompiled(key, ssnames + [n for _, n in ssdata], fonts)
 
+        self.emsize = self['base'].fontSize
+        # Make stdFont the basefont, for Issue 65
+        reportlab.rl_config.canvas_basefontname = self['base'].fontName
+        # Make stdFont the default font for table cell styles (Issue 65)
+        reportlab.platypus.tables.CellStyle.fontname = self['base'].fontName
+
+    def compileSheets(self, ssdata):
+        """
+        Merges the stylesheets read by readSheets, resolving the units,
+        colors and fonts of their styles, and registers the fonts.
+        """
         # Get pageSetup data from all stylessheets in order:
         self.ps = pagesizes.A4
         self.page = {}
@@ -282,8 +319,8 @@ class StyleSheet(object):
                     if font[0].lower().endswith('.ttf'):  # A True Type font
                         for variant in font:
                             location = self.findFont(variant)
-                            pdfmetrics.registerFont(
-                                TTFont(str(variant.split('.')[0]), location))
+                            findfonts.registerTTFont(
+                                str(variant.split('.')[0]), location)
                             log.info('Registering font: %s from %s' %
                                      (str(variant.split('.')[0]), location))
                             self.embedded.append(str(variant.split('.')[0]))
@@ -291,10 +328,8 @@ class StyleSheet(object):
                         # And map them all together
                         regular, bold, italic, bolditalic = [
                             variant.split('.')[0] for variant in font]
-                        addMapping(regular, 0, 0, regular)
-                        addMapping(regular, 0, 1, italic)
-                        addMapping(regular, 1, 0, bold)
-                        addMapping(regular, 1, 1, bolditalic)
+                        findfonts.mapFamily(regular, regular, italic, bold,
+                                            bolditalic)
                     else:  # A Type 1 font
                         # For type 1 fonts we require
                         # [FontName,regular,italic,bold,bolditalic]
@@ -540,11 +575,108 @@ class StyleSheet(object):
 
             self.StyleSheet.add(ParagraphStyle(**s))
 
-        self.emsize = self['base'].fontSize
-        # Make stdFont the basefont, for Issue 65
-        reportlab.rl_config.canvas_basefontname = self['base'].fontName
-        # Make stdFont the default font for table cell styles (Issue 65)
-        reportlab.platypus.tables.CellStyle.fontname = self['base'].fontName
+    def sheetDigest(self, ssname):
+        """
+        A hash of the contents of a stylesheet, '' if it can't be found or
+        None if it can't be hashed (a callable other than a
+        CallableStyleSheet).
+        """
+        if isinstance(ssname, CallableStyleSheet):
+            data = ssname.value.encode('utf-8')
+        elif callable(ssname):
+            return None
+        else:
+            fname = self.findStyle(ssname, quiet=True)
+            if fname is None:
+                return ''
+            try:
+                with open(fname, 'rb') as f:
+                    data = f.read()
+            except IOError:
+                return ''
+        return hashlib.sha1(data).hexdigest()
+
+    def cacheKey(self, flist):
+        """
+        The key of the compiled stylesheets of flist (see loadCompiled),
+        or None if they can't be cached.
+        """
+        digests = [self.sheetDigest(ssname) for ssname in flist]
+        if None in digests:
+            return None
+        key = hashlib.sha1()
+        for item in ([CACHE_VERSION, reportlab.Version, HAS_WORDAXE,
+                      '%d.%d' % sys.version_info[:2], self.def_dpi] +
+                     sorted(self.FontSearchPath) + digests):
+            key.update(('%s\0' % item).encode('utf-8'))
+        return key.hexdigest()
+
+    def loadCompiled(self, key):
+        """
+        Restores the compiled stylesheets of a key and registers their
+        fonts again.
+
+        Returns False if they are not in the cache, or if a stylesheet
+        (included or not) or a font file changed since they were compiled.
+        """
+        data = _compiled.get(key)
+        if data is None:
+            try:
+                with open(os.path.join(cacheDir, key + '.pickle'), 'rb') as f:
+                    data = f.read()
+            except (IOError, OSError):
+                return False
+        try:
+            compiled = pickle.loads(data)
+            for ssname, digest in compiled['sheets']:
+                if self.sheetDigest(ssname) != digest:
+                    return False
+            findfonts.replayFonts(compiled['fonts'])
+        except Exception as e:
+            log.info('Could not load the compiled stylesheets %s: %s' %
+                     (key, str(e)))
+            return False
+        _compiled[key] = data
+        for ssname, digest in compiled['sheets']:
+            if not digest:
+                log.warning("Can't find stylesheet %s" % ssname)
+        # The search paths and DPI are those given
+        state = dict(compiled['state'])
+        for name in ['PATH', 'FontSearchPath', 'StyleSearchPath', 'def_dpi']:
+            del state[name]
+        self.__dict__.update(state)
+        log.info('Loaded the compiled stylesheets %s' % key)
+        return True
+
+    def saveCompiled(self, key, ssnames, fonts):
+        """
+        Saves the compiled stylesheets (the state of this StyleSheet, which
+        must not have been used yet) with the stylesheets they were compiled
+        from and the fonts they registered, replacing the file once complete.
+        """
+        sheets = []
+        for ssname in ssnames:
+            if not callable(ssname) and ssname not in dict(sheets):
+                sheets.append((ssname, self.sheetDigest(ssname)))
+        try:
+            data = pickle.dumps({'sheets': sheets, 'fonts': fonts,
+                                 'state': self.__dict__},
+                                pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            log.info('Could not compile the stylesheets: %s' % str(e))
+            return
+        _compiled[key] = data
+        try:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            fname = os.path.join(cacheDir, key + '.pickle')
+            tmpFile = '%s.%d.tmp' % (fname, os.getpid())
+            with open(tmpFile, 'wb') as f:
+                f.write(data)
+            os.rename(tmpFile, fname)
+        except (IOError, OSError) as e:
+            log.info('Could not write the compiled stylesheets %s: %s' %
+                     (key, str(e)))
 
     def __getitem__(self, key):
         """
@@ -616,12 +748,13 @@ class StyleSheet(object):
                 log.critical('Error opening stylesheet "%s": %s' %
                              (fname, str(e)))
 
-    def findStyle(self, fn):
+    def findStyle(self, fn, quiet=False):
         """
         Find the absolute file name for a given style filename.
 
         Given a style filename, searches for it in StyleSearchPath
-        and returns the real file name.
+        and returns the real file name (with quiet, without warning
+        if it can't be found).
         """
         def innerFind(path, fn):
             if os.path.isabs(fn):
@@ -637,7 +770,7 @@ class StyleSheet(object):
             result = innerFind(self.StyleSearchPath, fn + ext)
             if result:
                 break
-        if result is None:
+        if result is None and not quiet:
             log.warning("Can't find stylesheet %s" % fn)
         return result
 
@@ -69,13 +69,7 @@ mkdir -p $workdir logs/
 ################ MEASURES PIPELINE ################
 
 echo "computing volume/surface measurements of subjects..."
-while IFS= read -r line || [ -n "$line" ]; do
-  s=`echo $line | cut -d',' -f1 | sed -e 's:sub-::g' |sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  e=`echo $line | cut -d',' -f2 | sed -e 's:ses-::g' |sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  a=`echo $line | cut -d',' -f3 | sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  echo "$s $e"
-  $scriptdir/compute-measurements.sh $s $e $derivatives_dir/sub-$s/ses-$e/anat -d $workdir > logs/$s-$e-measures.log 2> logs/$s-$e-measures.err
-done < $dataset_csv
+structural_dhcp_measures run $derivatives_dir $dataset_csv --stage measures --scripts-dir $scriptdir -d $workdir -t $threads --log-dir logs
 echo ""
 
 
@@ -85,42 +79,7 @@ echo "gathering volume/surface measurements of subjects..."
 measfile=$reportsdir/pipeline_all_measures.csv
 rm -f $measfile
 
-# measures
-stats="volume volume-tissue-regions rel-volume-tissue-regions volume-all-regions rel-volume-all-regions thickness thickness-regions sulc sulc-regions curvature curvature-regions GI GI-regions surface-area surface-area-regions rel-surface-area-regions"
-typeset -A name
-
-# header
-lbldir=$scriptdir/../label_names
-header="subject ID, session ID, age at scan"
-for c in ${stats};do
-  if [[ $c == *"tissue-regions"* ]];then labels=$lbldir/tissue_labels.csv 
-  elif [[ $c == *"all-regions"* ]];then labels=$lbldir/all_labels.csv
-  elif [[ $c == *"regions"* ]];then labels=$lbldir/cortical_labels.csv 
-  else labels=""; fi
-  cname=`echo $c | sed -e 's:-tissue-regions::g'| sed -e 's:-all-regions::g'| sed -e 's:-regions::g'`
-  if [ "$labels" == "" ];then header="$header,$cname";
-  else
-    while read l;do 
-      sname=`echo "$l"|cut -f2|sed -e 's:,::g'`;
-      header="$header,$cname - $sname";
-    done < $labels
-  fi
-done
-
-# measurements
-echo "$header"> $measfile
-while IFS= read -r line || [ -n "$line" ]; do
-  s=`echo $line | cut -d',' -f1 | sed -e 's:sub-::g' |sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  e=`echo $line | cut -d',' -f2 | sed -e 's:ses-::g' |sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  a=`echo $line | cut -d',' -f3 | sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  subj="sub-${s}_ses-$e"
-  line="$s,$e,$a"
-  for c in ${stats};do
-    line="$line,"`cat $workdir/$subj/$subj-$c |sed -e 's: :,:g' `
-  done
-  echo "$line" |sed -e 's: :,:g' >> $measfile
-done < $dataset_csv
-
+structural_dhcp_measures gather $workdir $dataset_csv --label-dir $scriptdir/../label_names -o $measfile
 
 echo "completed volume/surface measurements"
 
@@ -133,39 +92,16 @@ echo "----------------------------
 "
 
 echo "computing QC measurements for subjects..."
-
-subjs=""
-while IFS= read -r line || [ -n "$line" ]; do
-  s=`echo $line | cut -d',' -f1 | sed -e 's:sub-::g' |sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  e=`echo $line | cut -d',' -f2 | sed -e 's:ses-::g' |sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  a=`echo $line | cut -d',' -f3 | sed 's/[[:blank:]]*$//' | sed 's/^[[:blank:]]*//' `
-  subj="sub-${s}_ses-$e"
-  echo "$s $e"
-  $scriptdir/compute-QC-measurements.sh $s $e $a $derivatives_dir/sub-$s/ses-$e/anat -d $workdir >> logs/$s-$e-measures.log 2>> logs/$s-$e-measures.err
-  subjs="$subjs $subj"
-done < $dataset_csv
+structural_dhcp_measures run $derivatives_dir $dataset_csv --stage qc --scripts-dir $scriptdir -d $workdir -t $threads --log-dir logs
 echo ""
 
 # gather measures
 echo "gathering QC measurements of subjects..."
-
-for json in dhcp-measurements.json qc-measurements.json;do
-  echo "{\"data\":[" > $reportsdir/$json
-  first=1
-  for subj in ${subjs};do
-    files=`ls $workdir/$subj/*$json`
-    for f in ${files};do 
-      line=`cat $f`
-      if [ $first -eq 1 ];then first=0; else line=",$line";fi
-      echo $line >> $reportsdir/$json
-    done
-  done
-  echo "]}" >> $reportsdir/$json
-done
+structural_dhcp_measures merge-json $workdir $dataset_csv -o $reportsdir -t $threads
 
 # create reports
 echo "creating QC reports..."
-structural_dhcp_mriqc -o $reportsdir -w $workdir --dhcp-measures $reportsdir/dhcp-measurements.json --qc-measures $reportsdir/qc-measurements.json --nthreads $threads >> logs/$s-$e-measures.log 2>> logs/$s-$e-measures.err
+structural_dhcp_mriqc -o $reportsdir -w $workdir --dhcp-measures $reportsdir/dhcp-measurements.jsonl --qc-measures $reportsdir/qc-measurements.jsonl --nthreads $threads >> logs/reports.log 2>> logs/reports.err
 
 
 echo "copying reports..."
@@ -14,6 +14,7 @@ Arguments:
 
 Options:
   -d / -data-dir  <directory>   The directory used to run the script and output the files. 
+  -efc-slab  <number>           Compute the EFC over slabs of <number> slices, with bounded memory (default: 0, whole volume)
   -h / -help / --help           Print usage.
 "
   exit;
@@ -37,12 +38,14 @@ age=$3
 anatDir=$4
 
 datadir=`pwd`
+efcslab=0
 scriptdir="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 
 shift; shift; shift; shift;
 while [ $# -gt 0 ]; do
   case "$1" in
     -d|-data-dir)  shift; datadir=$1; ;;
+    -efc-slab)  shift; efcslab=$1; ;;
     -h|-help|--help) usage; ;;
     -*) echo "$0: Unrecognized option $1" >&2; usage; ;;
      *) break ;;
@@ -55,7 +58,7 @@ cd $datadir
 
 subj=sub-${subjectID}_ses-${sessionID}
 outdir=$subj
-mkdir -p $outdir/temp logs
+mkdir -p $outdir logs
 
 
 rage=`printf "%.*f\n" 0 $age`
@@ -64,30 +67,10 @@ if [ -f $anatDir/${subj}_T1w.nii.gz  ];then T1ex="True"; else T1ex="False"; fi
 
 if [ ! -f $outdir/dhcp-measurements.json ];then 
 
-    # prepare files
-    if [ -f $anatDir/${subj}_T2w.nii.gz -o -f $anatDir/${subj}_T1w.nii.gz ];then
-      run mirtk padding $anatDir/${subj}_drawem_tissue_labels.nii.gz $anatDir/${subj}_drawem_tissue_labels.nii.gz $outdir/temp/tissue_labels.nii.gz 1 0 -1 1 4 0
-      #masks
-      thr=0
-      for t in "bg" csf gm wm;do 
-        if [ "$t" == "bg" ];then 
-          run fslmaths $outdir/temp/tissue_labels.nii.gz -add 1 -thr 1 -uthr 1 -bin $outdir/temp/${t}_mask.nii.gz
-        else
-          run fslmaths $outdir/temp/tissue_labels.nii.gz -thr $thr -uthr $thr -bin $outdir/temp/${t}_mask.nii.gz
-        fi
-        run mirtk erode-image $outdir/temp/${t}_mask.nii.gz $outdir/temp/${t}_mask_open.nii.gz -connectivity 18 > /dev/null 2>&1 
-        run mirtk dilate-image $outdir/temp/${t}_mask_open.nii.gz $outdir/temp/${t}_mask_open.nii.gz -connectivity 18 > /dev/null 2>&1 
-        let thr=$thr+1
-      done
-    fi
-
     # T2 QC measures
     if [ -f $anatDir/${subj}_T2w.nii.gz ];then
       if [ ! -f $outdir/T2-qc-measurements.json ];then 
-        cp $anatDir/${subj}_T2w_biasfield.nii.gz $outdir/temp/T2_bias.nii.gz
-        run mirtk convert-image $anatDir/${subj}_T2w_restore.nii.gz $outdir/temp/T2.nii.gz -rescale 0 1000
-        run fslmaths $outdir/temp/T2.nii.gz -mul $anatDir/${subj}_brainmask_bet.nii.gz $outdir/temp/T2_restore_brain.nii.gz
-        $scriptdir/image-QC-measurements.sh $outdir/temp T2 $subjectID $sessionID $anatDir/${subj}_T2w.nii.gz $outdir/T2-qc-measurements.json
+        run structural_dhcp_measures image-qc --restore $anatDir/${subj}_T2w_restore.nii.gz --brain-mask $anatDir/${subj}_brainmask_bet.nii.gz --bias $anatDir/${subj}_T2w_biasfield.nii.gz --tissue-labels $anatDir/${subj}_drawem_tissue_labels.nii.gz --subject-id $subjectID --session-id $sessionID --run-id T2 --reorient $anatDir/${subj}_T2w.nii.gz --efc-slab $efcslab -o $outdir/T2-qc-measurements.json
       fi
     else
       echo "{\"subject_id\":\"$subjectID\", \"session_id\":\"$sessionID\", \"run_id\":\"T2\", \"exists\":\"$T2ex\", \"reorient\":\"\" }" > $outdir/T2-qc-measurements.json
@@ -97,10 +80,7 @@ if [ ! -f $outdir/dhcp-measurements.json ];then
     # T1 QC measures
     if [ -f $anatDir/${subj}_T1w.nii.gz ];then
       if [ ! -f $outdir/T1-qc-measurements.json ];then 
-        cp $anatDir/${subj}_T1w_biasfield.nii.gz $outdir/temp/T1_bias.nii.gz
-        run mirtk convert-image $anatDir/${subj}_T1w_restore.nii.gz $outdir/temp/T1.nii.gz -rescale 0 1000
-        run fslmaths $outdir/temp/T1.nii.gz -mul $anatDir/${subj}_brainmask_bet.nii.gz $outdir/temp/T1_restore_brain.nii.gz
-        $scriptdir/image-QC-measurements.sh $outdir/temp T1 $subjectID $sessionID $anatDir/${subj}_T1w.nii.gz $outdir/T1-qc-measurements.json
+        run structural_dhcp_measures image-qc --restore $anatDir/${subj}_T1w_restore.nii.gz --brain-mask $anatDir/${subj}_brainmask_bet.nii.gz --bias $anatDir/${subj}_T1w_biasfield.nii.gz --tissue-labels $anatDir/${subj}_drawem_tissue_labels.nii.gz --subject-id $subjectID --session-id $sessionID --run-id T1 --reorient $anatDir/${subj}_T1w.nii.gz --efc-slab $efcslab -o $outdir/T1-qc-measurements.json
       fi
     else
       echo "{\"subject_id\":\"$subjectID\", \"session_id\":\"$sessionID\", \"run_id\":\"T1\", \"exists\":\"$T1ex\", \"reorient\":\"\" }" > $outdir/T1-qc-measurements.json
@@ -157,4 +137,3 @@ if [ ! -f $outdir/dhcp-measurements.json ];then
     echo $line > $outdir/dhcp-measurements.json
 fi
 
-rm -r $outdir/temp
\ No newline at end of file
@@ -68,14 +68,34 @@ scriptdir="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 # do the volume-based measurements
 super_structures=$scriptdir/../label_names/super-structures.csv
 
-if [ ! -f $subj/$subj-rel-volume-all-regions ];then 
+# each stage is recomputed only when its inputs (or the code) changed, or when
+# its outputs are missing (see structural_dhcp_mriqc.measures.cache)
+cache_volume="--stage volume --subject-dir $subj --anat-dir $anatDir --super-structures $super_structures"
+structural_dhcp_measures cache check $cache_volume
+if [ ! $? -eq 0 ];then 
+  run structural_dhcp_measures cache start $cache_volume
   run $scriptdir/volume-measurements.sh $subj $anatDir $subj/$subj $super_structures
+  run structural_dhcp_measures cache finish $cache_volume
 fi
 
-if [ ! -f $subj/$subj-curvature-regions ];then 
+if [ -n "$DRAWEMDIR" ]; then
+  [ -d "$DRAWEMDIR" ] || { echo "DRAWEMDIR environment variable invalid!" 1>&2; exit 1; }
+else
+  echo "DRAWEMDIR environment variable not set!" 1>&2; exit 1;
+fi
+
+cache_surface="--stage surface --subject-dir $subj --anat-dir $anatDir --super-structures $super_structures --cortical $DRAWEMDIR/parameters/cortical.csv"
+structural_dhcp_measures cache check $cache_surface
+status=$?
+if [ ! $status -eq 0 ];then 
   if [ ! -f $surfdir/${subj}_left_white.surf.gii ];then echo "The left WM surface for subject $subj doesn't exist"; exit;fi
   if [ ! -f $surfdir/${subj}_right_white.surf.gii ];then echo "The right WM surface for subject $subj doesn't exist"; exit;fi
 
+  # the intermediate surfaces of a previous (failed) run are reused only if the inputs did not
+  # change (status 10), any other status (changed inputs or an error) removes them
+  if [ ! $status -eq 10 ];then rm -f $rdir/${subj}_*; fi
+  run structural_dhcp_measures cache start $cache_surface
+
   # gather all measurements into a single file
   if [ ! -f $rdir/${subj}_white.surf.vtk ];then
     for h in left right;do
@@ -128,11 +148,11 @@ if [ ! -f $subj/$subj-curvature-regions ];then
     run rm $rdir/${subj}_left_outerpial.surf.vtk $rdir/${subj}_right_outerpial.surf.vtk $rdir/${subj}_left_pial.surf.vtk $rdir/${subj}_right_pial.surf.vtk
   fi
 
-  # measure GI
-  run $scriptdir/GI-measurements.sh $rdir/${subj}_pial.surf.vtk $rdir/${subj}_outerpial.surf.vtk $subj/$subj $super_structures
+  # measure GI and do the surface-based measurements (convex-hull norm),
+  # reading each surface once (same as GI-measurements.sh and surface-measurements.sh)
+  run structural_dhcp_measures surface --white $rdir/${subj}_white.surf.vtk --pial $rdir/${subj}_pial.surf.vtk --outer $rdir/${subj}_outerpial.surf.vtk --cortical $DRAWEMDIR/parameters/cortical.csv --super-structures $super_structures -o $subj/$subj
 
-  # do the surface-based measurements (convex-hull norm)
-  run $scriptdir/surface-measurements.sh $rdir/${subj}_white.surf.vtk $rdir/${subj}_outerpial.surf.vtk $subj/$subj $super_structures
+  run structural_dhcp_measures cache finish $cache_surface
 
   #clean-up
   rm $rdir/${subj}_*